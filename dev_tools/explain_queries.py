@@ -0,0 +1,56 @@
+"""
+Runs EXPLAIN QUERY PLAN over the application's canonical queries and reports the
+full table/index scans
+usage: python dev_tools/explain_queries.py [path to manga_db.sqlite or .sql dump] [-v]
+(defaults to the DB used by the tests)
+the DB is copied first since the workload modifies it (delete_tag etc.)
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+
+MODULE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+sys.path.insert(0, os.path.realpath(os.path.join(MODULE_DIR, '..')))
+sys.path.insert(0, os.path.realpath(os.path.join(MODULE_DIR, '..', 'tests')))
+
+from manga_db.manga_db import MangaDB
+from manga_db.db.query_plans import explain_workload
+
+from utils import load_db_from_sql_file
+
+
+args = [arg for arg in sys.argv[1:] if arg != "-v"]
+verbose = "-v" in sys.argv[1:]
+db_path = args[0] if args else os.path.join(
+    MODULE_DIR, '..', 'tests', 'all_test_files', 'manga_db.sqlite.sql')
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    copy_path = os.path.join(tmpdir, "manga_db.sqlite")
+    if db_path.endswith(".sql"):
+        load_db_from_sql_file(db_path, copy_path).close()
+    else:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(copy_path)
+        src.backup(dst)
+        src.close()
+        dst.close()
+
+    # search using SQL instead of the in-memory posting lists
+    mdb = MangaDB(tmpdir, copy_path, settings={"posting_lists": False})
+    plans = explain_workload(mdb)
+    mdb.close()
+
+nr_scans = 0
+for plan in plans:
+    scans = plan.scans
+    nr_scans += bool(scans)
+    if not scans and not verbose:
+        continue
+    print(f"{'SCAN' if scans else 'OK'}  {plan.name}")
+    print("    " + " ".join(plan.sql.split()))
+    for step in plan.plan:
+        print(f"      {'!' if step in scans else ' '} {step}")
+
+print(f"\n{nr_scans} of {len(plans)} statements scan a table or index")
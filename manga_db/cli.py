@@ -140,13 +140,13 @@ def _cl_webgui(args: argparse.Namespace, instance_path: Optional[str] = None) ->
     # use terminal environment vars to set debug etc.
     # windows: set FLASK_ENV=development -> enables debug or set FLASK_DEBUG=1
     app = create_app(instance_path=instance_path)
-    # use threaded=False so we can leverage MangaDB's id_map
-    # also makes sense since we only want to support one user (at least with write access)
+    # requests are served from multiple threads using a pool of read-only MangaDBs and
+    # a single writer (see webGUI.mdb.MangaDBPool)
     # use host='0.0.0.0' or ip to run on machine's ip address and be accessible over lan
     if args.open:
-        app.run(threaded=False, host='0.0.0.0', port=args.port)
+        app.run(threaded=True, host='0.0.0.0', port=args.port)
     else:
-        app.run(threaded=False, port=args.port)
+        app.run(threaded=True, port=args.port)
 
 
 def cli_yes_no(question_str: str) -> bool:
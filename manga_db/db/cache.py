@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, Optional, Tuple
+
+from .util import change_token
+
+
+class LRUCache:
+    """
+    Bounded LRU mapping for data derived from the database
+    All entries are dropped once the database was modified (detected using change_token),
+    either by this connection or by any other connection to the same database
+    """
+
+    def __init__(self, db_con, maxsize: int = 128):
+        self.db_con = db_con
+        self.maxsize = maxsize
+        self._dict: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._change_token: Optional[Tuple[int, int]] = None
+
+    def _validate(self) -> None:
+        token = change_token(self.db_con)
+        if token != self._change_token:
+            self._dict.clear()
+            self._change_token = token
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self._validate()
+        try:
+            value = self._dict[key]
+        except KeyError:
+            return default
+        self._dict.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._validate()
+        self._dict[key] = value
+        self._dict.move_to_end(key)
+        if len(self._dict) > self.maxsize:
+            self._dict.popitem(last=False)
+
+    def clear(self) -> None:
+        self._dict.clear()
+
+    def __len__(self) -> int:
+        return len(self._dict)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._dict)
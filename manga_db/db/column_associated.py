@@ -1,60 +1,59 @@
+import functools
+
 from typing import (
     Generic, TypeVar, Dict, Any, Callable, Optional, Union, Type,
-    Set, overload, List, Iterable, Sequence
+    Set, overload, List, Iterable
 )
 
 from .column import committed_state_callback, UninitializedColumn
 from .constants import Relationship
 
 
-# adapted from https://stackoverflow.com/a/8859168 Andrew Clark
-def trackable_type(instance: Any, name: str, base: Type,
-                   on_change_callback: Callable[[Any, str, bool, Any, Any], None],
-                   *init_args, **init_kwargs) -> Any:
-    def func_add_callback(func):
-        def wrapped(self, *args, **kwargs):
-            before = base(self)
-            result = func(self, *args, **kwargs)
-            after = base(self)
-            if before != after:
-                # on_change_callback(instance, name, was_uninitialized, before, after)
-                # can access an uninitialized value here?
-                on_change_callback(instance, name, False, before, after)
-            return result
-        return wrapped
-
-    # (<class 'method_descriptor'>, <class 'wrapper_descriptor'>)
-    methods = (type(list.append), type(list.__setitem__))
-    # we also exclude __init__ here so when we initialize the instance
-    # it wont call the callback/count as change
-    # -> otherwise loading from db would count as change
-    # if __init__ is also wrapped it also tracks when item is assigned to
-    # a trackable type e.g. instance.tag = ["Tag1", "Tag2"] would add the prev
-    # val to _committed_state
-    skip = set(['__iter__', '__len__', '__getattribute__', '__init__'])
-
-    # ceate Metaclass for trackable class
-    class TrackableMeta(type):
-        def __new__(cls, name, bases, dct):
-            for attr in dir(base):
-                if attr not in skip:
-                    func = getattr(base, attr)
-                    # wrap method call so we get a callback
-                    if isinstance(func, methods):
-                        dct[attr] = func_add_callback(func)
-            return type.__new__(cls, name, bases, dct)
-
-    # inherit from base class and use metaclass TrackableMeta
-    # to apply callback to base class methods
-    # NOTE: mypy can't check this since Base class base is dynamic
-    class TrackableObject(base, metaclass=TrackableMeta):  # type: ignore
-        # metaclass kwarg -> py3
-        # py2: __metaclass__ = TrackableMeta
-        pass
-    TrackableObject.__name__ = f"{name}_{base.__name__}"
-
-    # initialize TrackableObject (uses base.__init__) with init_args/kwargs
-    return TrackableObject(*init_args, **init_kwargs)
+def _track_changes(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        if self.dirty:
+            # value before the first change is already recorded -> no need to copy
+            return method(self, *args, **kwargs)
+        before = list(self)
+        result = method(self, *args, **kwargs)
+        if before != self:
+            self._on_change(self._owner, self._name, False, before, self)
+        return result
+    return wrapped
+
+
+class TrackedList(list):
+    """
+    list that informs its owner (using on_change(owner, name, was_uninitialized, before, after))
+    when its contents are first changed after the owner's last commit, so the value
+    before the change can be recorded in the owner's _committed_state
+    Only the first change needs a copy of the list (which is used as before), once the
+    column is in _committed_state (dirty) the mutations aren't tracked anymore
+    Creating/assigning it doesn't count as a change -> values loaded from the db
+    aren't changes
+    """
+
+    __slots__ = ("_owner", "_name", "_on_change")
+
+    def __init__(self, owner: Any, name: str, iterable: Iterable = (),
+                 on_change: Callable[[Any, str, bool, Any, Any], None] = committed_state_callback):
+        super().__init__(iterable)
+        self._owner = owner
+        self._name = name
+        self._on_change = on_change
+
+    @property
+    def dirty(self) -> bool:
+        return self._name in self._owner._committed_state
+
+
+# wrap the methods that modify the list in place once when the module is imported
+# (methods that return new lists like copy or __add__ return plain lists)
+for _method_name in ("append", "extend", "insert", "remove", "pop", "clear", "sort",
+                     "reverse", "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(TrackedList, _method_name, _track_changes(getattr(list, _method_name)))
+del _method_name
 
 
 # type of tracked column
@@ -145,12 +144,39 @@ class AssociatedColumnMany(AssociatedColumnBase[T]):
         self.table_name = table_name
         self.assoc_table = assoc_table
 
+    @overload
+    def __get__(self, instance: None, owner: Type) -> 'AssociatedColumnMany[T]': ...
+
+    @overload
+    def __get__(self, instance: Any, owner: Type) -> List[T]: ...
+
+    def __get__(self, instance: Any, owner: Type) -> Union['AssociatedColumnMany', List[T]]:
+        if instance is None:
+            return self
+        try:
+            return vars(instance)[self.name]
+        except KeyError:
+            # lazy loading: instances that were loaded from the db only fetch the values
+            # of their associated columns when they're first accessed
+            if not getattr(instance, "_in_db", False):
+                raise UninitializedColumn
+            self.set_loaded(instance, instance._load_associated_column(self.name))
+            return vars(instance)[self.name]
+
+    def set_loaded(self, instance: Any, value: Optional[Iterable[T]]) -> None:
+        """
+        Sets the value of the column on instance as it's stored in the db so it neither
+        counts as a change (_committed_state) nor triggers the callbacks
+        """
+        # dont set to None or other unwanted type use our tracked list instead
+        vars(instance)[self.name] = TrackedList(instance, self.name, value or ())
+
+    def is_loaded(self, instance: Any) -> bool:
+        return self.name in vars(instance)
+
     def __set__(self, instance: Any, value: Iterable[T]) -> None:
-        if value:
-            value = trackable_type(instance, self.name, list, committed_state_callback, value)
-        else:
-            # dont set to None or other unwanted type use our trackable set instead
-            value = trackable_type(instance, self.name, list, committed_state_callback)
+        # dont set to None or other unwanted type use our tracked list instead
+        value = TrackedList(instance, self.name, value or ())
 
         was_uninitialized = False
         try:
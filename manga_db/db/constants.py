@@ -8,6 +8,16 @@ class Relationship(enum.Enum):
     MANYTOMANY = 3
 
 
+# how the associated columns of instances loaded from the db get loaded
+class LoadStrategy(enum.Enum):
+    # fetched per instance on first access
+    LAZY = 0
+    # fetched for all instances at once using one query per column (WHERE id IN (...))
+    BATCHED = 1
+    # fetched per instance right away
+    EAGER = 2
+
+
 # could also use a helper class instance to represent my constants
 # since they wont compare true against values that could be stored in a cell
 # >>> a=1
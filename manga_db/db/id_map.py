@@ -1,13 +1,67 @@
 import weakref
 
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
 
 class IndentityMap:
 
-    def __init__(self):
+    def __init__(self, strong_size: int = 0, db_con=None):
         # d[key] directly returns acutal object (not weakref)
         # if value gets gc'd key/entry gets autmatically removed from WeakValueDictionary
         # if we retrieved and assigned the obj to a var then it wont be collected by gc anymore
         self._dict = weakref.WeakValueDictionary()
+        # optional LRU tier that keeps the strong_size most recently used instances alive
+        # even if nothing else references them (e.g. between webGUI requests)
+        self.strong_size = strong_size
+        self._strong: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # the instances might get stale when other connections modify the db
+        # -> they're expired (re-read from the db) by validate when PRAGMA data_version of
+        # db_con changed (changes made through this connection are made using the
+        # instances themselves)
+        self.db_con = db_con
+        self._data_version: Optional[int] = None
+        self.validate()
+
+    def validate(self) -> None:
+        """
+        Expires all instances if the db was modified by another connection, instances
+        whose rows were deleted get dropped and the strong tier doesn't keep the others
+        alive anymore
+        Lookups don't check this, it's called once at the start of every write
+        transaction of MangaDB and at the start of a webGUI request
+        """
+        if self.db_con is None:
+            return
+        data_version, = self.db_con.execute("PRAGMA data_version").fetchone()
+        if data_version != self._data_version:
+            # set first since expiring queries the db
+            expire, self._data_version = self._data_version is not None, data_version
+            if expire:
+                self.expire_all()
+
+    def expire_all(self) -> None:
+        self._strong.clear()
+        for key, obj in list(self._dict.items()):
+            if not obj.expire():
+                self.discard(key)
+
+    def clear(self) -> None:
+        self._dict.clear()
+        self._strong.clear()
+
+    def _touch(self, key, obj) -> None:
+        if not self.strong_size:
+            return
+        if obj._committed_state:
+            # unsaved changes must not be kept around after the code that made
+            # them let go of the instance
+            self._strong.pop(key, None)
+        else:
+            self._strong[key] = obj
+            self._strong.move_to_end(key)
+            if len(self._strong) > self.strong_size:
+                self._strong.popitem(last=False)
 
     def add(self, obj):
         if not obj._in_db:
@@ -20,6 +74,7 @@ class IndentityMap:
                                 "an instance present for this key!")
             else:
                 self._dict[key] = obj
+                self._touch(key, obj)
                 return True
 
     def add_unprecedented(self, obj):
@@ -28,10 +83,12 @@ class IndentityMap:
         else:
             key = obj.key
             self._dict[key] = obj
+            self._touch(key, obj)
             return True
 
     def remove(self, key):
         del self._dict[key]
+        self._strong.pop(key, None)
 
     def discard(self, key):
         try:
@@ -41,15 +98,16 @@ class IndentityMap:
             return False
 
     def __getitem__(self, key):
-        return self._dict[key]
+        obj = self._dict[key]
+        self._touch(key, obj)
+        return obj
 
     def __contains__(self, key):
         return key in self._dict
 
     def get(self, key, default=None):
         try:
-            obj = self._dict[key]
-            return obj
+            return self[key]
         except KeyError:
             return default
 
@@ -1,3 +1,6 @@
+from typing import List, Iterable, Any
+
+from .constants import LoadStrategy
 
 
 def load_instance(manga_db, cls, row, *args, **kwargs):
@@ -7,10 +10,35 @@ def load_instance(manga_db, cls, row, *args, **kwargs):
     # when we have lazy loading we have to populate cls instance with parts that havent been loaded
     # yet
     if instance is None:
-        instance = cls(manga_db, *args, **row, in_db=True, **kwargs)
+        instance = cls.from_row(manga_db, row, *args, **kwargs)
         id_map.add(instance)
     return instance
 
 
 def build_key_dictlike(cls, dictlike):
     return (cls, tuple((dictlike[col] for col in cls.PRIMARY_KEY_COLUMNS)))
+
+
+def load_instances(manga_db, cls, rows: Iterable[Any], *args,
+                   strategy: LoadStrategy = LoadStrategy.LAZY, **kwargs) -> List[Any]:
+    """
+    Loads an instance for every row using load_instance, associated columns get loaded
+    according to strategy (see load_associated_columns)
+    """
+    instances = [load_instance(manga_db, cls, row, *args, **kwargs) for row in rows]
+    load_associated_columns(manga_db, cls, instances, strategy)
+    return instances
+
+
+def load_associated_columns(manga_db, cls, instances: List[Any],
+                            strategy: LoadStrategy) -> None:
+    """
+    Loads the associated columns of instances lazily on first access, batched for all
+    instances or eagerly per instance
+    """
+    if strategy is LoadStrategy.BATCHED:
+        cls.load_associated_columns_batched(manga_db, instances)
+    elif strategy is LoadStrategy.EAGER:
+        for instance in instances:
+            for col in getattr(cls, "ASSOCIATED_COLUMNS", []):
+                getattr(instance, col)
@@ -9,7 +9,7 @@ logger = logging.getLogger(__name__)
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # so we don't have to read all migration scripts every time
-LATEST_VERSION = 6
+LATEST_VERSION = 14
 VERSION_TABLE = 'MDB_Version'
 MIGRATIONS_DIRNAME = 'migrations'
 # migrations dir has to be a sub-folder of the MODULE_DIR
@@ -194,6 +194,18 @@ class Database:
 
                 return True
 
+    def _checkpoint(self):
+        # no-op if the DB isn't in WAL mode
+        busy, _, _ = self.db_con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if busy:
+            raise DatabaseError("Could not checkpoint the WAL since the DB is in use by "
+                                "another connection! Close it before migrating!")
+
+    def _remove_wal_files(self):
+        for suffix in ("-wal", "-shm"):
+            if os.path.isfile(f"{self.filename}{suffix}"):
+                os.remove(f"{self.filename}{suffix}")
+
     def upgrade_to_latest(self):
         if not self.is_versionized:
             self._create_version_table()
@@ -207,6 +219,8 @@ class Database:
                 self.db_con.close()
                 self.db_con = None
                 os.remove(self.filename)
+                # the WAL files belong to the dirty DB, they'd be applied to the back-up
+                self._remove_wal_files()
                 shutil.copy(backup_filename, self.filename)
                 self.__init__(self.filename)
             else:
@@ -218,6 +232,9 @@ class Database:
                 # might have an old backup -> delete
                 if os.path.exists(backup_filename):
                     os.remove(backup_filename)
+                # in WAL mode committed changes might only be in the -wal file
+                # -> write them to the DB file so the copy contains everything
+                self._checkpoint()
                 shutil.copy(self.filename, backup_filename)
             else:
                 return True
@@ -0,0 +1,47 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # external content table: FTS5 only stores the index, the titles themselves are
+    # read from Books using content_rowid as key
+    c.execute("""
+    CREATE VIRTUAL TABLE BooksTitleFts USING fts5(
+        title_eng,
+        title_foreign,
+        content='Books',
+        content_rowid='id'
+    )""")
+
+    # keep the index in sync with Books; the update trigger only fires when one of the
+    # titles changed so e.g. the set_books_last_change trigger won't touch the index
+    c.execute("""
+    CREATE TRIGGER books_title_fts_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END""")
+    c.execute("""
+    CREATE TRIGGER books_title_fts_delete
+        AFTER DELETE ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+        END""")
+    c.execute("""
+    CREATE TRIGGER books_title_fts_update
+        AFTER UPDATE OF title_eng, title_foreign ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+            INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END""")
+
+    # index all the books that are already present
+    c.execute("INSERT INTO BooksTitleFts(BooksTitleFts) VALUES ('rebuild')")
@@ -0,0 +1,48 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # the trigram tokenizer is only available since SQLite 3.34.0
+    # without it MangaDB falls back to an in-memory trigram index
+    try:
+        c.execute("""
+        CREATE VIRTUAL TABLE BooksTitleTrigram USING fts5(
+            title_eng,
+            title_foreign,
+            content='Books',
+            content_rowid='id',
+            tokenize='trigram'
+        )""")
+    except sqlite3.OperationalError:
+        return
+
+    c.execute("""
+    CREATE TRIGGER books_title_trigram_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END""")
+    c.execute("""
+    CREATE TRIGGER books_title_trigram_delete
+        AFTER DELETE ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+        END""")
+    c.execute("""
+    CREATE TRIGGER books_title_trigram_update
+        AFTER UPDATE OF title_eng, title_foreign ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+            INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END""")
+
+    c.execute("INSERT INTO BooksTitleTrigram(BooksTitleTrigram) VALUES ('rebuild')")
@@ -0,0 +1,14 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # so range searches like pages:>200 or upload_date:2020..2021 can use index range scans
+    c.execute("CREATE INDEX idx_books_my_rating ON Books (my_rating)")
+    c.execute("CREATE INDEX idx_books_pages ON Books (pages)")
+    c.execute("CREATE INDEX idx_books_last_change ON Books (last_change)")
+    c.execute("CREATE INDEX idx_external_info_upload_date ON ExternalInfo (upload_date)")
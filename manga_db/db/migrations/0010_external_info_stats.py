@@ -0,0 +1,89 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # one row per book (id is the book's id) with the values of its ExternalInfo rows
+    # aggregated, so sorting by them can use an index instead of aggregating ExternalInfo
+    # for the whole library
+    # columns are NOT NULL so keyset pagination can use index range scans: books
+    # without ratings/external infos get 0 or an empty upload_date, which sort
+    # first just like NULLs would (TEXT instead of DATE so the DATE converter doesn't
+    # choke on the empty string)
+    c.execute("""
+    CREATE TABLE ExternalInfoStats(
+        id INTEGER PRIMARY KEY ASC,
+        ext_rating REAL NOT NULL DEFAULT 0,
+        ext_ratings INTEGER NOT NULL DEFAULT 0,
+        ext_favorites INTEGER NOT NULL DEFAULT 0,
+        ext_upload_date TEXT NOT NULL DEFAULT '',
+        FOREIGN KEY (id) REFERENCES Books(id)
+           ON DELETE CASCADE
+    )""")
+    # the book id is part of every index implicitly (rowid) so the indices also cover
+    # the id that is used as secondary sort column
+    c.execute("CREATE INDEX idx_ext_info_stats_rating ON ExternalInfoStats (ext_rating)")
+    c.execute("CREATE INDEX idx_ext_info_stats_ratings ON ExternalInfoStats (ext_ratings)")
+    c.execute("CREATE INDEX idx_ext_info_stats_favorites ON ExternalInfoStats (ext_favorites)")
+    c.execute("CREATE INDEX idx_ext_info_stats_upload_date ON "
+              "ExternalInfoStats (ext_upload_date)")
+
+    c.execute("""
+    CREATE TRIGGER ext_info_stats_book_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO ExternalInfoStats(id) VALUES (NEW.id);
+        END""")
+    # recompute the aggregates of the affected book(s) when its ExternalInfo rows change
+    # rating 0 means not rated (same as Book.avg_ext_rating)
+    c.execute("""
+    CREATE TRIGGER ext_info_stats_insert
+        AFTER INSERT ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (NEW.book_id);
+        END""")
+    c.execute("""
+    CREATE TRIGGER ext_info_stats_delete
+        AFTER DELETE ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (OLD.book_id);
+        END""")
+    c.execute("""
+    CREATE TRIGGER ext_info_stats_update
+        AFTER UPDATE OF book_id, rating, ratings, favorites, upload_date ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (OLD.book_id, NEW.book_id);
+        END""")
+
+    c.execute("""
+    INSERT INTO ExternalInfoStats(id, ext_rating, ext_ratings, ext_favorites, ext_upload_date)
+    SELECT Books.id, IFNULL(AVG(NULLIF(ei.rating, 0)), 0), IFNULL(SUM(ei.ratings), 0),
+           IFNULL(SUM(ei.favorites), 0), IFNULL(MIN(ei.upload_date), '')
+    FROM Books
+    LEFT JOIN ExternalInfo ei ON ei.book_id = Books.id
+    GROUP BY Books.id""")
@@ -0,0 +1,15 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # loading the external infos of a book (or many books at once) scanned the whole table
+    # book_id is the leading column so the index is used for lookups by book_id alone
+    # as well; outdated is included so checking for outdated links of books can be
+    # answered from the index
+    c.execute("CREATE INDEX idx_external_info_book_id_outdated ON "
+              "ExternalInfo (book_id, outdated)")
@@ -0,0 +1,19 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # the (book_id, x_id) primary keys of the bridge tables only help lookups by book;
+    # queries that start from a tag etc. (searching by tag, delete_tag, update_tag_name,
+    # usage counts) had to scan the whole bridge table
+    # book_id is included so these indices cover the queries
+    for table_name, bridge_col_name in (
+            ("List", "list_id"), ("Tag", "tag_id"), ("Category", "category_id"),
+            ("Collection", "collection_id"), ("Groups", "group_id"), ("Artist", "artist_id"),
+            ("Parody", "parody_id"), ("Character", "character_id")):
+        c.execute(f"CREATE INDEX idx_book_{table_name.lower()}_{bridge_col_name}_book_id "
+                  f"ON Book{table_name} ({bridge_col_name}, book_id)")
@@ -0,0 +1,90 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # one row per book (id is the book's id) with the names of its associated values
+    # (tags, artists etc.) as JSON arrays ordered by the values' ids so all of them can be
+    # read using one primary key lookup instead of a query on every bridge table
+    # (JSON since names may contain any separator); '[]' if the book has none
+    assoc_tables = (
+        ("list", "List", "list_id"), ("tag", "Tag", "tag_id"),
+        ("category", "Category", "category_id"),
+        ("collection", "Collection", "collection_id"), ("groups", "Groups", "group_id"),
+        ("artist", "Artist", "artist_id"), ("parody", "Parody", "parody_id"),
+        ("character", "Character", "character_id"))
+    c.execute("""
+    CREATE TABLE BookAggregates(
+        id INTEGER PRIMARY KEY ASC,
+        list TEXT NOT NULL DEFAULT '[]',
+        tag TEXT NOT NULL DEFAULT '[]',
+        category TEXT NOT NULL DEFAULT '[]',
+        collection TEXT NOT NULL DEFAULT '[]',
+        groups TEXT NOT NULL DEFAULT '[]',
+        artist TEXT NOT NULL DEFAULT '[]',
+        parody TEXT NOT NULL DEFAULT '[]',
+        character TEXT NOT NULL DEFAULT '[]',
+        FOREIGN KEY (id) REFERENCES Books(id)
+           ON DELETE CASCADE
+    )""")
+
+    c.execute("""
+    CREATE TRIGGER book_aggregates_book_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BookAggregates(id) VALUES (NEW.id);
+        END""")
+    # re-build the affected column of the book(s) when their bridge table rows change
+    # or when a value gets renamed
+    for col, table_name, bridge_col_name in assoc_tables:
+        aggregate = f"""
+            UPDATE BookAggregates
+            SET {col} = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM Book{table_name} bx
+                    JOIN {table_name} x ON x.id = bx.{bridge_col_name}
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )"""
+        c.execute(f"""
+        CREATE TRIGGER book_aggregates_{col}_insert
+            AFTER INSERT ON Book{table_name}
+            BEGIN{aggregate}
+                WHERE id IN (NEW.book_id);
+            END""")
+        c.execute(f"""
+        CREATE TRIGGER book_aggregates_{col}_delete
+            AFTER DELETE ON Book{table_name}
+            BEGIN{aggregate}
+                WHERE id IN (OLD.book_id);
+            END""")
+        c.execute(f"""
+        CREATE TRIGGER book_aggregates_{col}_update
+            AFTER UPDATE OF book_id, {bridge_col_name} ON Book{table_name}
+            BEGIN{aggregate}
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END""")
+        c.execute(f"""
+        CREATE TRIGGER book_aggregates_{col}_rename
+            AFTER UPDATE OF name ON {table_name}
+            BEGIN{aggregate}
+                WHERE id IN (SELECT book_id FROM Book{table_name}
+                             WHERE {bridge_col_name} = NEW.id);
+            END""")
+
+    c.execute(f"""
+    INSERT INTO BookAggregates(id, {', '.join(col for col, _, _ in assoc_tables)})
+    SELECT Books.id, {', '.join(f'''(
+        SELECT json_group_array(name) FROM (
+            SELECT x.name
+            FROM Book{table_name} bx
+            JOIN {table_name} x ON x.id = bx.{bridge_col_name}
+            WHERE bx.book_id = Books.id
+            ORDER BY x.id))''' for _, table_name, bridge_col_name in assoc_tables)}
+    FROM Books""")
@@ -0,0 +1,47 @@
+import sqlite3
+
+date = '2026-10-17'
+requires_foreign_keys_off = False
+
+
+def upgrade(db_con: sqlite3.Connection, db_filename: str) -> None:
+    c = db_con.cursor()
+
+    # nr of books every tag, artist etc. is on, so the usage counts (selectivity of
+    # search terms, facets over the whole library, unused tags) can be read without
+    # COUNTing the bridge table
+    for table_name, bridge_col_name in (
+            ("List", "list_id"), ("Tag", "tag_id"), ("Category", "category_id"),
+            ("Collection", "collection_id"), ("Groups", "group_id"), ("Artist", "artist_id"),
+            ("Parody", "parody_id"), ("Character", "character_id")):
+        c.execute(f"ALTER TABLE {table_name} ADD COLUMN book_count INTEGER NOT NULL DEFAULT 0")
+        c.execute(f"""
+        UPDATE {table_name} SET book_count = (
+            SELECT COUNT(*) FROM Book{table_name} bx WHERE bx.{bridge_col_name} = {table_name}.id
+        )""")
+        c.execute(f"CREATE INDEX idx_{table_name.lower()}_book_count "
+                  f"ON {table_name} (book_count)")
+
+        c.execute(f"""
+        CREATE TRIGGER {table_name.lower()}_book_count_insert
+            AFTER INSERT ON Book{table_name}
+            BEGIN
+                UPDATE {table_name} SET book_count = book_count + 1
+                WHERE id = NEW.{bridge_col_name};
+            END""")
+        c.execute(f"""
+        CREATE TRIGGER {table_name.lower()}_book_count_delete
+            AFTER DELETE ON Book{table_name}
+            BEGIN
+                UPDATE {table_name} SET book_count = book_count - 1
+                WHERE id = OLD.{bridge_col_name};
+            END""")
+        c.execute(f"""
+        CREATE TRIGGER {table_name.lower()}_book_count_update
+            AFTER UPDATE OF {bridge_col_name} ON Book{table_name}
+            BEGIN
+                UPDATE {table_name} SET book_count = book_count - 1
+                WHERE id = OLD.{bridge_col_name};
+                UPDATE {table_name} SET book_count = book_count + 1
+                WHERE id = NEW.{bridge_col_name};
+            END""")
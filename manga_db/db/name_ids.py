@@ -0,0 +1,81 @@
+import logging
+
+from typing import Dict, Iterable, Optional
+
+from .util import chunked
+from .posting_lists import nocase
+
+logger = logging.getLogger(__name__)
+
+
+class AssociatedNameIds:
+    """
+    Cache of the ids of the names in the tables of the associated columns (Tag, Artist, ...)
+    so adding values to books can insert the bridge rows with known ids directly and only
+    names that aren't in the DB yet have to hit the table
+    The names of a table are loaded lazily when it's first needed; changes to names go
+    through MangaDB (delete_tag, update_tag_name) which keep the cache in sync, everything
+    is dropped when another connection modified the db (PRAGMA data_version) or a
+    transaction was rolled back (ids of names added in it might not exist anymore)
+    """
+
+    def __init__(self, db_con):
+        self.db_con = db_con
+        # table name -> nocase name -> id
+        self._ids: Dict[str, Dict[str, int]] = {}
+        self._data_version: Optional[int] = None
+
+    def invalidate(self) -> None:
+        self._ids.clear()
+        self._data_version = None
+
+    def _table_ids(self, table_name: str) -> Dict[str, int]:
+        data_version, = self.db_con.execute("PRAGMA data_version").fetchone()
+        if data_version != self._data_version:
+            self._ids.clear()
+            self._data_version = data_version
+        try:
+            return self._ids[table_name]
+        except KeyError:
+            c = self.db_con.execute(f"SELECT id, name FROM {table_name}")
+            ids = self._ids[table_name] = {nocase(name): _id for _id, name in c.fetchall()}
+            logger.debug("Loaded the ids of %d names of '%s'", len(ids), table_name)
+            return ids
+
+    def get_ids(self, table_name: str, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Returns the ids of names in table_name by their nocase name, names that aren't
+        in the DB yet get added
+        """
+        table_ids = self._table_ids(table_name)
+        ids = {}
+        missing = []
+        for name in names:
+            key = nocase(name)
+            try:
+                ids[key] = table_ids[key]
+            except KeyError:
+                missing.append(name)
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            # NOTE: careful! since OR IGNORE ignores the insert if sth. like a unique
+            # constraint is violated it also doesn't raise an exception etc. and a bug of
+            # not adding rows might get unnoticed
+            self.db_con.executemany(f"INSERT OR IGNORE INTO {table_name}(name) VALUES (?)",
+                                    [(name,) for name in missing])
+            for chunk in chunked(missing):
+                c = self.db_con.execute(f"""
+                    SELECT id, name FROM {table_name}
+                    WHERE name IN ({', '.join('?' * len(chunk))})""", chunk)
+                for _id, name in c.fetchall():
+                    ids[nocase(name)] = table_ids[nocase(name)] = _id
+        return ids
+
+    def remove(self, table_name: str, name: str) -> None:
+        if table_name in self._ids:
+            self._ids[table_name].pop(nocase(name), None)
+
+    def rename(self, table_name: str, old_name: str, new_name: str, _id: int) -> None:
+        if table_name in self._ids:
+            self._ids[table_name].pop(nocase(old_name), None)
+            self._ids[table_name][nocase(new_name)] = _id
@@ -0,0 +1,130 @@
+import string
+import logging
+
+from collections import OrderedDict, defaultdict
+from typing import AbstractSet, Dict, Iterable, Set, Tuple, Optional
+
+from .util import joined_col_name_to_query_names
+
+logger = logging.getLogger(__name__)
+
+# the name columns of the associated tables use COLLATE NOCASE which only folds ASCII chars
+NOCASE_TABLE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def nocase(name: str) -> str:
+    return name.translate(NOCASE_TABLE)
+
+
+class PostingListIndex:
+    """
+    In-memory index mapping every value of an associated column (tag, artist, list, ...)
+    to the set of ids of the books it's on, so include/exclude searches can be answered
+    by set intersections/differences instead of joining the bridge tables
+    The posting lists of an associated column are built lazily from its Book<Table> bridge
+    table when it's first needed and kept up-to-date with the changes this connection
+    makes through Book/MangaDB (add, remove, remove_book, remove_name, rename); all of
+    them are dropped when another connection modified the db (PRAGMA data_version) or
+    a transaction was rolled back (invalidate)
+    At most max_size book ids are kept, the posting lists of the least recently used
+    columns are dropped first
+    """
+
+    def __init__(self, db_con, max_size: Optional[int] = None):
+        self.db_con = db_con
+        self.max_size = max_size
+        # col name -> nocase value name -> book ids
+        self._postings: "OrderedDict[str, Dict[str, Set[int]]]" = OrderedDict()
+        # nr of book ids in the posting lists of a column
+        self._sizes: Dict[str, int] = {}
+        self._data_version: Optional[int] = None
+
+    def invalidate(self) -> None:
+        self._postings.clear()
+        self._sizes.clear()
+        self._data_version = None
+
+    def _build(self, col_name: str) -> Dict[str, Set[int]]:
+        table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
+        c = self.db_con.execute(f"""
+            SELECT {table_name}.name, Book{table_name}.book_id
+            FROM Book{table_name}
+            JOIN {table_name} ON {table_name}.id = Book{table_name}.{bridge_col_name}""")
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        for name, book_id in c.fetchall():
+            postings[nocase(name)].add(book_id)
+
+        logger.debug("Built posting lists for %d values of '%s'", len(postings), col_name)
+        return dict(postings)
+
+    def _evict(self) -> None:
+        if self.max_size is None:
+            return
+        # always keep the column that was used last
+        while len(self._postings) > 1 and sum(self._sizes.values()) > self.max_size:
+            col_name, _ = self._postings.popitem(last=False)
+            del self._sizes[col_name]
+            logger.debug("Dropped the posting lists of '%s'", col_name)
+
+    def postings(self, col_name: str) -> Dict[str, Set[int]]:
+        """
+        Returns the posting lists (nocase value name -> book ids) of col_name
+        The sets are updated in place, so callers must not modify them
+        """
+        data_version, = self.db_con.execute("PRAGMA data_version").fetchone()
+        if data_version != self._data_version:
+            self.invalidate()
+            self._data_version = data_version
+        try:
+            postings = self._postings[col_name]
+        except KeyError:
+            postings = self._postings[col_name] = self._build(col_name)
+            self._sizes[col_name] = sum(len(ids) for ids in postings.values())
+            self._evict()
+        else:
+            self._postings.move_to_end(col_name)
+        return postings
+
+    def book_ids(self, col_name: str, name: str) -> AbstractSet[int]:
+        return self.postings(col_name).get(nocase(name), frozenset())
+
+    def add(self, col_name: str, pairs: Iterable[Tuple[int, str]]) -> None:
+        """Adds the (book_id, value name) pairs that were added to col_name"""
+        postings = self._postings.get(col_name)
+        if postings is None:
+            # not loaded -> gets built from the db when it's needed
+            return
+        for book_id, name in pairs:
+            ids = postings.setdefault(nocase(name), set())
+            if book_id not in ids:
+                ids.add(book_id)
+                self._sizes[col_name] += 1
+
+    def remove(self, col_name: str, pairs: Iterable[Tuple[int, str]]) -> None:
+        """Removes the (book_id, value name) pairs that were removed from col_name"""
+        postings = self._postings.get(col_name)
+        if postings is None:
+            return
+        for book_id, name in pairs:
+            ids = postings.get(nocase(name))
+            if ids is not None and book_id in ids:
+                ids.discard(book_id)
+                self._sizes[col_name] -= 1
+
+    def remove_book(self, book_id: int) -> None:
+        """Removes a deleted book from all posting lists"""
+        for col_name, postings in self._postings.items():
+            for ids in postings.values():
+                if book_id in ids:
+                    ids.discard(book_id)
+                    self._sizes[col_name] -= 1
+
+    def remove_name(self, col_name: str, name: str) -> None:
+        postings = self._postings.get(col_name)
+        if postings is not None:
+            self._sizes[col_name] -= len(postings.pop(nocase(name), ()))
+
+    def rename(self, col_name: str, old_name: str, new_name: str) -> None:
+        postings = self._postings.get(col_name)
+        if postings is not None and nocase(old_name) in postings:
+            postings[nocase(new_name)] = postings.pop(nocase(old_name))
@@ -0,0 +1,96 @@
+import dataclasses
+
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple
+
+from .search import AssocValue, And, Not, search_ast, assoc_usage_counts
+from .constants import LoadStrategy, Relationship
+
+if TYPE_CHECKING:
+    from ..manga_db import MangaDB
+
+
+@dataclasses.dataclass
+class QueryPlan:
+    # name of the part of the workload that issued the statement
+    name: str
+    sql: str
+    # detail column of EXPLAIN QUERY PLAN
+    plan: List[str]
+
+    @property
+    def scans(self) -> List[str]:
+        # full table/index scans, index lookups are reported as SEARCH
+        # scanning intermediate results (materialized CTEs, subqueries) is expected
+        intermediate = {step.split(" ", 1)[1] for step in self.plan
+                        if step.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+        return [step for step in self.plan if step.startswith("SCAN ")
+                and step[5:].split(" ", 1)[0] not in intermediate
+                and not step.startswith("SCAN (subquery")]
+
+
+def explain(db_con, sql: str) -> List[str]:
+    return [row[3] for row in db_con.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+
+def canonical_workload(mdb: 'MangaDB') -> Iterator[Tuple[str, Callable[[], object]]]:
+    """
+    Yields (name, func) tuples of the application's canonical operations: loading books,
+    listing, searching (using SQL, so create mdb with the posting_lists setting turned off),
+    usage counts and the tag management (which modifies the DB, so only run this on a copy)
+    """
+    # imported here since manga imports from db
+    from ..manga import Book
+
+    book_id, = mdb.db_con.execute("SELECT MIN(id) FROM Books").fetchone()
+    if book_id is not None:
+        yield "get_book", lambda: mdb.get_book(_id=book_id)
+        book = Book(mdb, in_db=False, id=book_id)
+        yield "book ext infos", book._fetch_external_infos
+        for col in Book.ASSOCIATED_COLUMNS:
+            if col != "ext_infos":
+                yield f"book {col}", lambda col=col: book._fetch_associated_column(col)
+    yield "list books", lambda: mdb.get_x_books(60, load_strategy=LoadStrategy.BATCHED)
+    yield "list book summaries", lambda: mdb.get_x_books(60, summary=True)
+    yield "outdated books", mdb.get_outdated
+
+    m2m_cols = [col for col in Book.ASSOCIATED_COLUMNS
+                if getattr(Book, col).relationship is Relationship.MANYTOMANY]
+    for col in m2m_cols:
+        table_name = col.capitalize()
+        rows = mdb.db_con.execute(f"SELECT id, name FROM {table_name} LIMIT 2").fetchall()
+        if not rows:
+            continue
+        (tag_id, name), other_name = rows[0], rows[-1][1]
+        yield (f"search {col}", lambda col=col, name=name: search_ast(
+            mdb.db_con, mdb.search_compiler, AssocValue(col, name), limit=60))
+        yield (f"search {col} excluding {col}", lambda col=col, name=name, other=other_name:
+               search_ast(mdb.db_con, mdb.search_compiler,
+                          And((AssocValue(col, name), Not(AssocValue(col, other)))), limit=60))
+        yield (f"usage counts {col}",
+               lambda col=col, name=name: assoc_usage_counts(mdb.db_con, col, [name]))
+        yield f"search facets {col}", lambda col=col: mdb.search_facets(f"{col}:x", cols=[col])
+        yield (f"update_tag_name {col}",
+               lambda col=col, tag_id=tag_id, name=name: mdb.update_tag_name(
+                   col, tag_id, f"{name} (renamed)"))
+        yield f"delete_tag {col}", lambda col=col, tag_id=tag_id: mdb.delete_tag(col, tag_id)
+
+
+def explain_workload(mdb: 'MangaDB') -> List[QueryPlan]:
+    """
+    Runs the canonical_workload capturing the statements it issues and returns their
+    query plans
+    """
+    plans = []
+    for name, func in canonical_workload(mdb):
+        statements: List[str] = []
+        mdb.db_con.set_trace_callback(statements.append)
+        try:
+            func()
+        finally:
+            mdb.db_con.set_trace_callback(None)
+        for sql in statements:
+            # can't be explained
+            if sql.startswith(("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK")):
+                continue
+            plans.append(QueryPlan(name, sql, explain(mdb.db_con, sql)))
+    return plans
@@ -1,4 +1,7 @@
-from typing import List, Dict, Any, Tuple, Mapping, ClassVar, TYPE_CHECKING, Union, Type
+from collections import defaultdict
+from typing import (
+    List, Dict, Any, Tuple, Mapping, ClassVar, TYPE_CHECKING, Union, Type, Optional
+)
 
 if TYPE_CHECKING:
     from ..manga_db import MangaDB
@@ -13,6 +16,11 @@ class DBRow:
     # cant assign [] here otherwise col names of all subclasses will be appended to same list
     COLUMNS: ClassVar[List[str]]
     ASSOCIATED_COLUMNS: ClassVar[List[str]]
+    # (name, type) of the primary key and normal columns, see _column_types
+    _COLUMN_TYPES: ClassVar[Tuple[Tuple[str, type], ...]]
+    # new instances of classes with a lower FLUSH_ORDER are saved first by Session.flush
+    # (e.g. Books before the ExternalInfos referencing them)
+    FLUSH_ORDER: ClassVar[int] = 0
 
     def __init__(self, manga_db: 'MangaDB', in_db: bool, **kwargs):
         self.manga_db = manga_db
@@ -23,6 +31,68 @@ class DBRow:
         # it might just have the same title as the book whose id was returned
         self._in_db: bool = in_db
 
+    @classmethod
+    def from_row(cls, manga_db: 'MangaDB', row: Mapping[str, Any], *args, **kwargs) -> 'DBRow':
+        """
+        Creates an instance that is in the DB from row without going through __init__ and
+        the Column descriptors: the type-checked values are written straight into the
+        instance's __dict__ in one pass so hydrating doesn't count as a change, change
+        tracking starts afterwards
+        args/kwargs are passed to _init_from_row which sets up the remaining state
+        """
+        instance = cls.__new__(cls)
+        DBRow.__init__(instance, manga_db, True)
+        values = instance.__dict__
+        for name, value_type in cls._column_types():
+            value = row[name]
+            if (value is not None and type(value) is not value_type and
+                    not isinstance(value, value_type)):
+                raise TypeError(f"Value doesn't match the column's ({name}) type! Got "
+                                f"{type(value)}: {value} epxected {value_type}")
+            values[name] = value
+        instance._init_from_row(*args, **kwargs)
+        return instance
+
+    @classmethod
+    def _column_types(cls) -> Tuple[Tuple[str, type], ...]:
+        # computed once per class
+        try:
+            return cls.__dict__["_COLUMN_TYPES"]
+        except KeyError:
+            column_types = tuple((name, getattr(cls, name).type)
+                                 for name in cls.PRIMARY_KEY_COLUMNS + cls.COLUMNS)
+            cls._COLUMN_TYPES = column_types
+            return column_types
+
+    def expire(self) -> bool:
+        """
+        Re-reads the columns of an instance that is in the DB from its row and drops the
+        loaded associated columns so they get fetched again when they're next accessed
+        Columns with unsaved changes (in _committed_state) are kept
+        Returns False if the row doesn't exist anymore
+        """
+        pk_cond = " AND ".join(f"{col} = ?" for col in self.PRIMARY_KEY_COLUMNS)
+        row = self.manga_db.db_con.execute(
+            f"SELECT * FROM {self.TABLENAME} WHERE {pk_cond}",
+            [getattr(self, col) for col in self.PRIMARY_KEY_COLUMNS]).fetchone()
+        if row is None:
+            return False
+        values = self.__dict__
+        for name, _ in self._column_types():
+            if name not in self._committed_state:
+                values[name] = row[name]
+        for col in getattr(self, "ASSOCIATED_COLUMNS", []):
+            if col not in self._committed_state:
+                values.pop(col, None)
+        return True
+
+    def _init_from_row(self, *args, **kwargs) -> None:
+        """
+        Sets up the state of an instance created by from_row that isn't stored in the
+        columns (what __init__ does besides assigning the columns)
+        """
+        pass
+
     # Tuple[T, ...] => variable length tuple
     @property
     def key(self) -> Tuple[Type['DBRow'], Tuple[Union[str, int, float], ...]]:
@@ -64,6 +134,68 @@ class DBRow:
         """
         raise NotImplementedError
 
+    @classmethod
+    def _flush_inserts(cls, manga_db: 'MangaDB', instances: List['DBRow']) -> None:
+        """
+        Inserts the rows of new instances re-using one prepared statement (one by one
+        so their ids can be read from lastrowid) and adds them to the IdentityMap
+        (used by Session.flush); subclasses add the associated columns etc.
+        Doesn't commit
+        """
+        # rowid alias
+        pk, = cls.PRIMARY_KEY_COLUMNS
+        cols = [col for col in cls.COLUMNS if col != pk]
+        insert = f"""
+            INSERT INTO {cls.TABLENAME} ({', '.join(cols)})
+            VALUES ({', '.join(f':{col}' for col in cols)})"""
+        for instance in instances:
+            c = manga_db.db_con.execute(insert, instance.export_for_db())
+            setattr(instance, pk, c.lastrowid)
+            instance._in_db = True
+            manga_db.id_map.add_unprecedented(instance)
+            instance._committed_state = {}
+
+    @classmethod
+    def _flush_updates(cls, manga_db: 'MangaDB', instances: List['DBRow']) -> None:
+        """
+        Writes the changed columns (_committed_state) of instances that are in the DB
+        using one executemany per combination of changed columns (used by Session.flush)
+        Doesn't commit or reset _committed_state
+        """
+        by_changed_cols: Dict[Tuple[str, ...], List[Dict[str, Any]]] = defaultdict(list)
+        for instance in instances:
+            changed_cols = tuple(sorted(col for col in instance._committed_state
+                                        if col in cls.COLUMNS))
+            if changed_cols:
+                by_changed_cols[changed_cols].append(instance.export_for_db())
+
+        pk_cond = " AND ".join(f"{col} = :{col}" for col in cls.PRIMARY_KEY_COLUMNS)
+        for changed_cols, rows in by_changed_cols.items():
+            manga_db.db_con.executemany(f"""
+                UPDATE {cls.TABLENAME} SET
+                {', '.join(f'{col} = :{col}' for col in changed_cols)}
+                WHERE {pk_cond}""", rows)
+
+    @classmethod
+    def load_associated_columns_batched(cls, manga_db: 'MangaDB', instances: List['DBRow'],
+                                        cols: Optional[List[str]] = None) -> None:
+        """
+        Loads the associated columns cols (default: all) of instances that haven't
+        been loaded yet; subclasses can override this to load them using one query
+        per column for all instances
+        """
+        for instance in instances:
+            for col in (getattr(cls, "ASSOCIATED_COLUMNS", []) if cols is None else cols):
+                getattr(instance, col)
+
+    def _load_associated_column(self, col_name: str) -> List[Any]:
+        """
+        Fetches the values of the associated column col_name from the DB, called
+        by AssociatedColumnMany when a column of an instance that is in the DB
+        is accessed for the first time
+        """
+        raise NotImplementedError
+
     def diff_normal_cols(self, row: Mapping[str, Any]) -> Tuple[str, List[str]]:
         changed_str = []
         changed_cols = []
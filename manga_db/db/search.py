@@ -1,11 +1,110 @@
+import re
 import logging
+import sqlite3
+import datetime
 
-from typing import List, Dict, Tuple, Optional
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from typing import List, Dict, Tuple, Optional, Union, Callable, Iterable, Set
 
-from .util import joined_col_name_to_query_names, prod
+from .util import joined_col_name_to_query_names
+from .cache import LRUCache
+from .trigram import TrigramIndex, TITLE_TRIGRAM_TABLE, MIN_SUBSTRING_LEN
+from .posting_lists import PostingListIndex, nocase
+from ..util import contains_asian
 
 logger = logging.getLogger(__name__)
 
+# FTS5 table (external content table on Books) indexing title_eng and title_foreign
+TITLE_FTS_TABLE = "BooksTitleFts"
+# a word needs at least one char that the FTS5 tokenizer doesn't treat as a separator
+# otherwise it would be an empty phrase that never matches
+FTS_WORD_RE = re.compile(r"\w")
+
+
+def title_fts_query(title: str) -> Optional[str]:
+    """
+    Converts a user supplied title search into a FTS5 query where every word
+    has to match the start of a word in either title column (implicit AND)
+    Returns None if there's nothing left to match on
+    """
+    phrases = []
+    for word in title.split():
+        if not FTS_WORD_RE.search(word):
+            continue
+        # quote every word so FTS5 syntax chars like - : ( * are matched literally;
+        # quotes inside a string are escaped by doubling them
+        word = word.replace('"', '""')
+        phrases.append(f'"{word}"*')
+    return " ".join(phrases) if phrases else None
+
+
+def title_substring_cond(substring: str,
+                         trigram_index: Optional[TrigramIndex] = None) -> Tuple[str, List]:
+    """
+    Returns a condition matching books where one of the titles contains substring
+    Uses the FTS5 trigram index or trigram_index (if the SQLite build lacks the
+    trigram tokenizer) for substrings of MIN_SUBSTRING_LEN chars or more
+    """
+    if len(substring) < MIN_SUBSTRING_LEN:
+        # too short for a trigram index
+        substring_wildcarded = f"%{substring}%"
+        return ("(Books.title_eng LIKE ? OR Books.title_foreign LIKE ?)",
+                [substring_wildcarded, substring_wildcarded])
+    elif trigram_index is not None:
+        # ids are ints so it's safe to put them into the statement directly
+        # (also avoids hitting the max nr of host parameters)
+        ids = trigram_index.search(substring)
+        return f"Books.id IN ({', '.join(str(i) for i in ids)})", []
+    else:
+        substring = substring.replace('"', '""')
+        return (f"Books.id IN (SELECT rowid FROM {TITLE_TRIGRAM_TABLE} "
+                f"WHERE {TITLE_TRIGRAM_TABLE} MATCH ?)", [f'"{substring}"'])
+
+
+def title_search_cond(title: str,
+                      trigram_index: Optional[TrigramIndex] = None) -> Tuple[str, List]:
+    """
+    Returns a condition (without leading WHERE/AND) matching books whose titles contain
+    all the words in title and the values for param substitution
+    Words are matched as prefixes of the words in the titles using the FTS5 index,
+    words of MIN_SUBSTRING_LEN chars or more also match anywhere in the titles
+    (see title_substring_cond); CJK words can't be split by whitespace so they're
+    only matched as substrings
+    """
+    conds: List[str] = []
+    vals: List = []
+    prefix_words = []
+    for word in title.split():
+        if contains_asian(word):
+            cond, cond_vals = title_substring_cond(word, trigram_index)
+            conds.append(cond)
+            vals.extend(cond_vals)
+        elif len(word) >= MIN_SUBSTRING_LEN and FTS_WORD_RE.search(word):
+            # the trigram index finds words that only match inside a title word
+            # e.g. 'atsu' in 'Natsu', FTS5 additionally matches diacritics-insensitive
+            cond, cond_vals = title_substring_cond(word, trigram_index)
+            conds.append(f"(Books.id IN (SELECT rowid FROM {TITLE_FTS_TABLE} "
+                         f"WHERE {TITLE_FTS_TABLE} MATCH ?) OR {cond})")
+            vals.append(title_fts_query(word))
+            vals.extend(cond_vals)
+        else:
+            prefix_words.append(word)
+
+    fts_query = title_fts_query(" ".join(prefix_words))
+    if fts_query is not None:
+        conds.append(f"Books.id IN (SELECT rowid FROM {TITLE_FTS_TABLE} "
+                     f"WHERE {TITLE_FTS_TABLE} MATCH ?)")
+        vals.append(fts_query)
+    elif not conds:
+        # only separators -> can't use the index
+        title_wildcarded = f"%{title}%"
+        return ("(Books.title_eng LIKE ? OR Books.title_foreign LIKE ?)",
+                [title_wildcarded, title_wildcarded])
+
+    return (conds[0] if len(conds) == 1 else f"({' AND '.join(conds)})"), vals
+
 
 def search_assoc_col_string_parse(valuestring, delimiter=";") -> Tuple[List[str], List[str]]:
     # is list comprehension faster even though we have to iterate over the list twice?
@@ -22,9 +121,17 @@ def search_assoc_col_string_parse(valuestring, delimiter=";") -> Tuple[List[str]
     return vals_and, vals_ex
 
 
+# values aggregated from a book's ExternalInfo rows are stored in this table (kept up-to-date
+# by triggers) so sorting by them can use an index
+EXT_STATS_TABLE = "ExternalInfoStats"
+EXT_STATS_COLS = ("ext_rating", "ext_ratings", "ext_favorites", "ext_upload_date")
 VALID_ORDER_BY = {"ASC", "DESC", "Books.id", "Books.title_eng", "Books.title_foreign",
                   "Books.pages", "Books.my_rating", "Books.last_change", "id", "last_change",
-                  "title_eng", "title_foreign", "pages", "my_rating"}
+                  "title_eng", "title_foreign", "pages", "my_rating",
+                  *EXT_STATS_COLS, *(f"{EXT_STATS_TABLE}.{col}" for col in EXT_STATS_COLS)}
+# sorting cols that can't be NULL -> keyset pagination doesn't need to include NULL rows
+NOT_NULL_ORDER_BY = {"Books.id", "Books.pages", "Books.last_change",
+                     *(f"{EXT_STATS_TABLE}.{col}" for col in EXT_STATS_COLS)}
 
 
 def validate_order_by_str(order_by) -> bool:
@@ -34,19 +141,33 @@ def validate_order_by_str(order_by) -> bool:
     return True
 
 
+def order_by_table(col: str) -> str:
+    """Returns the table that the sorting column col (without table name) is stored in"""
+    return EXT_STATS_TABLE if col in EXT_STATS_COLS else "Books"
+
+
+def select_from_books(columns: str, order_by: str) -> List[str]:
+    """
+    Returns the SELECT and FROM lines of a query selecting columns (e.g. Books.*) of Books
+    sorted by order_by; joins ExternalInfoStats if order_by or columns need it
+    """
+    query = [f"SELECT {columns}", "FROM Books"]
+    if order_by.startswith(f"{EXT_STATS_TABLE}.") or f"{EXT_STATS_TABLE}." in columns:
+        query.append(f"JOIN {EXT_STATS_TABLE} ON {EXT_STATS_TABLE}.id = Books.id")
+    return query
+
+
 def search_book_by_title(db_con,
                          title,
                          order_by="Books.id DESC",
-                         limit=-1, last_id=None):
-    # search title or title_eng?
-    # '%?%' doesnt work since ' disable ? and :name as placeholder
+                         limit=-1, last_id=None,
+                         title_trigram_index: Optional[TrigramIndex] = None):
     # You should use query parameters where possible, but query parameters can't be used to
     # supply table and column names or keywords.
     # In this case you need to use plain string formatting to build your query. If your
     # parameters (in this case sort criterium and order) come from user input you need to
     # validate it first
-    title_wildcarded = f"%{title}%"
-    vals_in_order = [title_wildcarded, title_wildcarded]
+    title_cond, vals_in_order = title_search_cond(title, title_trigram_index)
     if last_id is not None:
         keyset_pagination = f"AND id {'<' if order_by.endswith('DESC') else '>'} ?"
         vals_in_order.append(last_id)
@@ -55,8 +176,7 @@ def search_book_by_title(db_con,
 
     c = db_con.execute(f"""
                   SELECT * FROM Books
-                  WHERE title_eng LIKE ?
-                  OR title_foreign LIKE ?
+                  WHERE {title_cond}
                   {keyset_pagination}
                   ORDER BY {order_by}
                   LIMIT ?""", (*vals_in_order, limit))
@@ -65,70 +185,627 @@ def search_book_by_title(db_con,
     return rows
 
 
-def search_normal_mult_assoc(
-        db_con, normal_col_values: Dict[str, str], int_col_values_dict: Dict[str, List[str]],
-        ex_col_values_dict: Dict[str, List[str]], order_by: str = "Books.id DESC",
-        limit: int = -1,  # no row limit when limit is neg. nr
-        # TODO type prob incorrect since sometimes (13,) is passed etc.
-        after: Optional[Tuple[str, str]] = None,
-        before: Optional[Tuple[str, str]] = None):
-    """Can search in normal columns as well as multiple associated columns
-    (connected via bridge table) and both include and exclude them
-    :param normal_col_values: Dict that maps column names to search value
-    :param int_col_values: Dict that maps column names to search value
+@dataclass(frozen=True)
+class AssocValue:
+    """Book has the value name in the associated column col"""
+    col: str
+    name: str
+
+
+@dataclass(frozen=True)
+class ColumnCond:
     """
-    # @Cleanup mb split into multiple funcs that just return the conditional string
-    # like: WHERE title LIKE ? and the value, from_table_names etc.?
-    # @Cleanup convert this to use joins
-
-    grp_by: List[str] = []
-    having: List[str] = []
-    if int_col_values_dict:
-        # nr of items in values multiplied is nr of rows returned needed to match
-        # all conditions !! only include intersection vals
-        mul_values = prod((len(vals) for vals in int_col_values_dict.values()))
-        grp_by.append("Books.id")
-        having.append(f"COUNT(Books.id) = {mul_values}")
-
-    # containing table names for FROM .. stmt
-    table_bridge_names: List[str] = []
-    # conditionals
-    cond_statements: List[str] = []
-    # vals in order the stmts where inserted for sql param sub
-    vals_in_order: List[str] = []
-    # build conditionals for select string
-    for col, vals in int_col_values_dict.items():
-        table_name, bridge_col_name = joined_col_name_to_query_names(col)
-        table_bridge_names.append(table_name)
-        table_bridge_names.append(f"Book{table_name}")
+    Condition on a normal column of Books (or a pseudo-column like downloaded)
+    op is only used by RANGE_SEARCH_COLS: one of =, >, >=, <, <= or .. (value is lo..hi
+    where either bound may be omitted)
+    """
+    col: str
+    value: str
+    op: str = "="
+
+
+@dataclass(frozen=True)
+class Not:
+    node: "SearchNode"
+
+
+@dataclass(frozen=True)
+class And:
+    children: Tuple["SearchNode", ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    children: Tuple["SearchNode", ...]
+
+
+SearchNode = Union[AssocValue, ColumnCond, Not, And, Or]
 
-        cond_statements.append(f"{'AND' if cond_statements else 'WHERE'} "
-                               f"Books.id = Book{table_name}.book_id")
-        cond_statements.append(f"AND {table_name}.id = Book{table_name}.{bridge_col_name}")
-        cond_statements.append(f"AND {table_name}.name IN ({','.join(['?']*len(vals))})")
-        vals_in_order.extend(vals)
 
+def make_and(children: Iterable[SearchNode]) -> SearchNode:
+    flattened: List[SearchNode] = []
+    for child in children:
+        if isinstance(child, And):
+            flattened.extend(child.children)
+        else:
+            flattened.append(child)
+    return flattened[0] if len(flattened) == 1 else And(tuple(flattened))
+
+
+def make_or(children: Iterable[SearchNode]) -> SearchNode:
+    flattened: List[SearchNode] = []
+    for child in children:
+        if isinstance(child, Or):
+            flattened.extend(child.children)
+        else:
+            flattened.append(child)
+    return flattened[0] if len(flattened) == 1 else Or(tuple(flattened))
+
+
+def build_search_ast(normal_col_values: Dict[str, str],
+                     int_col_values_dict: Dict[str, List[str]],
+                     ex_col_values_dict: Dict[str, List[str]]) -> And:
+    children: List[SearchNode] = [ColumnCond(col, val) for col, val in normal_col_values.items()]
+    for col, vals in int_col_values_dict.items():
+        children.extend(AssocValue(col, val) for val in vals)
     for col, vals in ex_col_values_dict.items():
+        children.extend(Not(AssocValue(col, val)) for val in vals)
+    return And(tuple(children))
+
+
+def map_column_conds(node: SearchNode,
+                     func: Callable[[ColumnCond], Optional[ColumnCond]]) -> Optional[SearchNode]:
+    """
+    Returns a copy of the AST with all ColumnConds replaced by the result of func
+    ColumnConds for which func returns None are removed (as well as And/Or/Not nodes
+    that end up empty)
+    """
+    if isinstance(node, ColumnCond):
+        return func(node)
+    elif isinstance(node, Not):
+        inner = map_column_conds(node.node, func)
+        return None if inner is None else Not(inner)
+    elif isinstance(node, (And, Or)):
+        children = [mapped for mapped in (map_column_conds(child, func)
+                                          for child in node.children)
+                    if mapped is not None]
+        if not children:
+            return None
+        return make_and(children) if isinstance(node, And) else make_or(children)
+    else:
+        return node
+
+
+# columns that support comparisons/ranges and their value types
+# upload_date is on ExternalInfo; a book matches if any of its ext infos does
+RANGE_SEARCH_COLS = {"pages": int, "my_rating": float, "last_change": datetime.date,
+                     "upload_date": datetime.date}
+RANGE_OP_RE = re.compile(r"^(>=|<=|>|<|=)?(.*)$")
+
+
+def date_bounds(value: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns the first day of the period value (YYYY, YYYY-MM or YYYY-MM-DD) and the first
+    day after it as ISO date strings or None if value isn't a valid date
+    """
+    try:
+        parts = [int(part) for part in value.split("-")]
+        if len(parts) == 1:
+            start = datetime.date(parts[0], 1, 1)
+            end = datetime.date(parts[0] + 1, 1, 1)
+        elif len(parts) == 2:
+            year, month = parts
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year + month // 12, month % 12 + 1, 1)
+        elif len(parts) == 3:
+            start = datetime.date(*parts)
+            end = start + datetime.timedelta(days=1)
+        else:
+            return None
+    except (ValueError, OverflowError):
+        return None
+    return start.isoformat(), end.isoformat()
+
+
+def range_comparisons(cond: ColumnCond) -> Optional[List[Tuple[str, object]]]:
+    """
+    Converts a ColumnCond on one of the RANGE_SEARCH_COLS into a list of
+    (comparison operator, value) tuples that all have to be true
+    Dates match whole periods, e.g. last_change:<=2024-06 includes all of June
+    Returns None if a value is invalid
+    """
+    value_type = RANGE_SEARCH_COLS[cond.col]
+    if cond.op == "..":
+        lo, hi = cond.value.split("..", 1)
+        bounds = [(">=", lo), ("<=", hi)]
+    else:
+        bounds = [(cond.op, cond.value)]
+
+    comparisons: List[Tuple[str, object]] = []
+    for op, value in bounds:
+        if not value and cond.op == "..":
+            # open range
+            continue
+        if value_type is datetime.date:
+            period = date_bounds(value)
+            if period is None:
+                return None
+            start, end = period
+            if op == "=":
+                comparisons.extend(((">=", start), ("<", end)))
+            elif op == ">":
+                comparisons.append((">=", end))
+            elif op == ">=":
+                comparisons.append((">=", start))
+            elif op == "<":
+                comparisons.append(("<", start))
+            else:
+                comparisons.append(("<", end))
+        else:
+            try:
+                comparisons.append((op, value_type(value)))
+            except ValueError:
+                return None
+    return comparisons or None
+
+
+def parse_range_cond(col: str, value: str) -> Optional[ColumnCond]:
+    if ".." in value:
+        cond = ColumnCond(col, value, "..")
+    else:
+        op, value = RANGE_OP_RE.match(value).groups()
+        cond = ColumnCond(col, value, op or "=")
+    if range_comparisons(cond) is None:
+        logger.info("'%s' is not a valid value for %s", value, col)
+        return None
+    return cond
+
+
+SEARCH_TOKEN_RE = re.compile(
+        r'\s*(?:(?P<lparen>\()|(?P<rparen>\))|(?P<or>\|)|"(?P<quoted>[^"]*)"?'
+        r'|(?P<word>[^\s()|"]+))')
+
+
+def tokenize_search(search_str: str) -> List[Tuple[str, str]]:
+    """
+    Splits search_str into (kind, text) tuples where kind is one of
+    lparen, rparen, or, quoted or word
+    """
+    tokens = []
+    for match in SEARCH_TOKEN_RE.finditer(search_str.strip()):
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        text = match.group(kind)
+        if kind == "word" and text == "OR":
+            kind = "or"
+        tokens.append((kind, text))
+    return tokens
+
+
+class SearchParser:
+    """
+    Parses a search string into an AST
+
+    Grammar (AND is implicit, the keywords AND/OR have to be upper case):
+        expr   := and_expr (('|' | 'OR') and_expr)*
+        and_expr := unary (['AND'] unary)*
+        unary  := '-' unary | '(' expr ')' | col ':' value | col ':' '(' expr ')' | word
+    Inside col:( ... ) bare words are values of col, adjacent words form a single value.
+    A value of an associated column can be a list of values separated by delimiter
+    that all have to be present, values starting with ! are excluded (e.g. tag:A;B;!C).
+    Bare words outside of col: are combined into a title search
+    """
+
+    def __init__(self, valid_cols: Iterable[str], assoc_cols: Iterable[str],
+                 delimiter: str = ";"):
+        self.valid_cols = set(valid_cols)
+        self.assoc_cols = set(assoc_cols)
+        self.delimiter = delimiter
+        self.tokens: List[Tuple[str, str]] = []
+        self.pos = 0
+
+    def parse(self, search_str: str) -> SearchNode:
+        self.tokens = tokenize_search(search_str)
+        self.pos = 0
+        parts = []
+        while self._peek() is not None:
+            node = self._expr(None)
+            if node is not None:
+                parts.append(node)
+            if self._peek() is not None:
+                # unmatched closing parenthesis
+                self.pos += 1
+        # empty search is an empty And
+        return make_and(parts) if parts else And(())
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expr(self, col: Optional[str]) -> Optional[SearchNode]:
+        branches = []
+        node = self._and_expr(col)
+        if node is not None:
+            branches.append(node)
+        while self._peek() is not None and self._peek()[0] == "or":
+            self.pos += 1
+            node = self._and_expr(col)
+            if node is not None:
+                branches.append(node)
+        return make_or(branches) if branches else None
+
+    def _and_expr(self, col: Optional[str]) -> Optional[SearchNode]:
+        children: List[SearchNode] = []
+        # title words are combined into one title search, values in col:( ... ) only
+        # if they're adjacent
+        words: List[str] = []
+
+        def add_words():
+            if words:
+                words_node = self._bare_words(col, words)
+                # title search goes first
+                if words_node is not None and col is None:
+                    children.insert(0, words_node)
+                elif words_node is not None:
+                    children.append(words_node)
+                words.clear()
+
+        while self._peek() is not None and self._peek()[0] not in ("or", "rparen"):
+            node = self._unary(col)
+            if isinstance(node, str):
+                words.append(node)
+                continue
+            if col is not None:
+                add_words()
+            if node is not None:
+                children.append(node)
+        add_words()
+        return make_and(children) if children else None
+
+    def _bare_words(self, col: Optional[str], words: List[str]) -> Optional[SearchNode]:
+        if col is None:
+            return ColumnCond("title", " ".join(words))
+        return self._value(col, " ".join(words))
+
+    def _group(self, col: Optional[str]) -> Optional[SearchNode]:
+        node = self._expr(col)
+        # tolerate a missing closing parenthesis
+        if self._peek() is not None and self._peek()[0] == "rparen":
+            self.pos += 1
+        return node
+
+    def _unary(self, col: Optional[str]) -> Union[SearchNode, str, None]:
+        """Returns a node, a bare word (str) or None if the token should be ignored"""
+        kind, text = self._next()
+        if kind == "lparen":
+            return self._group(col)
+        elif kind == "rparen" or kind == "or":
+            return None
+        elif kind == "quoted":
+            if col is None:
+                return text
+            return self._value(col, text)
+
+        if text == "AND":
+            return None
+        elif text.startswith("-") and (len(text) > 1 or
+                                       (self._peek() is not None and
+                                        self._peek()[0] == "lparen")):
+            if len(text) > 1:
+                # re-parse the rest of the word
+                self.tokens[self.pos - 1] = (kind, text[1:])
+                self.pos -= 1
+            node = self._unary(col)
+            if isinstance(node, str):
+                node = self._bare_words(col, [node])
+            return Not(node) if node is not None else None
+        elif ":" in text:
+            search_col, value = text.split(":", 1)
+            if search_col not in self.valid_cols:
+                logger.info("'%s' is not a supported search type!", search_col)
+                search_col = None
+            if value:
+                return None if search_col is None else self._value(search_col, value)
+            # value is in the next token
+            next_token = self._peek()
+            if next_token is None:
+                return None
+            elif next_token[0] == "lparen":
+                self.pos += 1
+                node = self._group(search_col)
+                return None if search_col is None else node
+            elif next_token[0] in ("quoted", "word"):
+                self.pos += 1
+                return None if search_col is None else self._value(search_col, next_token[1])
+            return None
+        else:
+            return text
+
+    def _value(self, col: Optional[str], value: str) -> Optional[SearchNode]:
+        if col is None:
+            return None
+        elif col in self.assoc_cols:
+            children: List[SearchNode] = [
+                    Not(AssocValue(col, v[1:])) if v.startswith("!") else AssocValue(col, v)
+                    for v in value.split(self.delimiter) if v.lstrip("!")]
+            return make_and(children) if children else None
+        elif col in RANGE_SEARCH_COLS:
+            return parse_range_cond(col, value)
+        else:
+            return ColumnCond(col, value)
+
+
+def assoc_usage_counts(db_con, col: str, names: Iterable[str]) -> Dict[str, int]:
+    """
+    Returns a dict mapping the names (nocase) of the values in the associated column col
+    to the nr of books they're on, names that aren't present are missing from the result
+    Uses the book_count column that is maintained by triggers so it's one index lookup
+    per name
+    """
+    table_name, _ = joined_col_name_to_query_names(col)
+    names = list(names)
+    c = db_con.execute(f"""
+        SELECT name, book_count
+        FROM {table_name}
+        WHERE name IN ({', '.join(['?'] * len(names))})""", names)
+    return {nocase(name): count for name, count in c.fetchall()}
+
+
+class SearchCompiler:
+    """
+    Compiles a search AST into a SQL condition on Books (without a leading WHERE)
+    Associated column values are either resolved using the in-memory posting lists (if
+    few enough books match to put their ids into the statement) or turned into
+    semi-joins (EXISTS/IN subqueries on the bridge tables) ordered by selectivity:
+    the rarest included value drives the query and the rest are only checked for
+    those candidates, so a broad tag combined with a rare one stays cheap
+    Compiled conditions are cached per AST until the database is modified, since
+    the selectivity estimates and posting lists depend on the data
+    """
+
+    PLAN_CACHE_SIZE = 128
+    # max nr of book ids resolved using the posting lists that are put into a statement,
+    # above that the values are checked using semi-joins instead
+    MAX_INLINE_IDS = 1000
+
+    def __init__(self, db_con,
+                 title_trigram_index: Optional[TrigramIndex] = None,
+                 posting_lists: Optional[PostingListIndex] = None,
+                 usage_counts: Optional[Callable[[str, Iterable[str]], Dict[str, int]]] = None):
+        self.db_con = db_con
+        self.title_trigram_index = title_trigram_index
+        self.posting_lists = posting_lists
+        self.usage_counts = usage_counts or partial(assoc_usage_counts, db_con)
+        self._plan_cache = LRUCache(db_con, maxsize=self.PLAN_CACHE_SIZE)
+
+    def compile(self, node: SearchNode) -> Tuple[str, List]:
+        cached = self._plan_cache.get(node)
+        if cached is None:
+            # a single value drives the query like in an AND so it starts from the value
+            # (index seek on the bridge table) instead of checking every book
+            cached = self._compile(And((node,)) if isinstance(node, AssocValue) else node)
+            self._plan_cache.put(node, cached)
+        cond, vals = cached
+        # copy since callers extend the vals
+        return cond, list(vals)
+
+    def _compile(self, node: SearchNode) -> Tuple[str, List]:
+        if isinstance(node, And):
+            return self._compile_and(node)
+        elif isinstance(node, Or):
+            return self._compile_or(node)
+        elif isinstance(node, Not):
+            cond, vals = self._compile(node.node)
+            return f"NOT {cond}", vals
+        elif isinstance(node, AssocValue):
+            return self._assoc_values_cond(node.col, [node.name])
+        elif isinstance(node, ColumnCond):
+            return self._column_cond(node)
+        else:
+            raise TypeError(f"Unsupported search node: {node!r}")
+
+    def _resolve_ids(self, node: SearchNode) -> Optional[Set[int]]:
+        """
+        Resolves the ids of the books matching node using the posting lists
+        Returns None if that's not possible (node contains conditions on other columns,
+        or a negation without anything to subtract it from)
+        """
+        if self.posting_lists is None:
+            return None
+        elif isinstance(node, AssocValue):
+            return set(self.posting_lists.book_ids(node.col, node.name))
+        elif isinstance(node, Or):
+            result: Set[int] = set()
+            for child in node.children:
+                ids = self._resolve_ids(child)
+                if ids is None:
+                    return None
+                result |= ids
+            return result
+        elif isinstance(node, And):
+            included, excluded = [], []
+            for child in node.children:
+                if isinstance(child, Not):
+                    ids = self._resolve_ids(child.node)
+                    excluded.append(ids)
+                else:
+                    ids = self._resolve_ids(child)
+                    included.append(ids)
+                if ids is None:
+                    return None
+            if not included:
+                return None
+            return self._intersect(included) - set().union(*excluded)
+        else:
+            return None
+
+    def estimate_count(self, node: SearchNode, total: int) -> int:
+        """
+        Estimates the nr of books out of total that match node without running the search
+        Uses the posting lists where possible and otherwise assumes that the conditions are
+        independent, with the selectivity of associated values taken from their usage
+        counts; conditions on other columns are assumed to match all books
+        """
+        if total <= 0:
+            return 0
+        return round(self._selectivity(node, total) * total)
+
+    def _selectivity(self, node: SearchNode, total: int) -> float:
+        ids = self._resolve_ids(node)
+        if ids is not None:
+            return len(ids) / total
+        elif isinstance(node, AssocValue):
+            return min(self._estimate([node])[node] / total, 1.0)
+        elif isinstance(node, Not):
+            return 1.0 - self._selectivity(node.node, total)
+        elif isinstance(node, And):
+            result = 1.0
+            for child in node.children:
+                result *= self._selectivity(child, total)
+            return result
+        elif isinstance(node, Or):
+            result = 1.0
+            for child in node.children:
+                result *= 1.0 - self._selectivity(child, total)
+            return 1.0 - result
+        else:
+            return 1.0
+
+    @staticmethod
+    def _intersect(sets: List[Set[int]]) -> Set[int]:
+        # start with the smallest set so the intermediate results stay small
+        sets = sorted(sets, key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
+
+    def _estimate(self, values: List[AssocValue]) -> Dict[AssocValue, int]:
+        if self.posting_lists is not None:
+            # values only get here if they match too many books to be inlined
+            # -> exact counts for ordering the semi-joins
+            return {value: len(self.posting_lists.book_ids(value.col, value.name))
+                    for value in values}
+        names_by_col: Dict[str, List[str]] = defaultdict(list)
+        for value in values:
+            names_by_col[value.col].append(value.name)
+        # the same name can be used in different columns -> key by both
+        counts: Dict[Tuple[str, str], int] = {}
+        for col, names in names_by_col.items():
+            counts.update(((col, name), count)
+                          for name, count in self.usage_counts(col, names).items())
+        return {value: counts.get((value.col, nocase(value.name)), 0) for value in values}
+
+    def _compile_and(self, node: And) -> Tuple[str, List]:
+        conds: List[str] = []
+        vals: List = []
+
+        children = list(node.children)
+        if self.posting_lists is not None:
+            included_ids: List[Set[int]] = []
+            excluded_ids: List[Set[int]] = []
+            rest = []
+            for child in children:
+                if isinstance(child, Not):
+                    ids = self._resolve_ids(child.node)
+                    if ids is not None:
+                        excluded_ids.append(ids)
+                        continue
+                else:
+                    ids = self._resolve_ids(child)
+                    if ids is not None:
+                        included_ids.append(ids)
+                        continue
+                rest.append(child)
+
+            if included_ids:
+                ids = self._intersect(included_ids) - set().union(*excluded_ids)
+                op = "IN"
+            else:
+                ids = set().union(*excluded_ids)
+                op = "NOT IN"
+            # ids are ints so it's safe to put them into the statement directly
+            # (also avoids hitting the max nr of host parameters)
+            # too many would make the statement huge and expensive to parse
+            # -> keep the children for the semi-joins
+            if len(ids) <= self.MAX_INLINE_IDS:
+                if included_ids or excluded_ids:
+                    conds.append(f"Books.id {op} ({', '.join(str(i) for i in sorted(ids))})")
+                children = rest
+
+        included = [child for child in children if isinstance(child, AssocValue)]
+        excluded = [child for child in children
+                    if isinstance(child, Not) and isinstance(child.node, AssocValue)]
+        others = [child for child in children
+                  if child not in included and child not in excluded]
+
+        if included:
+            estimates = self._estimate(included)
+            included.sort(key=lambda value: estimates[value])
+            # rarest value drives the query
+            driving = included[0]
+            table_name, bridge_col_name = joined_col_name_to_query_names(driving.col)
+            conds.append(f"""Books.id IN (
+                    SELECT bx.book_id FROM Book{table_name} bx
+                    JOIN {table_name} ON {table_name}.id = bx.{bridge_col_name}
+                    WHERE {table_name}.name = ?)""")
+            vals.append(driving.name)
+
+        # cheap conditions on Books go before the subqueries
+        for child in others + included[1:] + excluded:
+            cond, cond_vals = self._compile(child)
+            conds.append(cond)
+            vals.extend(cond_vals)
+
+        if not conds:
+            return "1", vals
+        return (conds[0] if len(conds) == 1 else f"({' AND '.join(conds)})"), vals
+
+    def _compile_or(self, node: Or) -> Tuple[str, List]:
+        ids = self._resolve_ids(node)
+        if ids is not None and len(ids) <= self.MAX_INLINE_IDS:
+            return f"Books.id IN ({', '.join(str(i) for i in sorted(ids))})", []
+
+        conds: List[str] = []
+        vals: List = []
+        # values of the same associated column are checked with a single subquery
+        names_by_col: Dict[str, List[str]] = defaultdict(list)
+        for child in node.children:
+            if isinstance(child, AssocValue):
+                names_by_col[child.col].append(child.name)
+            else:
+                cond, cond_vals = self._compile(child)
+                conds.append(cond)
+                vals.extend(cond_vals)
+        for col, names in names_by_col.items():
+            cond, cond_vals = self._assoc_values_cond(col, names)
+            conds.append(cond)
+            vals.extend(cond_vals)
+
+        return f"({' OR '.join(conds)})", vals
+
+    def _assoc_values_cond(self, col: str, names: List[str]) -> Tuple[str, List]:
+        """Book has any of the names in the associated column col"""
         table_name, bridge_col_name = joined_col_name_to_query_names(col)
-        cond_statements.append(f"""
-                 {'AND' if cond_statements else 'WHERE'} Books.id NOT IN (
-                          SELECT Books.id
-                          FROM Book{table_name} bx, Books, {table_name}
-                          WHERE Books.id = bx.book_id
-                          AND bx.{bridge_col_name} = {table_name}.id
-                          AND {table_name}.name IN ({', '.join(['?']*len(vals))})
-                )""")
-        vals_in_order.extend(vals)
-
-    # normal col conditions
-    for col, val in normal_col_values.items():
-        # use pattern match for title
+        # uses the (book_id, x_id) primary key of the bridge table
+        return (f"""EXISTS (
+                    SELECT 1 FROM Book{table_name} bx
+                    JOIN {table_name} ON {table_name}.id = bx.{bridge_col_name}
+                    WHERE bx.book_id = Books.id
+                    AND {table_name}.name IN ({', '.join(['?'] * len(names))}))""", names)
+
+    def _column_cond(self, node: ColumnCond) -> Tuple[str, List]:
+        col, val = node.col, node.value
+        # use full-text index for title
         if col.startswith("title"):
-            title_wildcarded = f"%{val}%"
-            cond_statements.append(
-                    f"{'AND' if cond_statements else 'WHERE'} (Books.title_eng LIKE ? "
-                    "OR Books.title_foreign LIKE ?)")
-            vals_in_order.extend([title_wildcarded]*2)
+            return title_search_cond(val, self.title_trigram_index)
         elif col == "read_status":
             # TODO include chapter_status?
             if val == "read":
@@ -137,37 +814,69 @@ def search_normal_mult_assoc(
                 read_cond = "IS NULL"
             else:
                 read_cond = "> 0"
-
-            cond_statements.append(
-                    f"{'AND' if cond_statements else 'WHERE'} Books.read_status {read_cond}")
+            return f"Books.read_status {read_cond}", []
         elif col == "downloaded":
-            # need to use a separate subquery for this since joining with ExternalInfo
-            # in order to check ei.downloaded where we use having sum(ei.downloaded) > 0
-            # to check if a book counts as dled, gets mixed up with checking the counts
-            # for having the correct number of assoc values present for int_col_values
-            cond_statements.append(f"""
-                {'AND' if cond_statements else 'WHERE'}
-                (
-                    SELECT count(*) FROM ExternalInfo ei
+            # a book counts as downloaded if any of its ext infos is
+            return (f"""{'NOT ' if val == '0' else ''}EXISTS (
+                    SELECT 1 FROM ExternalInfo ei
                     WHERE ei.book_id = Books.id
-                    AND ei.downloaded > 0
-                ) {'=' if val == '0' else '>'} 0""")
+                    AND ei.downloaded > 0)""", [])
+        elif col in RANGE_SEARCH_COLS:
+            return self._range_cond(node)
         else:
-            cond_statements.append(f"{'AND' if cond_statements else 'WHERE'} Books.{col} = ?")
-            vals_in_order.append(val)
-
-    table_bridge_names_str = ", ".join(table_bridge_names)
-    cond_statements_str = "\n".join(cond_statements)
-
-    query = [
-        "SELECT Books.*",
-        f"FROM Books{',' if table_bridge_names_str else ''} {table_bridge_names_str}",
-    ]
-    query.append(cond_statements_str)
-    if grp_by:
-        query.append(f"GROUP BY {', '.join(grp_by)}")
-    if having:
-        query.append(f"HAVING {' AND '.join(having)}")
+            return f"Books.{col} = ?", [val]
+
+    @staticmethod
+    def _range_cond(node: ColumnCond) -> Tuple[str, List]:
+        comparisons = range_comparisons(node)
+        if comparisons is None:
+            raise ValueError(f"Invalid value for {node.col}: {node.value}")
+        col_expr = "ei.upload_date" if node.col == "upload_date" else f"Books.{node.col}"
+        cond = " AND ".join(f"{col_expr} {op} ?" for op, _ in comparisons)
+        vals = [value for _, value in comparisons]
+        if node.col == "upload_date":
+            # IN instead of EXISTS so the index on upload_date drives the subquery
+            return (f"Books.id IN (SELECT ei.book_id FROM ExternalInfo ei WHERE {cond})",
+                    vals)
+        return (cond if len(comparisons) == 1 else f"({cond})"), vals
+
+
+def search_normal_mult_assoc(
+        db_con, normal_col_values: Dict[str, str], int_col_values_dict: Dict[str, List[str]],
+        ex_col_values_dict: Dict[str, List[str]], order_by: str = "Books.id DESC",
+        limit: int = -1,  # no row limit when limit is neg. nr
+        # TODO type prob incorrect since sometimes (13,) is passed etc.
+        after: Optional[Tuple[str, str]] = None,
+        before: Optional[Tuple[str, str]] = None,
+        title_trigram_index: Optional[TrigramIndex] = None,
+        posting_lists: Optional[PostingListIndex] = None):
+    """Can search in normal columns as well as multiple associated columns
+    (connected via bridge table) and both include and exclude them
+    :param normal_col_values: Dict that maps column names to search value
+    :param int_col_values: Dict that maps column names to search value
+    :param title_trigram_index: In-memory trigram index to use for CJK title searches
+                                if there's no FTS5 trigram table
+    :param posting_lists: In-memory index used to resolve the associated columns
+                          to book ids instead of joining the bridge tables
+    """
+    ast = build_search_ast(normal_col_values, int_col_values_dict, ex_col_values_dict)
+    compiler = SearchCompiler(db_con, title_trigram_index=title_trigram_index,
+                              posting_lists=posting_lists)
+    return search_ast(db_con, compiler, ast, order_by=order_by, limit=limit,
+                      after=after, before=before)
+
+
+def search_ast(db_con, compiler: SearchCompiler, ast: SearchNode,
+               order_by: str = "Books.id DESC", limit: int = -1,
+               after: Optional[Tuple[str, str]] = None,
+               before: Optional[Tuple[str, str]] = None,
+               columns: str = "Books.*"):
+    cond, vals_in_order = compiler.compile(ast)
+    query = select_from_books(columns, order_by)
+    # empty AND
+    has_cond = cond != "1"
+    if has_cond:
+        query.append(f"WHERE {cond}")
     query.append(f"ORDER BY {order_by}")
     query.append("LIMIT ?")
 
@@ -175,7 +884,7 @@ def search_normal_mult_assoc(
     # keyset param in sql substitution)
     final_query, vals_in_order = keyset_pagination_statment(
             query, vals_in_order, after=after, before=before,
-            order_by=order_by, first_cond=not bool(cond_statements)
+            order_by=order_by, first_cond=not has_cond
             )
     c = db_con.execute(final_query, (*vals_in_order, limit))
     rows = c.fetchall()
@@ -228,17 +937,14 @@ def keyset_pagination_statment(query: List[str], vals_in_order: List[str],
     insert_before = [i for i, l in enumerate(query) if l.startswith("GROUP BY") or
                      l.startswith("ORDER BY")][0]
     un_unique_sort_col = "books.id" not in order_by.lower()
+    # table of the sorting column (might not be Books e.g. ExternalInfoStats); its id is
+    # used as secondary sorting column so the indices on the sorting cols can be used
+    sort_table = order_by.split('.')[0]
     if un_unique_sort_col:
         order_by_col = order_by.split(' ')[0]
         # 2-tuple of (primary, secondary)
         # casting to non-null didn't work so have to ignore here
         primary, secondary = after if after is not None else before  # type: ignore
-        # if primary is NULL we need IS NULL as "equals comparison operator" since
-        # normal comparisons with NULL are always False
-        if primary is None:
-            equal_comp = "IS NULL"
-        else:
-            equal_comp = "== ?"
         # for ASCENDING order:
         # slqite sorts NULLS first by default -> when e.g. going forwards in ASC order
         # and we have a NULL value for primary sorting col as last row/book on page
@@ -276,18 +982,29 @@ def keyset_pagination_statment(query: List[str], vals_in_order: List[str],
             # DESC: include NOT NULLs when going backwards unless we already had a
             #       NOT NULL on the page
             null_clause = f"OR ({order_by_col} IS NOT NULL)" if primary is None else ""
+        if order_by_col in NOT_NULL_ORDER_BY:
+            # sqlite would have to scan the whole index from the start to find NULLs
+            null_clause = ""
 
         # since we sort by both the primary order by and the id to make the sort unique
         # we need to check for rows matching the value of the sort col -> then we use the id to
         # have a correct sort
+        # for a NOT NULL primary we use a row value comparison which is equivalent to
+        # (primary_col > ? OR (primary_col == ? AND id > ?)) but sqlite can use it for a
+        # range scan on the index of the sort col so we don't have to scan all the rows
+        # on the previous pages (if there's no null_clause)
+        # if primary is NULL we need IS NULL as "equals comparison operator" since
+        # normal comparisons with NULL are always False
+        if primary is None:
+            keyset_cond = f"({order_by_col} IS NULL AND {sort_table}.id {comp} ?)"
+            vals_in_order.append(secondary)
+        else:
+            keyset_cond = f"({order_by_col}, {sort_table}.id) {comp} (?, ?)"
+            vals_in_order.extend((primary, secondary))
         # parentheses around the whole statement important otherwise rows fullfilling the OR
         # statement will get included when searching even if they dont fullfill the rest
-        keyset_pagination = (f"{'WHERE' if first_cond else 'AND'} ({order_by_col} {comp} ? "
-                             f"OR ({order_by_col} {equal_comp} AND Books.id {comp} ?) "
+        keyset_pagination = (f"{'WHERE' if first_cond else 'AND'} ({keyset_cond} "
                              f"{null_clause})")
-        # we only need primare 2 times if we compare by a value with ==
-        vals_in_order.extend((primary, primary, secondary) if equal_comp.startswith("==")  # type: ignore
-                             else (primary, secondary))
     else:
         keyset_pagination = f"{'WHERE' if first_cond else 'AND'} Books.id {comp} ?"
         # if vals_in_order is not None:
@@ -304,15 +1021,105 @@ def keyset_pagination_statment(query: List[str], vals_in_order: List[str],
         # need to reverse order in query to not get results starting from first one possible
         # to before(id) but rather to get limit nr of results starting from before(id)
         result = result.replace(f"{' ASC' if asc else ' DESC'}", f"{' DESC' if asc else ' ASC'}")
-        result = f"""
-            SELECT *
-            FROM (
-                {result}
-            ) AS t
-            ORDER BY {order_by.replace('Books.', 't.')}"""
-        if un_unique_sort_col:
+        if sort_table == "Books":
             # since were using a subquery we need to modify our order by to use the AS tablename
+            outer_order_by = order_by.replace('Books.', 't.')
+            result = f"""
+                SELECT *
+                FROM (
+                    {result}
+                ) AS t
+                ORDER BY {outer_order_by}"""
+        else:
+            # sorting col isn't part of the subquery's columns -> join its table again
+            outer_order_by = order_by
+            result = f"""
+                SELECT t.*
+                FROM (
+                    {result}
+                ) AS t
+                JOIN {sort_table} ON {sort_table}.id = t.id
+                ORDER BY {outer_order_by}"""
+        if un_unique_sort_col:
             # @Cleanup splitlines after we joined before
-            result = insert_order_by_id(result.splitlines(), order_by.replace("Books.", "t."))
+            result = insert_order_by_id(result.splitlines(), outer_order_by)
 
     return result, vals_in_order
+
+
+def count_ast(db_con, compiler: SearchCompiler, ast: SearchNode) -> int:
+    """Returns the nr of books matching ast using the same compiled condition as search_ast"""
+    cond, vals = compiler.compile(ast)
+    c = db_con.execute(f"""
+        SELECT COUNT(*) FROM Books
+        {f'WHERE {cond}' if cond != '1' else ''}""", vals)
+    count, = c.fetchone()
+    return count
+
+
+def facet_counts(db_con, compiler: SearchCompiler, ast: SearchNode, cols: List[str],
+                 top_n: int = 10) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Counts how many books matching ast have each value of the associated columns in cols
+    Returns a dict mapping the column name to a list of the top_n (name, count) tuples
+    All columns are computed with a single statement so the search only runs once
+    """
+    cond, vals = compiler.compile(ast)
+    if cond == "1":
+        # all books match -> the facets are just the usage counts of the values
+        return usage_facets(db_con, cols, top_n=top_n)
+    # force SQLite to only compute the matching ids once (supported since 3.35.0)
+    materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
+    selects = []
+    for col in cols:
+        table_name, bridge_col_name = joined_col_name_to_query_names(col)
+        # compound SELECTs can't have ORDER BY/LIMIT themselves -> wrap in subquery
+        selects.append(f"""
+            SELECT * FROM (
+                SELECT ? AS col, {table_name}.name AS name, COUNT(*) AS nr
+                FROM matched
+                JOIN Book{table_name} bx ON bx.book_id = matched.id
+                JOIN {table_name} ON {table_name}.id = bx.{bridge_col_name}
+                GROUP BY {table_name}.id
+                ORDER BY nr DESC, name
+                LIMIT ?
+            )""")
+        vals.extend((col, top_n))
+
+    c = db_con.execute(f"""
+        WITH matched AS {materialized}(
+            SELECT Books.id FROM Books
+            {f'WHERE {cond}' if cond != '1' else ''}
+        )
+        {'UNION ALL'.join(selects)}""", vals)
+
+    result: Dict[str, List[Tuple[str, int]]] = {col: [] for col in cols}
+    for col, name, count in c.fetchall():
+        result[col].append((name, count))
+    return result
+
+
+def usage_facets(db_con, cols: List[str], top_n: int = 10) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Returns a dict mapping the associated columns in cols to a list of their top_n most
+    used values as (name, nr of books) tuples, read from the book_count columns
+    """
+    selects = []
+    vals: List = []
+    for col in cols:
+        table_name, _ = joined_col_name_to_query_names(col)
+        selects.append(f"""
+            SELECT * FROM (
+                SELECT ? AS col, name, book_count AS nr
+                FROM {table_name}
+                WHERE book_count > 0
+                ORDER BY nr DESC, name
+                LIMIT ?
+            )""")
+        vals.extend((col, top_n))
+
+    c = db_con.execute('UNION ALL'.join(selects), vals)
+    result: Dict[str, List[Tuple[str, int]]] = {col: [] for col in cols}
+    for col, name, count in c.fetchall():
+        result[col].append((name, count))
+    return result
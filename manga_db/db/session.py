@@ -0,0 +1,103 @@
+import logging
+
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Tuple, Type
+
+from .constants import Relationship
+from .row import DBRow
+
+if TYPE_CHECKING:
+    from ..manga_db import MangaDB
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    Unit of work: collects instances and writes their changes to the DB all at once when
+    flushed, see MangaDB.session which flushes it in one transaction
+    New instances are inserted grouped by table in dependency order (FLUSH_ORDER) first,
+    the changes (_committed_state) of the instances that are in the DB are grouped by
+    table and changed columns so they can be written using executemany
+    """
+
+    def __init__(self, manga_db: 'MangaDB'):
+        self.manga_db = manga_db
+        # id -> instance so instances don't need to be hashable; keeps the order they
+        # were added in
+        self._instances: Dict[int, DBRow] = {}
+        # new instances saved by flush with the state they had before, so saving them
+        # can be undone if the transaction gets rolled back
+        self._inserted: List[Tuple[DBRow, Dict[str, Any], Dict[str, Any]]] = []
+
+    def add(self, *instances: DBRow) -> None:
+        for instance in instances:
+            self._instances[id(instance)] = instance
+
+    def __len__(self) -> int:
+        return len(self._instances)
+
+    def flush(self) -> List[DBRow]:
+        """
+        Writes the changes of all the instances to the DB without committing
+        Returns the instances whose changes were written by this call, their
+        _committed_state needs to be reset after the transaction was committed
+        """
+        instances = list(self._instances.values())
+        self._instances.clear()
+
+        new = [i for i in instances if not i._in_db]
+        self._inserted = [
+            (i, {name: vars(i).get(name) for name, _ in i._column_types()},
+             dict(i._committed_state))
+            for i in {id(i): i for i in self._with_new_children(new)}.values()]
+        new_by_cls: Dict[Type[DBRow], List[DBRow]] = defaultdict(list)
+        for instance in new:
+            new_by_cls[type(instance)].append(instance)
+        for cls in sorted(new_by_cls, key=lambda cls: cls.FLUSH_ORDER):
+            # saving a book also saves its new ext infos -> check _in_db again when saving
+            to_insert = [i for i in new_by_cls[cls] if not i._in_db]
+            if to_insert:
+                cls._flush_inserts(self.manga_db, to_insert)
+                logger.debug("Inserted %d %s rows", len(to_insert), cls.TABLENAME)
+
+        dirty: Dict[Type[DBRow], List[DBRow]] = defaultdict(list)
+        for instance in instances:
+            if instance._in_db and instance._committed_state:
+                dirty[type(instance)].append(instance)
+        flushed = []
+        for cls in sorted(dirty, key=lambda cls: cls.FLUSH_ORDER):
+            cls._flush_updates(self.manga_db, dirty[cls])
+            flushed.extend(dirty[cls])
+            logger.debug("Flushed the changes of %d %s rows", len(dirty[cls]), cls.TABLENAME)
+
+        return flushed
+
+    @staticmethod
+    def _with_new_children(instances: List[DBRow]) -> Iterator[DBRow]:
+        """
+        Yields instances and the new instances of their loaded one-to-many associated
+        columns, which get saved together with them (e.g. a book's ext infos)
+        """
+        for instance in instances:
+            yield instance
+            for col in getattr(instance, "ASSOCIATED_COLUMNS", []):
+                descriptor = getattr(type(instance), col)
+                if (descriptor.relationship is Relationship.ONETOMANY and
+                        descriptor.is_loaded(instance)):
+                    yield from (i for i in getattr(instance, col) if not i._in_db)
+
+    def rollback(self) -> None:
+        """
+        Undoes saving the new instances of the last flush after its transaction was rolled
+        back: they're removed from the IdentityMap and get their columns (e.g. id) and
+        _committed_state back so they can be saved again
+        """
+        for instance, columns, committed_state in self._inserted:
+            if instance._in_db:
+                # key uses the id that's about to be reset
+                self.manga_db.id_map.discard(instance.key)
+                instance._in_db = False
+            vars(instance).update(columns)
+            instance._committed_state = committed_state
+        self._inserted = []
@@ -0,0 +1,109 @@
+import logging
+
+from collections import defaultdict
+from typing import Dict, Set, List, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# FTS5 table (external content table on Books) using the trigram tokenizer
+TITLE_TRIGRAM_TABLE = "BooksTitleTrigram"
+# the trigram tokenizer can't match anything shorter than a trigram
+MIN_SUBSTRING_LEN = 3
+
+
+def has_trigram_table(db_con) -> bool:
+    c = db_con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (TITLE_TRIGRAM_TABLE,))
+    return c.fetchone() is not None
+
+
+def trigrams(string: str) -> Set[str]:
+    return {string[i:i + 3] for i in range(len(string) - 2)}
+
+
+class TrigramIndex:
+    """
+    Pure-Python fallback for the FTS5 trigram index on the book titles, used when
+    the SQLite build lacks the trigram tokenizer
+    Maps every (lower-cased) trigram of title_eng and title_foreign to the ids of the books
+    containing it; the index is built lazily on the first search, changes to the titles
+    made by this connection are applied using set_titles/remove_book (Book.save/remove),
+    it's rebuilt on the next search after another connection modified the db
+    (PRAGMA data_version) or it was invalidated (rolled back transactions)
+    """
+
+    def __init__(self, db_con):
+        self.db_con = db_con
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._titles: Dict[int, Tuple[str, ...]] = {}
+        self._data_version: Optional[int] = None
+
+    def _build(self) -> None:
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        titles: Dict[int, Tuple[str, ...]] = {}
+        c = self.db_con.execute("SELECT id, title_eng, title_foreign FROM Books")
+        for book_id, title_eng, title_foreign in c.fetchall():
+            book_titles = tuple(t.lower() for t in (title_eng, title_foreign) if t)
+            titles[book_id] = book_titles
+            for title in book_titles:
+                for trigram in trigrams(title):
+                    postings[trigram].add(book_id)
+
+        self._postings = postings
+        self._titles = titles
+        logger.debug("Built title trigram index with %d trigrams for %d books",
+                     len(postings), len(titles))
+
+    def invalidate(self) -> None:
+        self._data_version = None
+
+    def remove_book(self, book_id: int) -> None:
+        if self._data_version is None:
+            # not built (yet)
+            return
+        for title in self._titles.pop(book_id, ()):
+            for trigram in trigrams(title):
+                ids = self._postings.get(trigram)
+                if ids is not None:
+                    ids.discard(book_id)
+                    if not ids:
+                        del self._postings[trigram]
+
+    def set_titles(self, book_id: int, title_eng: Optional[str],
+                   title_foreign: Optional[str]) -> None:
+        """Updates the index after the book book_id was added or its titles were changed"""
+        if self._data_version is None:
+            return
+        self.remove_book(book_id)
+        book_titles = tuple(t.lower() for t in (title_eng, title_foreign) if t)
+        self._titles[book_id] = book_titles
+        for title in book_titles:
+            for trigram in trigrams(title):
+                self._postings[trigram].add(book_id)
+
+    def search(self, substring: str) -> List[int]:
+        """
+        Returns the sorted ids of all books where one of the titles contains substring
+        (case-insensitive), substring has to be at least MIN_SUBSTRING_LEN chars long
+        """
+        if len(substring) < MIN_SUBSTRING_LEN:
+            raise ValueError(f"Substring needs to be at least {MIN_SUBSTRING_LEN} chars long")
+
+        data_version, = self.db_con.execute("PRAGMA data_version").fetchone()
+        if data_version != self._data_version:
+            self._build()
+            self._data_version = data_version
+
+        substring = substring.lower()
+        # start with the rarest trigram so the intersections stay small
+        postings = sorted((self._postings.get(tri, set()) for tri in trigrams(substring)),
+                          key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            if not candidates:
+                break
+            candidates &= ids
+
+        # trigrams can match in any order -> verify the actual substring
+        return sorted(book_id for book_id in candidates
+                      if any(substring in title for title in self._titles[book_id]))
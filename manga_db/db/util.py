@@ -1,5 +1,12 @@
 from functools import reduce
+from contextlib import contextmanager
+import logging
 import operator
+import time
+
+from typing import Tuple, Iterator, Sequence, TypeVar, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
 
 UNESCAPED, ESCAPED = 0, 1
 
@@ -84,5 +91,98 @@ def joined_col_name_to_query_names(col_name):
     return table_name, bridge_col_name
 
 
+# stay below SQLITE_MAX_VARIABLE_NUMBER (999 before SQLite 3.32.0)
+MAX_QUERY_PARAMS = 900
+
+T = TypeVar('T')
+
+
+def chunked(seq: Sequence[T], size: int = MAX_QUERY_PARAMS) -> Iterator[Sequence[T]]:
+    """Splits seq into chunks of at most size items e.g. for using them in an IN (...) clause"""
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
 def prod(iterable):
     return reduce(operator.mul, iterable, 1)
+
+
+def change_token(db_con) -> Tuple[int, int]:
+    """
+    Returns a token that changes whenever the database was modified, so it can be used to
+    invalidate data derived from the database
+    PRAGMA data_version only changes when _other_ connections commit changes, total_changes
+    counts all the rows modified by this connection (including triggers)
+    """
+    data_version, = db_con.execute("PRAGMA data_version").fetchone()
+    return data_version, db_con.total_changes
+
+
+@contextmanager
+def time_budget(db_con, seconds: float, check_every: int = 10000) -> Iterator[None]:
+    """
+    Aborts statements that run longer than seconds (measured from entering the context)
+    using a progress handler; aborted statements raise sqlite3.OperationalError('interrupted')
+    """
+    deadline = time.monotonic() + seconds
+    # called every check_every VM instructions, a truthy return value aborts the statement
+    db_con.set_progress_handler(lambda: time.monotonic() > deadline, check_every)
+    try:
+        yield
+    finally:
+        db_con.set_progress_handler(None, 0)
+
+
+def is_interrupted(err: Exception) -> bool:
+    return str(err) == "interrupted"
+
+
+# PRAGMAs that are applied to every connection MangaDB opens; can be overwritten using
+# the settings passed to MangaDB (None leaves the PRAGMA alone)
+# WAL: readers don't block the writer and the writer doesn't block readers, so e.g. an
+# import running in the background doesn't stall the webGUI; with WAL synchronous=NORMAL
+# is still safe from corruption (only the last commits might be lost on power loss)
+CONNECTION_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # negative: in KiB -> 16MiB page cache
+    "cache_size": -16000,
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "memory",
+    # ms to wait for a lock held by another connection before raising 'database is locked'
+    "busy_timeout": 5000,
+}
+PRAGMA_VALUES = {
+    "journal_mode": {"delete", "truncate", "persist", "memory", "wal", "off"},
+    "synchronous": {"off", "normal", "full", "extra"},
+    "temp_store": {"default", "file", "memory"},
+}
+
+
+def configure_connection(db_con, settings: Optional[Dict[str, Any]] = None,
+                         read_only: bool = False) -> None:
+    """
+    Applies CONNECTION_PRAGMAS (overwritten by the matching keys in settings) to db_con
+    The journal mode is stored in the DB file so it's only set on writable connections
+    """
+    pragmas = dict(CONNECTION_PRAGMAS)
+    if settings:
+        pragmas.update((k, v) for k, v in settings.items() if k in CONNECTION_PRAGMAS)
+    if read_only:
+        del pragmas["journal_mode"]
+
+    for name, value in pragmas.items():
+        if value is None:
+            continue
+        # PRAGMAs don't support parameters -> only allow known values
+        if name in PRAGMA_VALUES:
+            value = str(value).lower()
+            if value not in PRAGMA_VALUES[name]:
+                raise ValueError(f"Invalid value for PRAGMA {name}: {value}")
+        else:
+            value = int(value)
+        row = db_con.execute(f"PRAGMA {name}={value}").fetchone()
+        # returns the new mode which might differ if the mode couldn't be changed
+        # e.g. for in-memory DBs or WAL isn't supported on network file systems
+        if name == "journal_mode" and row is not None and row[0] != value:
+            logger.debug("Could not set journal_mode to '%s', using '%s'", value, row[0])
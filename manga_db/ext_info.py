@@ -1,10 +1,11 @@
 import logging
 import datetime
 
-from typing import Tuple, Optional, TYPE_CHECKING
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
 
 from .db.row import DBRow
 from .db.column import Column
+from .db.util import chunked
 from .constants import CENSOR_IDS
 from .extractor import SUPPORTED_SITES, find_by_site_id, MANUAL_ADD
 
@@ -19,6 +20,8 @@ logger = logging.getLogger(__name__)
 class ExternalInfo(DBRow):
 
     TABLENAME = "ExternalInfo"
+    # needs the id of its book
+    FLUSH_ORDER = 1
 
     id = Column(int, primary_key=True)
     book_id = Column(int, nullable=False)
@@ -73,6 +76,10 @@ class ExternalInfo(DBRow):
         if self.last_update is None:
             self.set_updated()
 
+    def _init_from_row(self, book):
+        self.book = book
+        self._extr_cls = find_by_site_id(self.imported_from)
+
     def __eq__(self, other):
         return all((self.id_onpage == other.id_onpage, self.imported_from == other.imported_from,
                     self.uploader == other.uploader, self.upload_date == other.upload_date,
@@ -199,7 +206,7 @@ class ExternalInfo(DBRow):
         db_dict = self.export_for_db()
         cols = [col for col in self.COLUMNS if col != "id"]
 
-        with self.manga_db.db_con:
+        with self.manga_db.transaction():
             c = self.manga_db.db_con.execute(f"""
                     INSERT INTO ExternalInfo ({','.join(cols)})
                     VALUES ({','.join((f':{col}' for col in cols))}
@@ -221,6 +228,45 @@ class ExternalInfo(DBRow):
 
         return self.id, outdated
 
+    @classmethod
+    def _flush_inserts(cls, manga_db: 'MangaDB', ext_infos: List['ExternalInfo']) -> None:
+        # same as _add_entry but grouping the statements of all the ext infos
+        for ext_info in ext_infos:
+            if ext_info.book is None or ext_info.book.id is None:
+                raise ValueError("ExternalInfo can only be saved with an id or Book.id!")
+            if ext_info.downloaded is None:
+                ext_info.downloaded = 0
+            if ext_info.outdated is None:
+                ext_info.outdated = 0
+            if ext_info.book_id is None:
+                ext_info.book_id = ext_info.book.id
+            elif ext_info.book_id != ext_info.book.id:
+                raise ValueError("book_id and book's id don't match!")
+
+        # (id_onpage, imported_from) -> ids of the external infos with that link
+        present: Dict[Tuple[str, int], List[int]] = {}
+        for chunk in chunked(list({ei.id_onpage for ei in ext_infos})):
+            c = manga_db.db_con.execute(f"""
+                SELECT id, id_onpage, imported_from FROM ExternalInfo
+                WHERE id_onpage IN ({', '.join('?' * len(chunk))})""", chunk)
+            for ei_id, id_onpage, imported_from in c.fetchall():
+                present.setdefault((id_onpage, imported_from), []).append(ei_id)
+
+        super()._flush_inserts(manga_db, ext_infos)
+
+        # links that were already in the db (or earlier in ext_infos) are outdated
+        outdated_ids = set()
+        for ext_info in ext_infos:
+            link = (ext_info.id_onpage, ext_info.imported_from)
+            outdated_ids.update(present.get(link, ()))
+            present.setdefault(link, []).append(ext_info.id)
+        if outdated_ids:
+            manga_db.db_con.executemany("UPDATE ExternalInfo SET outdated = 1 WHERE id = ?",
+                                        [(ei_id,) for ei_id in sorted(outdated_ids)])
+            logger.warning("Links of the external infos with ids %s are outdated! Probably "
+                           "means a new version is available!",
+                           ", ".join(str(ei_id) for ei_id in sorted(outdated_ids)))
+
     def _update_entry(self, downloaded_null=None, manual=False):
         if not self._committed_state:
             logger.debug("There were no changes when updating external info with id %d", self.id)
@@ -261,7 +307,7 @@ class ExternalInfo(DBRow):
         update_dic = self.export_for_db()
         changed_cols = [col for col in self._committed_state if col in self.COLUMNS]
 
-        with db_con:
+        with self.manga_db.transaction():
             c.execute(f"""UPDATE ExternalInfo SET
                           {','.join((f'{col} = :{col}' for col in changed_cols))}
                           WHERE id = :id""", update_dic)
@@ -275,7 +321,7 @@ class ExternalInfo(DBRow):
             logger.error("Remove was called on  an external info instance without id!")
             return None
 
-        with self.manga_db.db_con:
+        with self.manga_db.transaction():
             self.manga_db.db_con.execute("""
                 DELETE
                 FROM ExternalInfo
@@ -283,7 +329,8 @@ class ExternalInfo(DBRow):
                 id = ?""", (self.id, ))
         self._in_db = False
         # del from id_map
-        self.manga_db.id_map.remove(self.key)
+        # might have been dropped already if another connection modified the db
+        self.manga_db.id_map.discard(self.key)
 
         logger.info("Removed external info with id %d and url %s", self.id, self.url)
 
@@ -331,7 +378,7 @@ class ExternalInfo(DBRow):
             # remove entry in commited so it wont save again
             del ei._committed_state["downloaded"]
 
-        with mdb.db_con:
+        with mdb.transaction():
             mdb.db_con.execute("UPDATE ExternalInfo SET downloaded = ? WHERE id = ?",
                                (intbool, ext_info_id))
 
@@ -1,8 +1,10 @@
 import os
 import logging
 import datetime
+import json
 
-from typing import TYPE_CHECKING, ClassVar, Tuple
+from collections import defaultdict
+from typing import TYPE_CHECKING, ClassVar, Tuple, List
 
 from .db.loading import load_instance
 from .db.row import DBRow
@@ -11,7 +13,9 @@ from .db.column_associated import AssociatedColumnMany
 from .db.constants import Relationship
 from .ext_info import ExternalInfo
 from .constants import STATUS_IDS
-from .db.util import joined_col_name_to_query_names
+from .db.util import joined_col_name_to_query_names, chunked
+from .db.search import EXT_STATS_TABLE, EXT_STATS_COLS
+from .db.posting_lists import nocase
 from .util import diff_update
 
 if TYPE_CHECKING:
@@ -20,6 +24,10 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# many-to-many associated columns of Book whose values (names) are kept in BookAggregates
+AGGREGATED_COLUMNS = ("list", "tag", "category", "collection", "groups", "artist",
+                      "parody", "character")
+
 
 class Book(DBRow):
     """
@@ -104,24 +112,22 @@ class Book(DBRow):
         self.chapter_status = chapter_status
         self.read_status = read_status
         self.my_rating = my_rating
-        self.category = category
-        self.collection = collection
-        self.groups = groups
-        self.artist = artist
-        self.parody = parody
-        self.character = character
-        self.list = list
-        self.tag = tag
-        self.ext_infos = ext_infos
+        # associated columns of books that are in the db get loaded lazily
+        # on first access (see AssociatedColumnMany); values that are passed in are
+        # taken as the ones stored in the db
+        assoc_values = dict(category=category, collection=collection, groups=groups,
+                            artist=artist, parody=parody, character=character, list=list,
+                            tag=tag, ext_infos=ext_infos)
+        for col, value in assoc_values.items():
+            if not in_db:
+                setattr(self, col, value)
+            elif value is not None:
+                getattr(Book, col).set_loaded(self, value)
         self.last_change = last_change
         self.note = note
         self.favorite = favorite
         self.cover_timestamp = cover_timestamp
         self.nsfw = nsfw
-        if in_db:
-            # load associated columns
-            # TODO lazy loading
-            self.update_assoc_columns_from_db()
 
         if self.last_change is None:
             self.set_last_change()
@@ -177,20 +183,13 @@ class Book(DBRow):
             return None
 
     def _fetch_external_infos(self):
-        ext_infos = []
-        c = self.manga_db.db_con.execute("""
-                        SELECT ei.*
-                        FROM ExternalInfo ei, Books
-                        WHERE Books.id = ei.book_id
-                        AND Books.id = ?""", (self.id,))
-        for row in c.fetchall():
-            ei = load_instance(self.manga_db, ExternalInfo, row, self)
-            ext_infos.append(ei)
-        return ext_infos
+        c = self.manga_db.db_con.execute(
+            "SELECT * FROM ExternalInfo WHERE book_id = ? ORDER BY id", (self.id,))
+        return [load_instance(self.manga_db, ExternalInfo, row, self) for row in c.fetchall()]
 
     def update_assoc_columns_from_db(self):
         for col, val in self.get_associated_columns().items():
-            setattr(self, col, val)
+            getattr(Book, col).set_loaded(self, val)
         # possible changes overwritten -> remove assoc cols from _committed_state
         self._committed_state = {k: v for k, v in self._committed_state.items() if k not in
                                  self.ASSOCIATED_COLUMNS}
@@ -202,32 +201,93 @@ class Book(DBRow):
         if self.id is None:
             raise ValueError("Id must be set in order to get associated columns from DB!")
 
-        result = {
-            "list": None,
-            "tag": None,
-            "category": None,
-            "collection": None,
-            "groups": None,
-            "artist": None,
-            "parody": None,
-            "character": None
-            }
-
-        for col in result:
-            result[col] = self._fetch_associated_column(col)
+        result = self.fetch_associated_columns_batched(
+            self.manga_db.db_con, [self.id], AGGREGATED_COLUMNS)[self.id]
         result["ext_infos"] = self._fetch_external_infos()
         return result
 
+    @classmethod
+    def load_associated_columns_batched(cls, manga_db, books, cols=None):
+        """
+        Loads the associated columns cols (default: all) of books using one query for the
+        aggregated columns and one for the ext infos for all the books (select-in loading)
+        instead of one per book and column
+        Columns that are already loaded are skipped so changes aren't overwritten
+        """
+        cols = cls.ASSOCIATED_COLUMNS if cols is None else cols
+        unloaded = {col: {book.id: book for book in books
+                          if not getattr(cls, col).is_loaded(book)} for col in cols}
+        # all the aggregated columns are fetched using one query
+        aggregated = [col for col in cols if col != "ext_infos" and unloaded[col]]
+        if aggregated:
+            book_ids = list({book_id: None for col in aggregated for book_id in unloaded[col]})
+            values = cls.fetch_associated_columns_batched(
+                manga_db.db_con, book_ids, aggregated)
+            for col in aggregated:
+                descriptor = getattr(cls, col)
+                for book_id, book in unloaded[col].items():
+                    descriptor.set_loaded(book, values[book_id][col])
+        if "ext_infos" in cols and unloaded["ext_infos"]:
+            values = cls.fetch_external_infos_batched(manga_db, unloaded["ext_infos"].values())
+            for book_id, value in values.items():
+                cls.ext_infos.set_loaded(unloaded["ext_infos"][book_id], value)
+
+    @staticmethod
+    def fetch_external_infos_batched(manga_db, books, outdated=None):
+        """
+        Returns the external infos of books by book id using one query for all the books
+        outdated: only return the ones that are (not) outdated if it's not None
+        Doesn't touch the books' ext_infos (see load_associated_columns_batched)
+        """
+        books = {book.id: book for book in books}
+        values = {book_id: [] for book_id in books}
+        outdated_cond = "" if outdated is None else f"AND outdated = {int(bool(outdated))}"
+        for book_ids in chunked(list(books)):
+            c = manga_db.db_con.execute(f"""
+                SELECT * FROM ExternalInfo
+                WHERE book_id IN ({', '.join('?' * len(book_ids))})
+                {outdated_cond}
+                ORDER BY id""", book_ids)
+            for row in c.fetchall():
+                values[row["book_id"]].append(load_instance(
+                    manga_db, ExternalInfo, row, books[row["book_id"]]))
+        return values
+
+    @staticmethod
+    def fetch_associated_column_batched(db_con, col_name, book_ids):
+        """
+        Returns the values of the (many-to-many) associated column col_name of the books
+        with book_ids by book id using one query
+        """
+        values = Book.fetch_associated_columns_batched(db_con, book_ids, (col_name,))
+        return {book_id: book_values[col_name] for book_id, book_values in values.items()}
+
+    @staticmethod
+    def fetch_associated_columns_batched(db_con, book_ids, col_names=AGGREGATED_COLUMNS):
+        """
+        Returns the values of the (many-to-many) associated columns col_names of the books
+        with book_ids as {book_id: {col_name: values}} using one query on BookAggregates
+        """
+        if any(col not in AGGREGATED_COLUMNS for col in col_names):
+            raise ValueError(f"Not an aggregated column: {col_names}")
+        values = {book_id: {col: [] for col in col_names} for book_id in book_ids}
+        for chunk in chunked(book_ids):
+            c = db_con.execute(f"""
+                SELECT id, {', '.join(col_names)} FROM BookAggregates
+                WHERE id IN ({', '.join('?' * len(chunk))})""", chunk)
+            for row in c.fetchall():
+                values[row[0]] = {col: json.loads(row[i])
+                                  for i, col in enumerate(col_names, 1)}
+        return values
+
+    def _load_associated_column(self, col_name):
+        if col_name == "ext_infos":
+            return self._fetch_external_infos()
+        return self._fetch_associated_column(col_name)
+
     def _fetch_associated_column(self, col_name):
-        table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
-        c = self.manga_db.db_con.execute(f"""SELECT group_concat(x.name, ';')
-                                             FROM {table_name} x, Book{table_name} bx, Books
-                                             WHERE bx.book_id = Books.id
-                                             AND Books.id = ?
-                                             AND bx.{bridge_col_name} = x.id
-                                             GROUP BY bx.book_id""", (self.id, ))
-        result = c.fetchone()
-        return result[0].split(";") if result else []
+        return self.fetch_associated_column_batched(
+            self.manga_db.db_con, col_name, [self.id])[self.id]
 
     def get_all_options_for_assoc_columns(self):
         result = {
@@ -314,12 +374,15 @@ class Book(DBRow):
         # since were saving ext_infos we also have to pass along if we had
         # outdated links
         outdated_on_ei_ids = []
-        with self.manga_db.db_con:
+        with self.manga_db.transaction():
             c = self.manga_db.db_con.execute(f"""
                     INSERT INTO Books ({','.join(cols)})
                     VALUES ({','.join((f':{col}' for col in cols))}
                     )""", db_dict)
             self.id = c.lastrowid
+            if self.manga_db.title_trigram_index is not None:
+                self.manga_db.title_trigram_index.set_titles(
+                        self.id, self.title_eng, self.title_foreign)
 
             for col in self.ASSOCIATED_COLUMNS:
                 if col == "ext_infos":
@@ -359,16 +422,22 @@ class Book(DBRow):
         for ext_info in ext_infos:
             ext_info.remove()
 
-        with self.manga_db.db_con:
+        with self.manga_db.transaction():
             self.manga_db.db_con.execute(f"""
                                 DELETE
                                 FROM Books
                                 WHERE
                                 id = ?""", (self.id, ))
+            if self.manga_db.title_trigram_index is not None:
+                self.manga_db.title_trigram_index.remove_book(self.id)
+            # bridge rows are deleted by the foreign keys
+            if self.manga_db.posting_lists is not None:
+                self.manga_db.posting_lists.remove_book(self.id)
 
         self._in_db = False
         # delete from id_map
-        self.manga_db.id_map.remove(self.key)
+        # might have been dropped already if another connection modified the db
+        self.manga_db.id_map.discard(self.key)
 
         # also delete book thumb
         try:
@@ -399,47 +468,61 @@ class Book(DBRow):
         return url
 
     def _add_associated_column_values(self, col_name, values):
+        self._add_associated_column_pairs(self.manga_db, col_name,
+                                          [(self.id, value) for value in values])
+
+    def _remove_associated_column_values(self, col_name, values):
+        self._remove_associated_column_pairs(self.manga_db, col_name,
+                                             [(self.id, value) for value in values])
+
+    @staticmethod
+    def _add_associated_column_pairs(manga_db, col_name, pairs):
+        """Adds the values to the associated column col_name of the books by (book_id, value)"""
+        db_con = manga_db.db_con
         table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
-        # values gotta be list/tuple of lists/tuples
-        li_of_tup = [(val,) for val in values]
-        c = self.manga_db.db_con.executemany(
-                f"INSERT OR IGNORE INTO {table_name}(name) VALUES (?)", li_of_tup)
-
-        # NOTE: careful! since OR IGNORE ignores the insert if sth. like a unique constraint
-        # is violated it also doesn't raise an exception etc. and a bug of not adding
-        # rows might get unnoticed
+        # only names that aren't in the cache need to hit the table
+        ids = manga_db.assoc_name_ids.get_ids(table_name, (val for _, val in pairs))
+        id_pairs = [(book_id, ids[nocase(val)]) for book_id, val in pairs]
+
         # we don't need OR IGNORE here, since our we only add values that weren't present
         # on the book; could only happen if our id_map is buggy or our db was modified
         # form another connection
         # TODO @Hack need to treat this specially since we need the max in_collection_idx
         if col_name == "collection":
             # use max in_collection_idx + 1 for a collection that was newly added
-            c.executemany("""INSERT INTO BookCollection(book_id, collection_id, in_collection_idx)
-                             SELECT ?, Collection.id, (
-                                SELECT MAX(bc.in_collection_idx) + 1
-                                FROM BookCollection bc
-                             )
-                             FROM Collection
-                             WHERE Collection.name = ?""", zip([self.id] * len(values), values))
+            db_con.executemany("""
+                INSERT INTO BookCollection(book_id, collection_id, in_collection_idx)
+                VALUES (?, ?, (
+                    SELECT MAX(bc.in_collection_idx) + 1
+                    FROM BookCollection bc
+                ))""", id_pairs)
         else:
-            c.executemany(f"""INSERT INTO Book{table_name}(book_id, {bridge_col_name})
-                              SELECT ?, {table_name}.id
-                              FROM {table_name}
-                              WHERE {table_name}.name = ?""", zip([self.id] * len(values), values))
-        logger.debug("Added '%s' to associated column '%s'", ", ".join(values), table_name)
+            db_con.executemany(f"""
+                INSERT INTO Book{table_name}(book_id, {bridge_col_name})
+                VALUES (?, ?)""", id_pairs)
+        if manga_db.posting_lists is not None:
+            manga_db.posting_lists.add(col_name, pairs)
+        logger.debug("Added '%s' to associated column '%s'",
+                     ", ".join(dict.fromkeys(val for _, val in pairs)), table_name)
 
-    def _remove_associated_column_values(self, col_name, values):
+    @staticmethod
+    def _remove_associated_column_pairs(manga_db, col_name, pairs):
+        """
+        Removes the values from the associated column col_name of the books
+        by (book_id, value)
+        """
         table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
-        self.manga_db.db_con.execute(f"""
+        manga_db.db_con.executemany(f"""
                 DELETE FROM Book{table_name}
-                WHERE Book{table_name}.{bridge_col_name} IN
-                   (
+                WHERE Book{table_name}.book_id = ?
+                AND Book{table_name}.{bridge_col_name} = (
                    SELECT {table_name}.id FROM {table_name}
-                   WHERE
-                   ({table_name}.name IN ({', '.join(['?']*len(values))}))
-                   )
-                AND Book{table_name}.book_id = ?""", (*values, self.id))
-        logger.debug("Removed '%s' from associated column '%s'", values, table_name)
+                   WHERE {table_name}.name = ?
+                )""", pairs)
+        if manga_db.posting_lists is not None:
+            manga_db.posting_lists.remove(col_name, pairs)
+        logger.debug("Removed '%s' from associated column '%s'",
+                     [val for _, val in pairs], table_name)
 
     def _update_entry(self):
         """
@@ -458,10 +541,14 @@ class Book(DBRow):
         update_dic = self.export_for_db()
         changed_cols = [col for col in self._committed_state if col in self.COLUMNS]
 
-        with db_con:
+        with self.manga_db.transaction():
             db_con.execute(f"""UPDATE Books SET
                           {','.join((f'{col} = :{col}' for col in changed_cols))}
                           WHERE id = :id""", update_dic)
+            if (self.manga_db.title_trigram_index is not None and
+                    ("title_eng" in changed_cols or "title_foreign" in changed_cols)):
+                self.manga_db.title_trigram_index.set_titles(
+                        self.id, self.title_eng, self.title_foreign)
 
             self._update_associated_columns()
 
@@ -489,6 +576,73 @@ class Book(DBRow):
                 if removed:
                     self._remove_associated_column_values(col, removed)
 
+    @classmethod
+    def _flush_inserts(cls, manga_db, books):
+        # same as _add_entry but grouping the statements of all the books
+        # books whose titles are in the db already (or earlier in books) go through save
+        present = set(manga_db._get_book_ids_by_titles(
+            {(book.title_eng, book.title_foreign) for book in books}))
+        new, rest = [], []
+        for book in books:
+            title = (book.title_eng, book.title_foreign)
+            if title in present:
+                rest.append(book)
+            else:
+                present.add(title)
+                new.append(book)
+
+        for book in new:
+            if book.favorite is None:
+                book.favorite = 0
+        super()._flush_inserts(manga_db, new)
+        if manga_db.title_trigram_index is not None:
+            for book in new:
+                manga_db.title_trigram_index.set_titles(
+                        book.id, book.title_eng, book.title_foreign)
+
+        for col in cls.ASSOCIATED_COLUMNS:
+            if col == "ext_infos":
+                continue
+            pairs = [(book.id, value) for book in new for value in getattr(book, col)]
+            if pairs:
+                cls._add_associated_column_pairs(manga_db, col, pairs)
+        ext_infos = [ei for book in new for ei in book.ext_infos if not ei._in_db]
+        if ext_infos:
+            ExternalInfo._flush_inserts(manga_db, ext_infos)
+        logger.info("Added %d books to the database", len(new))
+
+        for book in rest:
+            book.save()
+
+    @classmethod
+    def _flush_updates(cls, manga_db, books):
+        # same as _update_entry but grouping the statements of all the books
+        for book in books:
+            book.set_last_change()
+        super()._flush_updates(manga_db, books)
+        if manga_db.title_trigram_index is not None:
+            for book in books:
+                if ("title_eng" in book._committed_state or
+                        "title_foreign" in book._committed_state):
+                    manga_db.title_trigram_index.set_titles(
+                            book.id, book.title_eng, book.title_foreign)
+
+        added = defaultdict(list)
+        removed = defaultdict(list)
+        for book in books:
+            for col, old in book._committed_state.items():
+                if col not in cls.ASSOCIATED_COLUMNS or col == "ext_infos":
+                    continue
+                col_added, col_removed = diff_update(old, getattr(book, col))
+                added[col].extend((book.id, value) for value in col_added)
+                removed[col].extend((book.id, value) for value in col_removed)
+        for col, pairs in added.items():
+            if pairs:
+                cls._add_associated_column_pairs(manga_db, col, pairs)
+        for col, pairs in removed.items():
+            if pairs:
+                cls._remove_associated_column_pairs(manga_db, col, pairs)
+
     # repr -> unambiguos
     def __repr__(self):
         selfdict_str = ", ".join((f"{attr}: '{val}'" for attr, val in self.__dict__.items()))
@@ -566,7 +720,7 @@ class Book(DBRow):
             book.favorite = fav_intbool
             # remove entry in commited so it wont save again
             del book._committed_state["favorite"]
-        with mdb.db_con:
+        with mdb.transaction():
             mdb.db_con.execute("UPDATE Books SET favorite = ?, "
                                "last_change = DATE('now', 'localtime') WHERE id = ?",
                                (fav_intbool, book_id))
@@ -578,7 +732,7 @@ class Book(DBRow):
             book.my_rating = rating
             # remove entry in commited so it wont save again
             del book._committed_state["my_rating"]
-        with mdb.db_con:
+        with mdb.transaction():
             mdb.db_con.execute("UPDATE Books SET my_rating = ?, "
                                "last_change = DATE('now', 'localtime') WHERE id = ?",
                                (rating, book_id))
@@ -594,17 +748,14 @@ class Book(DBRow):
             del book._committed_state[col_name]
 
         table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
-        # values gotta be list/tuple of lists/tuples
-        li_of_tup = [(val,) for val in values]
-        with mdb.db_con:
+        with mdb.transaction():
+            ids = mdb.assoc_name_ids.get_ids(table_name, values)
             c = mdb.db_con.executemany(
-                    f"INSERT OR IGNORE INTO {table_name}(name) VALUES (?)", li_of_tup)
+                    f"""INSERT OR IGNORE INTO Book{table_name}(book_id, {bridge_col_name})
+                        VALUES (?, ?)""", [(book_id, ids[nocase(val)]) for val in values])
+            if mdb.posting_lists is not None:
+                mdb.posting_lists.add(col_name, [(book_id, val) for val in values])
 
-            c.executemany(f"""INSERT OR IGNORE INTO Book{table_name}(book_id, {bridge_col_name})
-                              SELECT ?, {table_name}.id
-                              FROM {table_name}
-                              WHERE {table_name}.name = ?""", zip([book_id] * len(values), values))
-            
             c.execute("UPDATE Books SET last_change = DATE('now', 'localtime') WHERE id = ?",
                       (book_id,))
 
@@ -621,7 +772,7 @@ class Book(DBRow):
             del book._committed_state[col_name]
 
         table_name, bridge_col_name = joined_col_name_to_query_names(col_name)
-        with mdb.db_con:
+        with mdb.transaction():
             c = mdb.db_con.execute(f"""
                     DELETE FROM Book{table_name}
                     WHERE Book{table_name}.{bridge_col_name} IN
@@ -631,6 +782,8 @@ class Book(DBRow):
                        ({table_name}.name IN ({', '.join(['?']*len(values))}))
                        )
                     AND Book{table_name}.book_id = ?""", (*values, book_id))
+            if mdb.posting_lists is not None:
+                mdb.posting_lists.remove(col_name, [(book_id, val) for val in values])
 
             c.execute("UPDATE Books SET last_change = DATE('now', 'localtime') WHERE id = ?",
                       (book_id,))
@@ -659,3 +812,58 @@ class Book(DBRow):
             character=data.character,
             tag=data.tag,
         )
+
+
+class BookSummary:
+    """
+    Read-only projection of a book with only the columns needed for listing books
+    Doesn't track changes and isn't added to the IndentityMap so it's a lot cheaper to
+    create than a Book; use MangaDB.get_book(_id=summary.id) for the full Book
+    """
+
+    __slots__ = ("id", "title_eng", "title_foreign", "pages", "read_status", "my_rating",
+                 "favorite", "cover_timestamp", "last_change", *EXT_STATS_COLS,
+                 "tag", "artist")
+
+    BOOK_COLUMNS: ClassVar[Tuple[str, ...]] = (
+        "id", "title_eng", "title_foreign", "pages", "read_status", "my_rating",
+        "favorite", "cover_timestamp", "last_change")
+    ASSOCIATED_COLUMNS: ClassVar[Tuple[str, ...]] = ("tag", "artist")
+    # columns a query has to select (from Books joined with ExternalInfoStats)
+    SELECT_COLUMNS: ClassVar[str] = ", ".join(
+        [f"Books.{col}" for col in BOOK_COLUMNS] +
+        [f"{EXT_STATS_TABLE}.{col}" for col in EXT_STATS_COLS])
+
+    def __init__(self, row, tag, artist):
+        for col in self.BOOK_COLUMNS + EXT_STATS_COLS:
+            object.__setattr__(self, col, row[col])
+        object.__setattr__(self, "tag", tag)
+        object.__setattr__(self, "artist", artist)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    @classmethod
+    def from_rows(cls, manga_db: 'MangaDB', rows) -> List['BookSummary']:
+        """
+        Creates the summaries from rows selecting SELECT_COLUMNS; the associated columns
+        are loaded for all the rows at once using one query
+        """
+        values = Book.fetch_associated_columns_batched(
+            manga_db.db_con, [row["id"] for row in rows], cls.ASSOCIATED_COLUMNS)
+        return [cls(row, **values[row["id"]]) for row in rows]
+
+    @property
+    def title(self):
+        return Book.build_title(self.title_eng, self.title_foreign)
+
+    @property
+    def avg_ext_rating(self):
+        # ExternalInfoStats uses 0 for books without ratings
+        return self.ext_rating or None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id}, title={self.title!r})"
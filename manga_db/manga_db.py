@@ -1,14 +1,16 @@
 import os
 import logging
+import datetime
+import dataclasses
 import sqlite3
-import re
 import urllib.request
 import urllib.error
 import http.cookiejar
+import contextlib
 
 from typing import (
     Optional, Tuple, Any, List, overload, TypedDict,
-    ClassVar, cast, Dict, Sequence, Union, Type
+    ClassVar, cast, Dict, Sequence, Union, Type, Iterator, Iterable, Set, TYPE_CHECKING
 )
 
 from .logging_setup import configure_logging
@@ -17,13 +19,25 @@ from .extractor.base import MangaExtractorData, BaseMangaExtractor
 from .exceptions import MangaDBException
 from .db import migrate
 from .db import search
-from .db.loading import load_instance
+from .db.loading import load_instance, load_instances, load_associated_columns
 from .db.id_map import IndentityMap
-from .db.util import table_name_to_bridge_id_col
-from .manga import Book
+from .db.trigram import TrigramIndex, has_trigram_table
+from .db.posting_lists import PostingListIndex
+from .db.cache import LRUCache
+from .db.session import Session
+from .db.name_ids import AssociatedNameIds
+from .db.util import (
+    table_name_to_bridge_id_col, time_budget as db_time_budget, is_interrupted, chunked,
+    configure_connection, joined_col_name_to_query_names
+)
+from .manga import Book, BookSummary
+from .db.constants import Relationship, LoadStrategy
 from .ext_info import ExternalInfo
 from .constants import CENSOR_IDS, STATUS_IDS, LANG_IDS
 
+if TYPE_CHECKING:
+    from .link_collector import ImportData
+
 
 configure_logging("manga_db.log")
 logger = logging.getLogger(__name__)
@@ -45,12 +59,6 @@ url_opener.addheaders = [
 # opener; otherwise, simply call OpenerDirector.open() instead of urlopen().
 urllib.request.install_opener(url_opener)
 
-# part of lexical analysis
-# This expression states that a "word" is either (1) non-quote, non-whitespace text
-# surrounded by whitespace, or (2) non-quote text surrounded by quotes (followed by some
-# whitespace).
-WORD_RE = re.compile(r'([^"^\s]+)\s*|"([^"]+)"\s*')
-
 
 def set_default_user_agent(user_agent: str) -> None:
     new_addheaders = []
@@ -112,20 +120,56 @@ def update_cookies_from_file(filename="cookies.txt", has_custom_info: bool = Tru
         return success and True
 
 
+@dataclasses.dataclass
+class BulkImportResult:
+    # url -> id of the book that was added for it (e.g. for downloading the covers)
+    book_ids: Dict[str, int] = dataclasses.field(default_factory=dict)
+    # urls whose book was already in the DB (or earlier in the records) -> only their
+    # external info was added to that book
+    added_to_existing: List[str] = dataclasses.field(default_factory=list)
+    # urls that were skipped since their book already had an external info for them
+    skipped: List[str] = dataclasses.field(default_factory=list)
+    # id of a new external info -> ids of the external infos that are outdated due to it
+    outdated: Dict[int, List[int]] = dataclasses.field(default_factory=dict)
+
+
 class MangaDB:
     VALID_SEARCH_COLS = {"title", "language", "language_id", "status", "favorite",
                          "category", "artist", "parody", "character", "collection", "groups",
-                         "tag", "list", "status", "status_id", "nsfw", "read_status", "downloaded"}
+                         "tag", "list", "status", "status_id", "nsfw", "read_status", "downloaded",
+                         "pages", "my_rating", "last_change", "upload_date"}
 
     def __init__(self, root_dir, db_path, read_only=False, settings=None):
-        self.db_con, _ = self._load_or_create_sql_db(db_path, read_only)
-        self.root_dir = os.path.abspath(os.path.normpath(root_dir))
-        # TODO if we have mutliple users in e.g. webgui we need to have separate IdentityMaps
-        self.id_map = IndentityMap()
-        self.language_map = self._get_language_map()
         self.settings = {}
         if settings is not None:
             self.settings.update(settings)
+        self.db_con, _ = self._load_or_create_sql_db(db_path, read_only)
+        # WAL, cache sizes etc. see CONNECTION_PRAGMAS for the keys that can be set
+        configure_connection(self.db_con, self.settings, read_only=read_only)
+        self.root_dir = os.path.abspath(os.path.normpath(root_dir))
+        # id_map_cache_size: nr of recently used books/ext infos that are kept in memory
+        self.id_map = IndentityMap(strong_size=self.settings.get("id_map_cache_size", 0),
+                                   db_con=self.db_con)
+        self.language_map = self._get_language_map()
+        # fall back to an in-memory index if the SQLite build lacks the trigram tokenizer
+        self.title_trigram_index = (None if has_trigram_table(self.db_con)
+                                    else TrigramIndex(self.db_con))
+        # resolves associated column searches in memory
+        # posting_lists_max_size: max nr of book ids that are kept in the posting lists
+        self.posting_lists = (
+                PostingListIndex(self.db_con,
+                                 max_size=self.settings.get("posting_lists_max_size", 500_000))
+                if self.settings.get("posting_lists", True) else None)
+        self.search_compiler = search.SearchCompiler(
+                self.db_con, title_trigram_index=self.title_trigram_index,
+                posting_lists=self.posting_lists)
+        # ids of the books returned by recent searches
+        self.search_cache = LRUCache(self.db_con,
+                                     maxsize=self.settings.get("search_cache_size", 256))
+        # active unit of work, see session
+        self._session: Optional[Session] = None
+        # ids of the names of the associated columns' tables (Tag, Artist, ...)
+        self.assoc_name_ids = AssociatedNameIds(self.db_con)
 
     # __enter__ should return an object that is assigned to the variable after
     # as. By default it is None, and is optional. A common pattern is to return
@@ -146,6 +190,79 @@ class MangaDB:
     def close(self):
         self.db_con.close()
 
+    def invalidate_caches(self) -> None:
+        """
+        Drops the data derived from the DB that is kept up-to-date with this connection's
+        writes, needed after rolling back since it might include the rolled back changes
+        """
+        self.assoc_name_ids.invalidate()
+        # languages added in the transaction are gone
+        self.language_map = self._get_language_map()
+        if self.title_trigram_index is not None:
+            self.title_trigram_index.invalidate()
+        if self.posting_lists is not None:
+            self.posting_lists.invalidate()
+
+    def _begin_write(self) -> None:
+        # take the write lock right away: in WAL mode a deferred transaction that read
+        # before another connection committed can't be upgraded to a write transaction
+        # and fails with 'database is locked' without waiting for the busy_timeout
+        if not self.db_con.in_transaction:
+            self.db_con.execute("BEGIN IMMEDIATE")
+            # expire the instances that are stale due to writes by other connections
+            # before writing using them
+            self.id_map.validate()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Context manager for writing to the DB that commits when it's exited (or rolls back
+        on an exception); inside a session it joins the session's transaction instead
+        """
+        if self._session is not None:
+            yield self.db_con
+            return
+        try:
+            with self.db_con:
+                self._begin_write()
+                yield self.db_con
+        except BaseException:
+            # rolled back -> names that were added in the transaction are gone
+            self.invalidate_caches()
+            raise
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[Session]:
+        """
+        Unit of work: the changes of the books/ext infos added to the session (session.add)
+        get written when the block is exited, all in one transaction together with
+        everything else that's written using this MangaDB inside the block
+        (e.g. Book.set_favorite_id); rolls back everything on an exception
+        Nested sessions join the outer one
+        NOTE: changes of ext infos are written as they are (like manual changes)
+        """
+        if self._session is not None:
+            yield self._session
+            return
+
+        session = self._session = Session(self)
+        try:
+            with self.db_con:
+                self._begin_write()
+                yield session
+                flushed = session.flush()
+        except BaseException:
+            # rolled back -> names that were added in the transaction are gone and the
+            # instances that were inserted by flushing aren't in the db anymore
+            self.invalidate_caches()
+            session.rollback()
+            raise
+        finally:
+            self._session = None
+        # committed -> reset _committed_state
+        for instance in flushed:
+            instance._committed_state = {}
+
     def _get_language_map(self):
         c = self.db_con.execute("SELECT id, name FROM Languages")
         result = {}
@@ -160,7 +277,7 @@ class MangaDB:
             return self.language_map[language]
         except KeyError:
             if create_unpresent:
-                with self.db_con:
+                with self.transaction():
                     c = self.db_con.execute("INSERT OR IGNORE INTO Languages (name) VALUES (?)",
                                             (language,))
                 if c.lastrowid:
@@ -289,25 +406,201 @@ class MangaDB:
 
         return bid, book, outdated_on_ei_id
 
+    def bulk_import(self, records: Iterable[Tuple[MangaExtractorData, 'ImportData']]
+                    ) -> BulkImportResult:
+        """
+        Imports the books of many records (e.g. from LinkCollector dumps) at once in one
+        transaction; covers aren't downloaded (see BulkImportResult.book_ids)
+        Same rules as importing them one by one (threads.single_thread_import): a record whose
+        book (same titles) is already in the DB or earlier in records only adds its
+        external info to that book (unless the book already has one for the link) and
+        external infos on other books with the same link get marked as outdated
+        The names of the associated columns are resolved to ids once per batch and the
+        bridge rows are inserted using executemany; Books and ExternalInfo rows are
+        inserted one by one (re-using the prepared statement) to get their ids
+        """
+        result = BulkImportResult()
+        records = list(records)
+        if not records:
+            return result
+
+        today = datetime.date.today()
+        with self.session():
+            # (title_eng, title_foreign) -> book id
+            book_ids = self._get_book_ids_by_titles(
+                {(data.title_eng, data.title_foreign) for data, _ in records})
+            new_books: Dict[Tuple[Optional[str], Optional[str]],
+                            Tuple[MangaExtractorData, 'ImportData']] = {}
+            ext_info_records = []
+            seen_links: Set[Tuple[Tuple[Optional[str], Optional[str]], str, int]] = set()
+            for data, import_data in records:
+                title = (data.title_eng, data.title_foreign)
+                link = (title, data.id_onpage, data.imported_from)
+                if link in seen_links:
+                    result.skipped.append(data.url)
+                    continue
+                seen_links.add(link)
+                if title not in book_ids and title not in new_books:
+                    new_books[title] = (data, import_data)
+                ext_info_records.append((title, data, import_data))
+
+            if new_books:
+                book_cols = [col for col in Book.COLUMNS if col != "id"]
+                insert_book = f"""
+                    INSERT INTO Books ({', '.join(book_cols)})
+                    VALUES ({', '.join(f':{col}' for col in book_cols)})"""
+                for title, (data, _) in new_books.items():
+                    c = self.db_con.execute(insert_book, dict(
+                        title_eng=data.title_eng, title_foreign=data.title_foreign,
+                        language_id=self.get_language(data.language, create_unpresent=True),
+                        pages=data.pages, status_id=data.status_id, chapter_status=None,
+                        read_status=None, my_rating=None, note=data.note,
+                        last_change=today, favorite=0, cover_timestamp=0.0, nsfw=data.nsfw))
+                    book_id = book_ids[title] = c.lastrowid
+                    result.book_ids[data.url] = book_id
+                    if self.title_trigram_index is not None:
+                        self.title_trigram_index.set_titles(book_id, *title)
+
+                for col in Book.ASSOCIATED_COLUMNS:
+                    if col == "ext_infos":
+                        continue
+                    pairs = [(book_ids[title], value)
+                             for title, (data, import_data) in new_books.items()
+                             for value in (import_data["lists"] if col == "list"
+                                           else getattr(data, col))]
+                    if pairs:
+                        Book._add_associated_column_pairs(self, col, pairs)
+
+            self._bulk_add_ext_infos(ext_info_records, book_ids, new_books, today, result)
+
+        logger.info("Bulk imported %d books, added %d external infos to books that were "
+                    "already present, skipped %d", len(result.book_ids),
+                    len(result.added_to_existing), len(result.skipped))
+        return result
+
+    def _bulk_add_ext_infos(self, ext_info_records, book_ids, new_books, today,
+                            result: BulkImportResult) -> None:
+        # external infos that are in the DB with the same links
+        # (id_onpage, imported_from) -> [(id, book_id)]
+        present: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+        for chunk in chunked(list({data.id_onpage for _, data, _ in ext_info_records})):
+            c = self.db_con.execute(f"""
+                SELECT id, book_id, id_onpage, imported_from FROM ExternalInfo
+                WHERE id_onpage IN ({', '.join('?' * len(chunk))})""", chunk)
+            for ei_id, book_id, id_onpage, imported_from in c.fetchall():
+                present.setdefault((id_onpage, imported_from), []).append((ei_id, book_id))
+
+        to_add = []
+        for title, data, import_data in ext_info_records:
+            book_id = book_ids[title]
+            link = (data.id_onpage, data.imported_from)
+            if any(present_book_id == book_id for _, present_book_id in present.get(link, ())):
+                result.skipped.append(data.url)
+                continue
+            if title not in new_books or new_books[title][0] is not data:
+                result.added_to_existing.append(data.url)
+            to_add.append((link, book_id, data, import_data))
+        if not to_add:
+            return
+
+        ei_cols = [col for col in ExternalInfo.COLUMNS if col != "id"]
+        insert_ext_info = f"""
+            INSERT INTO ExternalInfo ({', '.join(ei_cols)})
+            VALUES ({', '.join(f':{col}' for col in ei_cols)})"""
+        # same link on another book means the link of that external info is outdated
+        # (also applies to external infos earlier in the records)
+        for link, book_id, data, import_data in to_add:
+            c = self.db_con.execute(insert_ext_info, dict(
+                book_id=book_id, id_onpage=data.id_onpage,
+                imported_from=data.imported_from, upload_date=data.upload_date,
+                uploader=data.uploader, censor_id=data.censor_id, rating=data.rating,
+                ratings=data.ratings, favorites=data.favorites,
+                downloaded=1 if import_data["downloaded"] else 0,
+                last_update=today, outdated=0))
+            ei_id = c.lastrowid
+            outdated = [other_id for other_id, _ in present.get(link, ())]
+            if outdated:
+                result.outdated[ei_id] = outdated
+            present.setdefault(link, []).append((ei_id, book_id))
+        outdated_ids = sorted({ei_id for ids in result.outdated.values() for ei_id in ids})
+        if outdated_ids:
+            self.db_con.executemany("UPDATE ExternalInfo SET outdated = 1 WHERE id = ?",
+                                    [(ei_id,) for ei_id in outdated_ids])
+            logger.warning("Links of the external infos with ids %s are outdated!",
+                           ", ".join(str(ei_id) for ei_id in outdated_ids))
+
+        # update loaded instances so they don't miss the new/outdated external infos
+        for ei_id in outdated_ids:
+            ext_info = self.id_map.get((ExternalInfo, (ei_id,)))
+            if ext_info is not None and "outdated" not in ext_info._committed_state:
+                ext_info.outdated = 1
+                # remove entry in commited so it wont save again
+                del ext_info._committed_state["outdated"]
+        for _, book_id, _, _ in to_add:
+            book = self.id_map.get((Book, (book_id,)))
+            if (book is not None and Book.ext_infos.is_loaded(book) and
+                    "ext_infos" not in book._committed_state):
+                # gets re-loaded lazily
+                del book.ext_infos
+
+    def _get_book_ids_by_titles(
+            self, titles: Set[Tuple[Optional[str], Optional[str]]]
+            ) -> Dict[Tuple[Optional[str], Optional[str]], int]:
+        """Returns the ids of the books with titles (title_eng, title_foreign) by title"""
+        book_ids = {}
+        titles_eng = [title_eng for title_eng, _ in titles if title_eng is not None]
+        titles_foreign = [title_foreign for title_eng, title_foreign in titles
+                          if title_eng is None]
+        for cond, values in (("title_eng IN", titles_eng),
+                             ("title_eng IS NULL AND title_foreign IN", titles_foreign)):
+            for chunk in chunked(values):
+                c = self.db_con.execute(f"""
+                    SELECT id, title_eng, title_foreign FROM Books
+                    WHERE {cond} ({', '.join('?' * len(chunk))})""", chunk)
+                for book_id, title_eng, title_foreign in c.fetchall():
+                    if (title_eng, title_foreign) in titles:
+                        book_ids[(title_eng, title_foreign)] = book_id
+        return book_ids
+
     def get_x_books(self, x: int, after: Optional[Tuple[str, str]]=None,
-                    before: Optional[Tuple[str, str]]=None, order_by="Books.id DESC") -> Optional[
-                            List[sqlite3.Row]]:
+                    before: Optional[Tuple[str, str]]=None, order_by="Books.id DESC",
+                    load_strategy: LoadStrategy = LoadStrategy.LAZY,
+                    summary: bool = False) -> Optional[Union[List[Book], List[BookSummary]]]:
+        """
+        Returns x books sorted by order_by starting after/before the cursor
+        summary: return read-only BookSummary projections (only selecting the columns
+                 that are needed for listing books) instead of Books
+        """
         # order by has to come b4 limit/offset
-        query = ["SELECT * FROM Books",
-                 f"ORDER BY {order_by}",
-                 "LIMIT ?"]
+        query = search.select_from_books(
+            BookSummary.SELECT_COLUMNS if summary else "Books.*", order_by)
+        query.extend((f"ORDER BY {order_by}", "LIMIT ?"))
         query, vals_in_order = search.keyset_pagination_statment(
                 query, [], after=after, before=before,
                 order_by=order_by, first_cond=True)
         c = self.db_con.execute(query, (*vals_in_order, x))
         rows = c.fetchall()
 
-        if rows:
-            return [load_instance(self, Book, row) for row in rows]
-        else:
+        if not rows:
             return None
+        elif summary:
+            return BookSummary.from_rows(self, rows)
+        else:
+            return load_instances(self, Book, rows, strategy=load_strategy)
+
+    def get_ext_stats(self, book_ids: Sequence[int]) -> Dict[int, sqlite3.Row]:
+        """
+        Returns the values aggregated from the ExternalInfo rows of the books with
+        book_ids (ext_rating, ext_ratings, ext_favorites, ext_upload_date) by book id
+        e.g. for building keyset pagination cursors when sorting by them
+        """
+        c = self.db_con.execute(f"""
+            SELECT * FROM {search.EXT_STATS_TABLE}
+            WHERE id IN ({', '.join('?' * len(book_ids))})""", book_ids)
+        return {row["id"]: row for row in c.fetchall()}
 
-    def get_outdated(self, id_onpage=None, imported_from=None, order_by="Books.id DESC"):
+    def get_outdated(self, id_onpage=None, imported_from=None, order_by="Books.id DESC",
+                     load_strategy: LoadStrategy = LoadStrategy.LAZY):
         if id_onpage and imported_from:
             c = self.db_con.execute(f"""
                     SELECT Books.*
@@ -318,14 +611,14 @@ class MangaDB:
                     AND ei.imported_from = ?
                     ORDER BY {order_by}""", (id_onpage, imported_from))
         else:
+            # semi-join so books with multiple outdated links are only returned once
             c = self.db_con.execute(f"""
                     SELECT Books.*
-                    FROM Books, ExternalInfo ei
-                    WHERE Books.id = ei.book_id
-                    AND ei.outdated = 1
+                    FROM Books
+                    WHERE Books.id IN (SELECT book_id FROM ExternalInfo WHERE outdated = 1)
                     ORDER BY {order_by}""")
         rows = c.fetchall()
-        return [load_instance(self, Book, row) for row in rows] if rows else None
+        return load_instances(self, Book, rows, strategy=load_strategy) if rows else None
 
     def _validate_indentifiers_types(self, identifiers_types):
         if "url" in identifiers_types:
@@ -433,6 +726,21 @@ class MangaDB:
         else:
             return collection_id[0]
 
+    def usage_counts(self, col_name: str, names: Iterable[str], /) -> Dict[str, int]:
+        """
+        Returns a dict mapping the names (nocase) of values (tags, artists, ...) of the
+        associated column col_name to the nr of books they're on; read from the book_count
+        column that is kept up to date by triggers
+        """
+        return search.assoc_usage_counts(self.db_con, col_name, names)
+
+    def get_unused_tags(self, col_name: str, /) -> List[Tuple[int, str]]:
+        """Returns (id, name) of the values of col_name that aren't on any book"""
+        tag_table = col_name.capitalize()
+        c = self.db_con.execute(
+            f"SELECT id, name FROM {tag_table} WHERE book_count = 0 ORDER BY name")
+        return c.fetchall()
+
     # TODO generalize these when we do proper associated column representations
     def delete_tag(self, col_name: str, tag_id: int, /) -> None:
         """
@@ -470,10 +778,13 @@ class MangaDB:
             if getattr(book, col_name) == book._committed_state[col_name]:
                 del book._committed_state[col_name]
 
-        with self.db_con:
+        with self.transaction():
             # actually delete tag
             c.execute(f"DELETE FROM Book{tag_table} WHERE {bridge_id_col} = ?", (tag_id,))
             c.execute(f"DELETE FROM {tag_table} WHERE id = ?", (tag_id,))
+        self.assoc_name_ids.remove(tag_table, tag_name)
+        if self.posting_lists is not None:
+            self.posting_lists.remove_name(col_name, tag_name)
 
     def update_tag_name(self, col_name: str, tag_id: int, new_tag_name: str, /) -> bool:
         """
@@ -492,7 +803,7 @@ class MangaDB:
 
         # rename tag first so we see if we violate a constraint
         try:
-            with db_con:
+            with self.transaction():
                 db_con.execute(f"UPDATE {tag_table} SET name = ? WHERE id = ?",
                                (new_tag_name, tag_id))
         except sqlite3.IntegrityError:
@@ -500,6 +811,9 @@ class MangaDB:
                 "Could not rename %s '%s' to '%s' since the new name already exists",
                 col_name, old_tag_name, new_tag_name)
             return False
+        self.assoc_name_ids.rename(tag_table, old_tag_name, new_tag_name, tag_id)
+        if self.posting_lists is not None:
+            self.posting_lists.rename(col_name, old_tag_name, new_tag_name)
 
         # NOTE: @Hack need to update books in id_map with the new tag name
         # and also update their _committed_state since we don't have proper
@@ -541,7 +855,7 @@ class MangaDB:
 
         # just deleting and re-inserting in the correct order is probably faster
         # than swapping to a temp slot etc.
-        with self.db_con:
+        with self.transaction():
             c = self.db_con.execute(
                     "DELETE FROM BookCollection WHERE collection_id = ?", (collection_id,))
             # generator book_id, collection_id, in_collection_idx
@@ -578,13 +892,18 @@ class MangaDB:
         #     temp_move_to_cidx = new_in_cidx
 
     @overload
-    def get_books_in_collection(self, collection_identifier: str) -> Optional[List[Book]]: ...
+    def get_books_in_collection(
+            self, collection_identifier: str,
+            load_strategy: LoadStrategy = ...) -> Optional[List[Book]]: ...
 
     @overload
-    def get_books_in_collection(self, collection_identifier: int) -> Optional[List[Book]]: ...
+    def get_books_in_collection(
+            self, collection_identifier: int,
+            load_strategy: LoadStrategy = ...) -> Optional[List[Book]]: ...
 
     def get_books_in_collection(
-            self, collection_identifier: Union[str, int]) -> Optional[List[Book]]:
+            self, collection_identifier: Union[str, int],
+            load_strategy: LoadStrategy = LoadStrategy.LAZY) -> Optional[List[Book]]:
 
         if isinstance(collection_identifier, str):
             id_name = 'name'
@@ -600,7 +919,7 @@ class MangaDB:
                 ORDER BY bc.in_collection_idx ASC""", (collection_identifier,))
         rows = c.fetchall()
         if rows:
-            books = [load_instance(self, Book, row) for row in rows]
+            books = load_instances(self, Book, rows, strategy=load_strategy)
             return books
         else:
             return None
@@ -617,82 +936,150 @@ class MangaDB:
                               search_str: str,
                               order_by: str = "Books.id DESC",
                               delimiter: str = ";",
+                              load_strategy: LoadStrategy = LoadStrategy.LAZY,
+                              summary: bool = False,
                               **kwargs):
-        normal_col_values: Dict[str, str] = {}
-        assoc_col_values_incl: Dict[str, List[str]] = {}
-        assoc_col_values_excl: Dict[str, List[str]] = {}
-        # TODO turn language_id into language and so on
-        # Return all non-overlapping matches of pattern in string, as a list of strings.
-        # The string is scanned left-to-right, and matches are returned in the order found.
-        # If one or more groups are present in the pattern, return a list of groups; this will
-        # be a list of tuples if the pattern has more than one group. Empty matches are included
-        # in the result.
-        search_col = None
-        for match in WORD_RE.findall(search_str):
-            single, multi_word = match
-            part = None
-            # single alwys has : included unless its not our syntax
-            # since col:akdka;dajkda;dakda is one single word and col: is too
-            if single:
-                if ":" in single:
-                    # -> search type is part of the word
-                    search_col, part = single.split(":", 1)
-                    if search_col not in self.VALID_SEARCH_COLS:
-                        logger.info("'%s' is not a supported search type!", search_col)
-                        # set to None so we skip adding search_options for next word (which
-                        # still belongs to unsupported search_col)
-                        search_col = None
-                        continue
-                    if not part:
-                        # if part empty it was col:"multi-word"
-                        continue
-                else:
-                    # multiple single words after each other -> use to search for title
-                    # with normal syntax col is always in single word and no col if
-                    # search_col isnt set so we can append all single words till we find a single
-                    # word with :
-                    try:
-                        normal_col_values["title"] = f"{normal_col_values['title']} {single}"
-                    except KeyError:
-                        normal_col_values["title"] = single
-                    continue
-
-            # search_col is None if search_col isnt supported
-            # then we want to ignore this part of the search
-            if search_col is None:
-                continue
-
-            # a or b -> uses whatever var is true -> both true (which cant happen here) uses
-            # first one
-            part = part or multi_word
-
-            if search_col in Book.ASSOCIATED_COLUMNS:
-                incl, excl = search.search_assoc_col_string_parse(part, delimiter=delimiter)
-                # make sure not to add an empty list otherwise we wont get an empty dic
-                # that evaluates to false for testing in search_normal_mult_assoc
-                if incl:
-                    assoc_col_values_incl[search_col] = incl
-                if excl:
-                    assoc_col_values_excl[search_col] = excl
-            else:
-                normal_col_values[search_col] = part
-
-        # convert name of Censorship, Language etc. to id
-        self.convert_names_to_ids(normal_col_values)
+        ast = self._parse_search(search_str, delimiter=delimiter)
 
         # validate order_by from user input
         if not search.validate_order_by_str(order_by):
             logger.warning("Sorting %s is not supported", order_by)
             order_by = "Books.id DESC"
 
-        if normal_col_values or assoc_col_values_incl or assoc_col_values_excl:
-            rows = search.search_normal_mult_assoc(
-                    self.db_con, normal_col_values,
-                    assoc_col_values_incl, assoc_col_values_excl,
-                    order_by=order_by, **kwargs)
-            return [load_instance(self, Book, row) for row in rows]
+        if ast != search.And(()):
+            # page flips re-run the same searches so we cache the ids of the results
+            # webGUI passes the cursors as lists
+            after, before = kwargs.get("after"), kwargs.get("before")
+            cache_key = (ast, order_by, kwargs.get("limit", -1),
+                         tuple(after) if after is not None else None,
+                         tuple(before) if before is not None else None)
+            book_ids = self.search_cache.get(cache_key)
+            if book_ids is not None:
+                if summary:
+                    return self._load_book_summaries_by_ids(book_ids)
+                return self._load_books_by_ids(book_ids, load_strategy=load_strategy)
+
+            if summary:
+                rows = search.search_ast(self.db_con, self.search_compiler, ast,
+                                         order_by=order_by,
+                                         columns=BookSummary.SELECT_COLUMNS, **kwargs)
+                books = BookSummary.from_rows(self, rows)
+            else:
+                rows = search.search_ast(self.db_con, self.search_compiler, ast,
+                                         order_by=order_by, **kwargs)
+                books = load_instances(self, Book, rows, strategy=load_strategy)
+            self.search_cache.put(cache_key, [book.id for book in books])
+            return books
         else:
-            return self.get_x_books(kwargs.pop("limit", 60), order_by=order_by, **kwargs)
+            return self.get_x_books(kwargs.pop("limit", 60), order_by=order_by,
+                                    load_strategy=load_strategy, summary=summary, **kwargs)
+
+    def _parse_search(self, search_str: str, delimiter: str = ";") -> "search.SearchNode":
+        parser = search.SearchParser(self.VALID_SEARCH_COLS, Book.ASSOCIATED_COLUMNS,
+                                     delimiter=delimiter)
+        ast = parser.parse(search_str)
+        # convert name of Censorship, Language etc. to id
+        return search.map_column_conds(ast, self._convert_column_cond) or search.And(())
+
+    def search_facets(self, search_str: str, cols: Optional[List[str]] = None,
+                      top_n: int = 10, time_budget: float = 0.5,
+                      delimiter: str = ";") -> Optional[Dict[str, List[Tuple[str, int]]]]:
+        """
+        Returns the top_n values and how many of the books matching search_str have them
+        for every associated column in cols (default: all many-to-many columns)
+        Returns None if computing them would take longer than time_budget seconds
+        """
+        if cols is None:
+            cols = [col for col in Book.ASSOCIATED_COLUMNS
+                    if getattr(Book, col).relationship is Relationship.MANYTOMANY]
+        ast = self._parse_search(search_str, delimiter=delimiter)
+
+        cache_key = ("facets", ast, tuple(cols), top_n)
+        facets = self.search_cache.get(cache_key)
+        if facets is not None:
+            return facets
+
+        try:
+            with db_time_budget(self.db_con, time_budget):
+                facets = search.facet_counts(self.db_con, self.search_compiler, ast, cols,
+                                             top_n=top_n)
+        except sqlite3.OperationalError as e:
+            if not is_interrupted(e):
+                raise
+            logger.warning("Computing the facets for '%s' took longer than %.2fs",
+                           search_str, time_budget)
+            return None
+
+        self.search_cache.put(cache_key, facets)
+        return facets
+
+    def search_count(self, search_str: str, time_budget: float = 0.2,
+                     delimiter: str = ";") -> Tuple[int, bool]:
+        """
+        Returns the nr of books matching search_str and whether that count is exact
+        If counting takes longer than time_budget seconds the count is estimated from
+        the usage counts of the associated values in the search instead
+        """
+        ast = self._parse_search(search_str, delimiter=delimiter)
+        cache_key = ("count", ast)
+        count = self.search_cache.get(cache_key)
+        if count is not None:
+            return count
+
+        try:
+            with db_time_budget(self.db_con, time_budget):
+                count = (search.count_ast(self.db_con, self.search_compiler, ast), True)
+        except sqlite3.OperationalError as e:
+            if not is_interrupted(e):
+                raise
+            logger.debug("Counting the results for '%s' took longer than %.2fs, estimating "
+                         "instead", search_str, time_budget)
+            total, = self.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()
+            count = (self.search_compiler.estimate_count(ast, total), False)
+
+        self.search_cache.put(cache_key, count)
+        return count
+
+    def _load_books_by_ids(self, book_ids: List[int],
+                           load_strategy: LoadStrategy = LoadStrategy.LAZY) -> List[Book]:
+        """Returns the books in the order of book_ids, only fetches books that aren't loaded"""
+        books = {}
+        missing = []
+        for book_id in book_ids:
+            book = self.id_map.get((Book, (book_id,)))
+            if book is None:
+                missing.append(book_id)
+            else:
+                books[book_id] = book
+        if missing:
+            c = self.db_con.execute(f"""
+                SELECT * FROM Books
+                WHERE id IN ({', '.join(str(book_id) for book_id in missing)})""")
+            for row in c.fetchall():
+                books[row["id"]] = load_instance(self, Book, row)
+        result = [books[book_id] for book_id in book_ids if book_id in books]
+        load_associated_columns(self, Book, result, load_strategy)
+        return result
+
+    def _load_book_summaries_by_ids(self, book_ids: List[int]) -> List[BookSummary]:
+        """Returns the summaries of the books in the order of book_ids"""
+        if not book_ids:
+            return []
+        query = search.select_from_books(BookSummary.SELECT_COLUMNS, "")
+        query.append(f"WHERE Books.id IN ({', '.join(str(book_id) for book_id in book_ids)})")
+        rows = {row["id"]: row for row in self.db_con.execute("\n".join(query)).fetchall()}
+        return BookSummary.from_rows(
+            self, [rows[book_id] for book_id in book_ids if book_id in rows])
+
+    def _convert_column_cond(self,
+                             cond: "search.ColumnCond") -> Optional["search.ColumnCond"]:
+        dictlike = {cond.col: cond.value}
+        self.convert_names_to_ids(dictlike)
+        # conditions with invalid names get dropped
+        if not dictlike:
+            return None
+        (col, value), = dictlike.items()
+        return dataclasses.replace(cond, col=col, value=value)
 
     def convert_names_to_ids(self, dictlike):
         try:
@@ -717,8 +1104,14 @@ class MangaDB:
         except KeyError:
             pass
 
-    @staticmethod
-    def _load_or_create_sql_db(filename, read_only=False):
+    def _connect(self, database, **kwargs) -> sqlite3.Connection:
+        # check_same_thread=False: the connection may be used by other threads as long as
+        # it's only used by one at a time (e.g. webGUI.mdb.MangaDBPool)
+        return sqlite3.connect(database, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=self.settings.get("check_same_thread", True),
+                               **kwargs)
+
+    def _load_or_create_sql_db(self, filename, read_only=False):
         """
         Creates connection to sqlite3 db and a cursor object. Creates the DB if
         it doesn't exist yet.
@@ -733,25 +1126,25 @@ class MangaDB:
             if read_only is True:
                 raise MangaDBException("Can't create new database in read-only mode!")
             else:
-                return MangaDB._create_sql_db(filename)
+                return self._create_sql_db(filename)
 
         if read_only is True:
             # enable uri mode so we can pass mode ro for read-only access
-            conn = sqlite3.connect(f"file:{filename}?mode=ro", uri=True,
-                                   detect_types=sqlite3.PARSE_DECLTYPES)
+            conn = self._connect(f"file:{filename}?mode=ro", uri=True)
         else:
-            # PARSE_DECLTYPES -> parse types and search for converter function for
-            # it instead of searching for converter func for specific column name
-            conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES)
-
             # NOTE: migrate DB; context manager automatically closes connection
+            # migrate before connecting since restoring from a back-up replaces the DB file
+            # (and removes the WAL files)
             with migrate.Database(filename) as migration:
                 migration_success = migration.upgrade_to_latest()
             if not migration_success:
-                conn.close()
                 raise MangaDBException("Could not migrate DB! Open an issue at "
                                        "github.com/nilfoer/mangadb")
 
+            # PARSE_DECLTYPES -> parse types and search for converter function for
+            # it instead of searching for converter func for specific column name
+            conn = self._connect(filename)
+
         # use Row as row_factory for easier access
         conn.row_factory = sqlite3.Row
         # after row factory change otherwise cursor will still use tuples!
@@ -768,9 +1161,8 @@ class MangaDB:
 
         return conn, c
 
-    @staticmethod
-    def _create_sql_db(filename, read_only=False):
-        conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES)
+    def _create_sql_db(self, filename, read_only=False):
+        conn = self._connect(filename)
         c = conn.cursor()
 
         c.executescript("""
@@ -845,7 +1237,8 @@ class MangaDB:
             -- insensitive comparison when using '=' operator etc.
             CREATE TABLE List(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookList(
                     book_id INTEGER NOT NULL,
@@ -858,7 +1251,8 @@ class MangaDB:
                 );
             CREATE TABLE Tag(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookTag(
                     book_id INTEGER NOT NULL,
@@ -890,9 +1284,40 @@ class MangaDB:
                     FOREIGN KEY (censor_id) REFERENCES Censorship(id)
                        ON DELETE RESTRICT
                 );
+            -- ExternalInfo values aggregated per book (id is the book's id) so we can
+            -- sort by them using an index; NOT NULL so keyset pagination can use index
+            -- range scans: no ratings/external infos -> 0 or '' which sort first like NULL
+            -- (ext_upload_date is TEXT so the DATE converter doesn't choke on '')
+            CREATE TABLE ExternalInfoStats(
+                    id INTEGER PRIMARY KEY ASC,
+                    ext_rating REAL NOT NULL DEFAULT 0,
+                    ext_ratings INTEGER NOT NULL DEFAULT 0,
+                    ext_favorites INTEGER NOT NULL DEFAULT 0,
+                    ext_upload_date TEXT NOT NULL DEFAULT '',
+                    FOREIGN KEY (id) REFERENCES Books(id)
+                       ON DELETE CASCADE
+                );
+            -- names of the associated values of a book (id is the book's id) as JSON
+            -- arrays ordered by the values' ids ('[]' if there are none) so they can be
+            -- read with one primary key lookup; kept current by the book_aggregates_*
+            -- triggers
+            CREATE TABLE BookAggregates(
+                    id INTEGER PRIMARY KEY ASC,
+                    list TEXT NOT NULL DEFAULT '[]',
+                    tag TEXT NOT NULL DEFAULT '[]',
+                    category TEXT NOT NULL DEFAULT '[]',
+                    collection TEXT NOT NULL DEFAULT '[]',
+                    groups TEXT NOT NULL DEFAULT '[]',
+                    artist TEXT NOT NULL DEFAULT '[]',
+                    parody TEXT NOT NULL DEFAULT '[]',
+                    character TEXT NOT NULL DEFAULT '[]',
+                    FOREIGN KEY (id) REFERENCES Books(id)
+                       ON DELETE CASCADE
+                );
             CREATE TABLE Collection(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookCollection(
                     book_id INTEGER NOT NULL,
@@ -907,7 +1332,8 @@ class MangaDB:
                 );
             CREATE TABLE Category(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookCategory(
                     book_id INTEGER NOT NULL,
@@ -921,7 +1347,8 @@ class MangaDB:
             -- Group protected keyword in sql
             CREATE TABLE Groups(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookGroups(
                     book_id INTEGER NOT NULL,
@@ -935,7 +1362,8 @@ class MangaDB:
             CREATE TABLE Artist(
                     id INTEGER PRIMARY KEY ASC,
                     name TEXT UNIQUE NOT NULL COLLATE NOCASE,
-                    favorite INTEGER NOT NULL DEFAULT 0
+                    favorite INTEGER NOT NULL DEFAULT 0,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookArtist(
                     book_id INTEGER NOT NULL,
@@ -948,7 +1376,8 @@ class MangaDB:
                 );
             CREATE TABLE Parody(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookParody(
                     book_id INTEGER NOT NULL,
@@ -961,7 +1390,8 @@ class MangaDB:
                 );
             CREATE TABLE Character(
                     id INTEGER PRIMARY KEY ASC,
-                    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+                    name TEXT UNIQUE NOT NULL COLLATE NOCASE,
+                    book_count INTEGER NOT NULL DEFAULT 0
                 );
             CREATE TABLE BookCharacter(
                     book_id INTEGER NOT NULL,
@@ -995,6 +1425,44 @@ class MangaDB:
             CREATE UNIQUE INDEX idx_tag_name ON Tag (name COLLATE NOCASE);
             CREATE UNIQUE INDEX idx_title_eng_foreign
                 ON Books (title_eng, title_foreign);
+            -- so range searches like pages:>200 or upload_date:2020..2021 can use
+            -- index range scans
+            CREATE INDEX idx_books_my_rating ON Books (my_rating);
+            CREATE INDEX idx_books_pages ON Books (pages);
+            CREATE INDEX idx_books_last_change ON Books (last_change);
+            CREATE INDEX idx_external_info_upload_date ON ExternalInfo (upload_date);
+            -- also used for lookups by book_id alone (leading column)
+            CREATE INDEX idx_external_info_book_id_outdated
+                ON ExternalInfo (book_id, outdated);
+            -- bridge tables' primary keys are (book_id, x_id) so queries starting
+            -- from e.g. a tag need these (covering) indices
+            CREATE INDEX idx_book_list_list_id_book_id ON BookList (list_id, book_id);
+            CREATE INDEX idx_book_tag_tag_id_book_id ON BookTag (tag_id, book_id);
+            CREATE INDEX idx_book_category_category_id_book_id
+                ON BookCategory (category_id, book_id);
+            CREATE INDEX idx_book_collection_collection_id_book_id
+                ON BookCollection (collection_id, book_id);
+            CREATE INDEX idx_book_groups_group_id_book_id ON BookGroups (group_id, book_id);
+            CREATE INDEX idx_book_artist_artist_id_book_id ON BookArtist (artist_id, book_id);
+            CREATE INDEX idx_book_parody_parody_id_book_id ON BookParody (parody_id, book_id);
+            CREATE INDEX idx_book_character_character_id_book_id
+                ON BookCharacter (character_id, book_id);
+            -- book_count: nr of books a tag etc. is on, maintained by the *_book_count_*
+            -- triggers so usage counts don't need to COUNT the bridge tables
+            CREATE INDEX idx_list_book_count ON List (book_count);
+            CREATE INDEX idx_tag_book_count ON Tag (book_count);
+            CREATE INDEX idx_category_book_count ON Category (book_count);
+            CREATE INDEX idx_collection_book_count ON Collection (book_count);
+            CREATE INDEX idx_groups_book_count ON Groups (book_count);
+            CREATE INDEX idx_artist_book_count ON Artist (book_count);
+            CREATE INDEX idx_parody_book_count ON Parody (book_count);
+            CREATE INDEX idx_character_book_count ON Character (book_count);
+            -- book id is part of the indices implicitly (rowid) so they cover the
+            -- secondary sort column as well
+            CREATE INDEX idx_ext_info_stats_rating ON ExternalInfoStats (ext_rating);
+            CREATE INDEX idx_ext_info_stats_ratings ON ExternalInfoStats (ext_ratings);
+            CREATE INDEX idx_ext_info_stats_favorites ON ExternalInfoStats (ext_favorites);
+            CREATE INDEX idx_ext_info_stats_upload_date ON ExternalInfoStats (ext_upload_date);
 
             CREATE TRIGGER set_books_last_change
                                  AFTER UPDATE ON Books
@@ -1002,9 +1470,189 @@ class MangaDB:
                                     UPDATE Books
                                     SET last_change = DATE('now', 'localtime')
                                     WHERE id = NEW.id;
-                                 END
+                                 END;
+
+            CREATE TRIGGER ext_info_stats_book_insert
+                AFTER INSERT ON Books
+                BEGIN
+                    INSERT INTO ExternalInfoStats(id) VALUES (NEW.id);
+                END;
+            -- rating 0 means not rated (same as Book.avg_ext_rating)
+            CREATE TRIGGER ext_info_stats_insert
+                AFTER INSERT ON ExternalInfo
+                BEGIN
+                    UPDATE ExternalInfoStats
+                    SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                        SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                               IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                        FROM ExternalInfo
+                        WHERE ExternalInfo.book_id = ExternalInfoStats.id
+                    )
+                    WHERE id IN (NEW.book_id);
+                END;
+            CREATE TRIGGER ext_info_stats_delete
+                AFTER DELETE ON ExternalInfo
+                BEGIN
+                    UPDATE ExternalInfoStats
+                    SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                        SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                               IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                        FROM ExternalInfo
+                        WHERE ExternalInfo.book_id = ExternalInfoStats.id
+                    )
+                    WHERE id IN (OLD.book_id);
+                END;
+            CREATE TRIGGER ext_info_stats_update
+                AFTER UPDATE OF book_id, rating, ratings, favorites, upload_date ON ExternalInfo
+                BEGIN
+                    UPDATE ExternalInfoStats
+                    SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                        SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                               IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                        FROM ExternalInfo
+                        WHERE ExternalInfo.book_id = ExternalInfoStats.id
+                    )
+                    WHERE id IN (OLD.book_id, NEW.book_id);
+                END;
+
+            CREATE TRIGGER book_aggregates_book_insert
+                AFTER INSERT ON Books
+                BEGIN
+                    INSERT INTO BookAggregates(id) VALUES (NEW.id);
+                END;
+
+            -- full-text index over both titles so searching them doesn't need a
+            -- full scan of Books; external content -> titles are only stored in Books
+            CREATE VIRTUAL TABLE BooksTitleFts USING fts5(
+                title_eng,
+                title_foreign,
+                content='Books',
+                content_rowid='id'
+            );
+            CREATE TRIGGER books_title_fts_insert
+                AFTER INSERT ON Books
+                BEGIN
+                    INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+                    VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+                END;
+            CREATE TRIGGER books_title_fts_delete
+                AFTER DELETE ON Books
+                BEGIN
+                    INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+                    VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+                END;
+            CREATE TRIGGER books_title_fts_update
+                AFTER UPDATE OF title_eng, title_foreign ON Books
+                BEGIN
+                    INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+                    VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+                    INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+                    VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+                END
                  """
         c.executescript(create_db_sql)
+
+        # re-build a BookAggregates column of the affected book(s) when their bridge table
+        # rows change or when a value gets renamed and keep the book_count of the
+        # associated table current
+        for col in Book.ASSOCIATED_COLUMNS:
+            if col == "ext_infos":
+                continue
+            table_name, bridge_col_name = joined_col_name_to_query_names(col)
+            aggregate = f"""
+                    UPDATE BookAggregates
+                    SET {col} = (
+                        SELECT json_group_array(name) FROM (
+                            SELECT x.name
+                            FROM Book{table_name} bx
+                            JOIN {table_name} x ON x.id = bx.{bridge_col_name}
+                            WHERE bx.book_id = BookAggregates.id
+                            ORDER BY x.id
+                        )
+                    )"""
+            c.executescript(f"""
+                CREATE TRIGGER book_aggregates_{col}_insert
+                    AFTER INSERT ON Book{table_name}
+                    BEGIN{aggregate}
+                        WHERE id IN (NEW.book_id);
+                    END;
+                CREATE TRIGGER book_aggregates_{col}_delete
+                    AFTER DELETE ON Book{table_name}
+                    BEGIN{aggregate}
+                        WHERE id IN (OLD.book_id);
+                    END;
+                CREATE TRIGGER book_aggregates_{col}_update
+                    AFTER UPDATE OF book_id, {bridge_col_name} ON Book{table_name}
+                    BEGIN{aggregate}
+                        WHERE id IN (OLD.book_id, NEW.book_id);
+                    END;
+                CREATE TRIGGER book_aggregates_{col}_rename
+                    AFTER UPDATE OF name ON {table_name}
+                    BEGIN{aggregate}
+                        WHERE id IN (SELECT book_id FROM Book{table_name}
+                                     WHERE {bridge_col_name} = NEW.id);
+                    END;
+
+                CREATE TRIGGER {table_name.lower()}_book_count_insert
+                    AFTER INSERT ON Book{table_name}
+                    BEGIN
+                        UPDATE {table_name} SET book_count = book_count + 1
+                        WHERE id = NEW.{bridge_col_name};
+                    END;
+                CREATE TRIGGER {table_name.lower()}_book_count_delete
+                    AFTER DELETE ON Book{table_name}
+                    BEGIN
+                        UPDATE {table_name} SET book_count = book_count - 1
+                        WHERE id = OLD.{bridge_col_name};
+                    END;
+                CREATE TRIGGER {table_name.lower()}_book_count_update
+                    AFTER UPDATE OF {bridge_col_name} ON Book{table_name}
+                    BEGIN
+                        UPDATE {table_name} SET book_count = book_count - 1
+                        WHERE id = OLD.{bridge_col_name};
+                        UPDATE {table_name} SET book_count = book_count + 1
+                        WHERE id = NEW.{bridge_col_name};
+                    END
+                """)
+
+        # substring index for titles (mainly for CJK titles that can't be split into words)
+        # the trigram tokenizer is only available since SQLite 3.34.0
+        # without it MangaDB falls back to an in-memory trigram index
+        try:
+            c.executescript("""
+                CREATE VIRTUAL TABLE BooksTitleTrigram USING fts5(
+                    title_eng,
+                    title_foreign,
+                    content='Books',
+                    content_rowid='id',
+                    tokenize='trigram'
+                );
+                CREATE TRIGGER books_title_trigram_insert
+                    AFTER INSERT ON Books
+                    BEGIN
+                        INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+                        VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+                    END;
+                CREATE TRIGGER books_title_trigram_delete
+                    AFTER DELETE ON Books
+                    BEGIN
+                        INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng,
+                                                      title_foreign)
+                        VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+                    END;
+                CREATE TRIGGER books_title_trigram_update
+                    AFTER UPDATE OF title_eng, title_foreign ON Books
+                    BEGIN
+                        INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng,
+                                                      title_foreign)
+                        VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+                        INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+                        VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+                    END
+                """)
+        except sqlite3.OperationalError:
+            logger.info("SQLite version %s has no trigram tokenizer, substring search "
+                        "will use an in-memory index", sqlite3.sqlite_version)
         # commit changes
         conn.commit()
 
@@ -12,6 +12,7 @@ from ..manga_db import update_cookies_from_file
 from .webGUI import main_bp
 from .csrf import init_app as csrf_init_app
 from .auth import auth_bp, init_app as auth_init_app
+from .mdb import init_app as mdb_init_app
 
 
 EXTRACT_DOMAIN_RE: Pattern = re.compile(
@@ -89,7 +90,13 @@ def create_app(instance_path=None, test_config=None, **kwargs):
         # path to thumbs folder
         THUMBS_FOLDER=os.path.join(app.instance_path, "thumbs"),
         # limit upload size to 0,5MB
-        MAX_CONTENT_LENGTH=0.5 * 1024 * 1024
+        MAX_CONTENT_LENGTH=0.5 * 1024 * 1024,
+        # passed to MangaDB; keep recently used books in memory between requests
+        # connection PRAGMAs (journal_mode, cache_size, busy_timeout, ...) can be set here
+        # as well (see db.util.CONNECTION_PRAGMAS) e.g. using the instance config
+        MANGADB_SETTINGS={"id_map_cache_size": 256},
+        # nr of read-only MangaDBs (connections) requests that only read are served from
+        MANGADB_READ_POOL_SIZE=4,
     )
 
     # ensure the instance folder exists
@@ -139,6 +146,7 @@ def create_app(instance_path=None, test_config=None, **kwargs):
             return s
 
     csrf_init_app(app)
+    mdb_init_app(app)
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     auth_init_app(app)
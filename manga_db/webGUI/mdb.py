@@ -1,27 +1,145 @@
+import queue
 import threading
 
-from flask import current_app
+from typing import List, Optional
+
+from flask import current_app, g, has_request_context, request
 
 from ..manga_db import MangaDB
 
 
-# Thread-local data is data whose values are thread specific. To manage thread-local data, just #
-# create an instance of local (or a subclass) and store attributes on it
-# t_local = threading.local()
-# we get AttributeError: '_thread._local' object has no attribute 'mdb' if we didnt assign attr yet
-# and it needs to be assigned for every thread separately -> better to subclass threading.local
-class app_thread_data(threading.local):
-    def __init__(self):
-        super().__init__()
-        self.mdb_init = False
+class MangaDBPool:
+    """
+    Lets the webGUI serve requests from multiple threads: requests that only read use one
+    of a pool of read-only MangaDBs, requests that write (see writes_db) use the single
+    writer which is locked for the whole request so writes are serialized
+    A MangaDB is only ever used by one request at a time (connections are opened with
+    check_same_thread=False since they get passed between the server's threads), so every
+    request has its own IdentityMap etc. to work with; changes made by the writer are
+    picked up by the readers since their caches (and their IdentityMap at the start of
+    a request) are dropped once the db was modified by another connection
+    (PRAGMA data_version)
+    """
+
+    def __init__(self, root_dir: str, db_path: str, size: int = 4, settings=None):
+        self.root_dir = root_dir
+        self.db_path = db_path
+        self.size = size
+        self.settings = dict(settings or {})
+        self.settings["check_same_thread"] = False
+
+        self._lock = threading.Lock()
+        self._writer: Optional[MangaDB] = None
+        self._writer_lock = threading.Lock()
+        # LIFO so the MangaDBs with the warmest caches get re-used
+        self._readers: "queue.LifoQueue[MangaDB]" = queue.LifoQueue()
+        self._all_readers: List[MangaDB] = []
+
+    def _get_writer(self) -> MangaDB:
+        with self._lock:
+            # created first since it creates/migrates the DB, which the read-only
+            # connections can't do
+            if self._writer is None:
+                self._writer = MangaDB(self.root_dir, self.db_path, settings=self.settings)
+            return self._writer
+
+    def acquire_writer(self) -> MangaDB:
+        writer = self._get_writer()
+        self._writer_lock.acquire()
+        return writer
+
+    def release_writer(self) -> None:
+        self._writer_lock.release()
+
+    def acquire_reader(self) -> MangaDB:
+        self._get_writer()
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all_readers) < self.size:
+                reader = MangaDB(self.root_dir, self.db_path, read_only=True,
+                                 settings=self.settings)
+                self._all_readers.append(reader)
+                return reader
+        # wait for another request to return its MangaDB
+        return self._readers.get()
+
+    def release_reader(self, reader: MangaDB) -> None:
+        self._readers.put(reader)
+
+    def close(self) -> None:
+        with self._lock:
+            for reader in self._all_readers:
+                reader.close()
+            self._all_readers = []
+            self._readers = queue.LifoQueue()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+def writes_db(decorated_function):
+    """Marks views that write to the DB even though they're requested using GET"""
+    decorated_function.writes_db = True
+    return decorated_function
+
+
+def _request_writes() -> bool:
+    if not has_request_context():
+        return True
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        return True
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    return getattr(view, "writes_db", False)
+
+
+def get_mdb() -> MangaDB:
+    # one MangaDB per request, which is returned to the pool on teardown
+    if "mdb" not in g:
+        pool = current_app.extensions["mangadb_pool"]
+        if _request_writes():
+            g.mdb = pool.acquire_writer()
+            g.mdb_is_writer = True
+        else:
+            g.mdb = pool.acquire_reader()
+            g.mdb_is_writer = False
+        # expire instances that are stale due to writes by other connections since the
+        # MangaDB was last used
+        g.mdb.id_map.validate()
+    return g.mdb
 
 
-t_local = app_thread_data()
+def release_mdb(exc=None) -> None:
+    mdb = g.pop("mdb", None)
+    if mdb is None:
+        return
+    pool = current_app.extensions["mangadb_pool"]
+    if exc is not None:
+        # the instances might have been modified by the failed request
+        mdb.id_map.clear()
+    if g.pop("mdb_is_writer"):
+        # don't leave a transaction (and the write lock) open for the next request
+        if mdb.db_con.in_transaction:
+            if exc is None:
+                mdb.db_con.commit()
+            else:
+                mdb.db_con.rollback()
+                mdb.invalidate_caches()
+        pool.release_writer()
+    else:
+        if exc is not None and mdb.db_con.in_transaction:
+            mdb.db_con.rollback()
+        pool.release_reader(mdb)
 
 
-def get_mdb():
-    if not t_local.mdb_init:
-        # cant store in app.config since thread specific and app config isnt
-        t_local.mdb = MangaDB(current_app.instance_path, current_app.config["DATABASE_PATH"])
-        t_local.mdb_init = True
-    return t_local.mdb
+def init_app(app) -> None:
+    app.extensions["mangadb_pool"] = MangaDBPool(
+        app.instance_path, app.config["DATABASE_PATH"],
+        size=app.config["MANGADB_READ_POOL_SIZE"],
+        settings=app.config["MANGADB_SETTINGS"])
+    # g belongs to the app context which might outlive the request (an app context that
+    # was pushed already is re-used by the request) -> release on request teardown too
+    app.teardown_request(release_mdb)
+    app.teardown_appcontext(release_mdb)
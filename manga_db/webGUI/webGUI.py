@@ -20,14 +20,15 @@ from flask import (
 )
 from markupsafe import Markup
 
-from .mdb import get_mdb
+from .mdb import get_mdb, writes_db
 from .json_custom import to_serializable
 from ..constants import STATUS_IDS
 from ..manga_db import MangaDB, update_cookies_from_file
-from ..manga import Book
+from ..manga import Book, BookSummary
 from ..extractor.base import MangaExtractorData
 from ..import extractor
-from ..db.search import validate_order_by_str
+from ..db.search import validate_order_by_str, order_by_table, EXT_STATS_COLS
+from ..db.constants import LoadStrategy
 from ..ext_info import ExternalInfo
 from .. import extractor
 
@@ -94,7 +95,7 @@ def handle_search_sort():
 
 def get_books(query=None):
     order_by_col, asc_desc = handle_search_sort()
-    order_by = f"Books.{order_by_col} {asc_desc}"
+    order_by = f"{order_by_table(order_by_col)}.{order_by_col} {asc_desc}"
     # dont need to validate since we pass them in with SQL param substitution
     after = request.args.getlist("after", None)
     after = after if after else None
@@ -110,11 +111,12 @@ def get_books(query=None):
 
     if query:
         # get 1 entry more than BOOKS_PER_PAGE so we know if we need btn in that direction
+        # the listing only needs a few columns -> use read-only summaries instead of Books
         books = get_mdb().search(query, order_by=order_by, limit=BOOKS_PER_PAGE+1,
-                                 after=after, before=before)
+                                 after=after, before=before, summary=True)
     else:
         books = get_mdb().get_x_books(BOOKS_PER_PAGE+1, after=after, before=before,
-                                      order_by=order_by)
+                                      order_by=order_by, summary=True)
     first, last, more = first_last_more(books, order_by_col, after, before)
 
     return books, order_by_col, asc_desc, first, last, more
@@ -476,8 +478,14 @@ def first_last_more(books, order_by_col="id", after=None, before=None):
     if "id" != order_by_col.lower():
         # if we are sorting by something else than id
         # we also need to pass the values of that col
-        primary_first = getattr(books[0], order_by_col)
-        primary_last = getattr(books[-1], order_by_col)
+        if order_by_col in EXT_STATS_COLS and not isinstance(books[0], BookSummary):
+            # not an attribute of Book -> get the exact values we sorted by from the db
+            ext_stats = get_mdb().get_ext_stats((books[0].id, books[-1].id))
+            primary_first = ext_stats[first_id][order_by_col]
+            primary_last = ext_stats[last_id][order_by_col]
+        else:
+            primary_first = getattr(books[0], order_by_col)
+            primary_last = getattr(books[-1], order_by_col)
         return (primary_first, first_id), (primary_last, last_id), more
     else:
         return first_id, last_id, more
@@ -490,6 +498,7 @@ def search_books():
         return redirect(url_for("main.jump_to_book_by_url", ext_url=searchstr))
 
     books, order_by_col, asc_desc, first, last, more = get_books(searchstr)
+    nr_results, nr_results_exact = get_mdb().search_count(searchstr)
 
     return render_template(
         'show_entries.html',
@@ -497,11 +506,24 @@ def search_books():
         more=more,
         first=first,
         last=last,
+        nr_results=nr_results,
+        nr_results_exact=nr_results_exact,
         search_field=searchstr,
         order_col=order_by_col,
         asc_desc=asc_desc)
 
 
+@main_bp.route("/search/facets", methods=["GET"])
+def search_facets():
+    searchstr = request.args.get("q", "", type=str)
+    top_n = request.args.get("top_n", 10, type=int)
+    facets = get_mdb().search_facets(searchstr, top_n=top_n)
+    if facets is None:
+        return jsonify({"error": "Computing the facets took too long!"})
+    return jsonify({"facets": {col: [{"name": name, "count": count} for name, count in counts]
+                               for col, counts in facets.items()}})
+
+
 # function that accepts ajax request so we can add lists on show_info
 # without reloading the page or going to edit
 @main_bp.route("/book/<int:book_id>/list/<action>", methods=["POST"])
@@ -537,6 +559,7 @@ def list_action_ajax(book_id, action):
 
 
 @main_bp.route("/book/<int:book_id>/set/fav/<int:fav_intbool>")
+@writes_db
 def set_favorite(book_id, fav_intbool):
     Book.set_favorite_id(get_mdb(), book_id, fav_intbool)
     return redirect(
@@ -544,6 +567,7 @@ def set_favorite(book_id, fav_intbool):
 
 
 @main_bp.route("/book/<int:book_id>/rate/<float:rating>")
+@writes_db
 def rate_book(book_id, rating):
     Book.rate_book_id(get_mdb(), book_id, rating)
     return redirect(
@@ -552,6 +576,7 @@ def rate_book(book_id, rating):
 
 # TODO these set.. routes should use POST
 @main_bp.route("/book/<int:book_id>/ext_info/<int:ext_info_id>/set/downloaded/<int:intbool>")
+@writes_db
 def set_downloaded(book_id, ext_info_id, intbool):
     ExternalInfo.set_downloaded_id(get_mdb(), ext_info_id, intbool)
     return redirect(
@@ -563,9 +588,10 @@ def show_outdated_links():
     id_onpage = request.args.get("id_onpage", None, type=str)
     imported_from = request.args.get("imported_from", None, type=int)
     if id_onpage and imported_from:
-        books = get_mdb().get_outdated(id_onpage, imported_from)
+        books = get_mdb().get_outdated(id_onpage, imported_from,
+                                       load_strategy=LoadStrategy.BATCHED)
     else:
-        books = get_mdb().get_outdated()
+        books = get_mdb().get_outdated(load_strategy=LoadStrategy.BATCHED)
 
     flash("Showing books with outdated links!", "title")
     flash("Newest first!", "info")
@@ -1037,7 +1063,8 @@ def manage_tags():
 
     mdb = get_mdb()
     c = mdb.db_con.execute(
-        f"SELECT id, name FROM {tag_tbl_name} WHERE name LIKE '%{search_str}%'")
+        f"SELECT id, name, book_count FROM {tag_tbl_name} WHERE name LIKE ?",
+        (f"%{search_str}%",))
     tags = c.fetchall()
 
     return render_template(
@@ -1,4 +1,5 @@
 import os
+import gc
 import datetime
 import logging
 import sqlite3
@@ -6,9 +7,10 @@ import pytest
 
 from utils import setup_mdb_dir, all_book_info, load_db_from_sql_file, TESTS_DIR
 from manga_db.manga_db import MangaDB
-from manga_db.manga import Book
+from manga_db.manga import Book, BookSummary
 from manga_db.ext_info import ExternalInfo
 from manga_db.constants import LANG_IDS
+from manga_db.db.constants import LoadStrategy
 
 @pytest.mark.parametrize("title_eng, title_foreign, expected", [
     ("English", "Foreign", "English / Foreign"),
@@ -37,6 +39,42 @@ def test_fetch_extinfo(monkeypatch, setup_mdb_dir):
     assert b._fetch_external_infos() == [ei1, ei2]
 
 
+def test_fetch_extinfo_batched(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    os.chdir(tmpdir)
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    # loading by book id uses the index instead of scanning ExternalInfo
+    plan = " ".join(row[3] for row in memdb.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM ExternalInfo WHERE book_id = ? ORDER BY id", (16,)))
+    assert "USING INDEX idx_external_info_book_id_outdated" in plan
+
+    memdb.execute("UPDATE ExternalInfo SET outdated = 1 WHERE id = 18")
+    books = [mdb.get_book(_id) for _id in (16, 13, 12)]
+    statements = []
+    memdb.set_trace_callback(statements.append)
+    ext_infos = Book.fetch_external_infos_batched(mdb, books)
+    assert len([s for s in statements if "FROM ExternalInfo" in s]) == 1
+    assert {book_id: [ei.id for ei in eis] for book_id, eis in ext_infos.items()} == {
+            16: [16, 18], 13: [13], 12: [12]}
+    assert all(ei.book is book for book in books for ei in ext_infos[book.id])
+    # books' ext_infos are left alone
+    assert not Book.ext_infos.is_loaded(books[0])
+
+    outdated = Book.fetch_external_infos_batched(mdb, books, outdated=True)
+    assert [ei.id for ei in outdated[16]] == [18]
+    assert outdated[13] == [] and outdated[12] == []
+    assert [ei.id for ei in Book.fetch_external_infos_batched(
+        mdb, books[:1], outdated=False)[16]] == [16]
+
+    outdated_books = mdb.get_outdated()
+    assert [b.id for b in outdated_books] == [16]
+
+
 def test_fetch_assoc_col(monkeypatch, setup_mdb_dir):
     tmpdir = setup_mdb_dir
     os.chdir(tmpdir)
@@ -143,6 +181,188 @@ def test_upd_assoc_col(monkeypatch, setup_mdb_dir):
     assert b.ext_infos == [ei1, ei2]
 
 
+def test_lazy_assoc_cols(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    os.chdir(tmpdir)
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    statements = []
+    memdb.set_trace_callback(statements.append)
+
+    # only the Books rows are queried
+    books = mdb.get_x_books(60)
+    assert len(books) == 17
+    assert len(statements) == 1
+    assert all(not b._committed_state for b in books)
+
+    b = mdb.get_book(_id=12)
+    statements.clear()
+    assert "tag" not in vars(b)
+    assert b.tag == b._fetch_associated_column("tag")
+    assert b.tag[0] == "Anal"
+    # first access fetched it, only the explicit _fetch_associated_column queried again
+    assert len(statements) == 2
+    assert not b._committed_state
+
+    # assigning an unloaded column loads the committed state first
+    b.artist = ["tartist"]
+    assert b._committed_state == {"artist": ["Kaneda Asou"]}
+    b.list.append("favorite")
+    assert b._committed_state["list"] == ["to-read"]
+    assert [ei.id for ei in b.ext_infos] == [12]
+    assert "ext_infos" not in b._committed_state
+
+    # books that are not in the db have no values to load
+    b = Book(mdb, in_db=False, id=12)
+    assert b.tag == []
+
+    # values passed for books in the db are taken as loaded
+    statements.clear()
+    b = Book(mdb, in_db=True, id=12, tag=["Anal"], artist=["Kaneda Asou"])
+    assert b.tag == ["Anal"] and b.artist == ["Kaneda Asou"]
+    assert not statements
+    assert "tag" not in b._committed_state and "artist" not in b._committed_state
+    b.tag.append("New")
+    assert b._committed_state["tag"] == ["Anal"]
+
+
+def test_load_strategies(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    os.chdir(tmpdir)
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def assoc_values(book, load):
+        values = {col: load(book, col) for col in Book.ASSOCIATED_COLUMNS}
+        # don't keep references to the books through their ext infos
+        values["ext_infos"] = [ei.id for ei in values["ext_infos"]]
+        return values
+
+    expected = {book.id: assoc_values(book, Book._load_associated_column)
+                for book in mdb.get_x_books(-1)}
+    statements = []
+    memdb.set_trace_callback(statements.append)
+
+    # one query for the books, one for the aggregated columns and one for the ext infos
+    books = mdb.get_x_books(-1, load_strategy=LoadStrategy.BATCHED)
+    assert len(statements) == 3
+    statements.clear()
+    for book in books:
+        assert assoc_values(book, getattr) == expected[book.id]
+        assert not book._committed_state
+        assert all(ei.book is book for ei in book.ext_infos)
+    assert not statements
+    del books, book
+
+    # already loaded (and modified) columns aren't overwritten
+    book = mdb.get_book(_id=12)
+    book.tag.append("New tag")
+    books = mdb.search("tag:Nakadashi", load_strategy=LoadStrategy.BATCHED)
+    assert book in books
+    assert book.tag == expected[12]["tag"] + ["New tag"]
+    assert book._committed_state == {"tag": expected[12]["tag"]}
+    # cached search results are loaded the same way
+    statements.clear()
+    books = mdb.search("tag:Nakadashi", load_strategy=LoadStrategy.BATCHED)
+    assert len(statements) == 1
+    # ext infos reference their book -> need gc to remove them from the id_map
+    del books, book
+    gc.collect()
+
+    statements.clear()
+    books = mdb.get_books_in_collection("Dolls", load_strategy=LoadStrategy.EAGER)
+    assert len(statements) == 1 + len(books) * len(Book.ASSOCIATED_COLUMNS)
+    assert [b.collection for b in books] == [expected[b.id]["collection"] for b in books]
+    statements.clear()
+    books = mdb.get_outdated()
+    assert len(statements) == 1
+
+
+def test_book_summary(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    os.chdir(tmpdir)
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    statements = []
+    memdb.set_trace_callback(statements.append)
+
+    # one query for the books and one for the associated columns of the summary
+    summaries = mdb.get_x_books(-1, order_by="Books.pages DESC", summary=True)
+    assert len(statements) == 2
+    assert all(isinstance(s, BookSummary) for s in summaries)
+    # not added to the id_map
+    assert not mdb.id_map
+    books = mdb.get_x_books(-1, order_by="Books.pages DESC")
+    assert [s.id for s in summaries] == [b.id for b in books]
+    for summary, book in zip(summaries, books):
+        for col in BookSummary.BOOK_COLUMNS + BookSummary.ASSOCIATED_COLUMNS:
+            assert getattr(summary, col) == getattr(book, col)
+        assert summary.title == book.title
+        assert summary.avg_ext_rating == pytest.approx(book.avg_ext_rating)
+
+    summary = summaries[0]
+    with pytest.raises(AttributeError):
+        summary.title_eng = "Changed"
+    with pytest.raises(AttributeError):
+        summary.new_attr = 1
+    assert not hasattr(summary, "__dict__")
+
+    expected = [b.id for b in mdb.search("tag:Nakadashi")]
+    mdb.search_cache.clear()
+    statements.clear()
+    summaries = mdb.search("tag:Nakadashi", summary=True)
+    # ignoring the change detection of the search cache/indices
+    assert len([s for s in statements if not s.startswith("PRAGMA")]) == 2
+    assert [s.id for s in summaries] == expected
+    # cached search results
+    summaries = mdb.search("tag:Nakadashi", summary=True)
+    assert [s.id for s in summaries] == expected
+    assert all(isinstance(s, BookSummary) for s in summaries)
+
+
+def test_from_row(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    os.chdir(tmpdir)
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    row = memdb.execute("SELECT * FROM Books WHERE id = 12").fetchone()
+    b = Book.from_row(mdb, row)
+    expected = Book(mdb, **row, in_db=True)
+    assert b._in_db
+    assert b.export_for_db() == expected.export_for_db()
+    # hydrating doesn't count as change
+    assert not b._committed_state
+    assert b.tag == expected.tag
+
+    # tracking starts after hydration
+    b.pages = 100
+    b.tag.append("New tag")
+    assert b._committed_state == {"pages": row["pages"], "tag": expected.tag}
+
+    ei_row = memdb.execute("SELECT * FROM ExternalInfo WHERE book_id = 12").fetchone()
+    ei = ExternalInfo.from_row(mdb, ei_row, b)
+    assert ei.book is b
+    assert ei.export_for_db() == ExternalInfo(mdb, b, **ei_row, in_db=True).export_for_db()
+    assert ei.site == ExternalInfo(mdb, b, **ei_row, in_db=True).site
+    assert not ei._committed_state
+
+    with pytest.raises(TypeError):
+        Book.from_row(mdb, {**row, "pages": "many"})
+
+
 def test_diff(monkeypatch, setup_mdb_dir):
     tmpdir = setup_mdb_dir
     os.chdir(tmpdir)
@@ -1,6 +1,6 @@
 import pytest
 
-from manga_db.db.column_associated import trackable_type, AssociatedColumnOne, AssociatedColumnMany
+from manga_db.db.column_associated import TrackedList, AssociatedColumnOne, AssociatedColumnMany
 from manga_db.db.constants import Relationship
 
 
@@ -70,29 +70,44 @@ def test_assoc_col(create_obj_with_col_assoc):
 
 def on_change_callback(instance, name, was_unitiialized, before, after):
     instance.revisions.append(before)
+    instance._committed_state[name] = before
 
 
-def test_trackable_type():
-    class WithTrackable:
+def test_tracked_list():
+    class WithTracked:
         def __init__(self):
-            self.trackable = trackable_type(self, "trackable", list, on_change_callback)
+            self._committed_state = {}
             self.revisions = []
-    o = WithTrackable()
+            self.tracked = TrackedList(self, "tracked", on_change=on_change_callback)
+    o = WithTracked()
+    assert not o.revisions
+    assert not o.tracked.dirty
+    # no changes
+    o.tracked.extend([])
+    o.tracked.sort()
     assert not o.revisions
-    o.trackable.append(1)
-    assert o.trackable == [1]
+    o.tracked.append(1)
+    assert o.tracked == [1]
+    assert o.tracked.dirty
     assert o.revisions == [[]]
-    o.trackable.append(2)
-    assert o.trackable == [1, 2]
-    assert o.revisions == [[], [1]]
-    o.trackable.extend(range(3, 6))
-    assert o.trackable == [1, 2, 3, 4, 5]
-    assert o.revisions == [[], [1], [1, 2]]
-    o.trackable.remove(2)
-    assert o.trackable == [1, 3, 4, 5]
-    assert o.revisions == [[], [1], [1, 2], [1, 2, 3, 4, 5]]
-    o.trackable.reverse()
-    assert o.trackable == [5, 4, 3, 1]
-    assert o.revisions == [[], [1], [1, 2], [1, 2, 3, 4, 5], [1, 3, 4, 5]]
-
-
+    # already dirty -> not tracked
+    o.tracked.extend(range(2, 6))
+    o.tracked.remove(2)
+    o.tracked += [6]
+    o.tracked[0] = 0
+    assert o.tracked == [0, 3, 4, 5, 6]
+    assert o.revisions == [[]]
+    assert isinstance(o.tracked, TrackedList)
+
+    # after a commit the next change gets tracked again
+    o._committed_state = {}
+    o.tracked.reverse()
+    assert o.tracked == [6, 5, 4, 3, 0]
+    assert o.revisions == [[], [0, 3, 4, 5, 6]]
+    del o.tracked[1:]
+    assert o.tracked == [6]
+    assert o.revisions == [[], [0, 3, 4, 5, 6]]
+
+    # one class for all columns/instances
+    assert type(WithTracked().tracked) is type(o.tracked) is TrackedList
+    assert type(o.tracked.copy()) is list
@@ -152,12 +152,16 @@ def test_created_db_matches_row_classes():
 
     # Censorship, Languages, Sites and Status are extra tables not used by any DBRow object
     # they're used in MangaDB class directly (manual sql code)
+    # same for the search indices (FTS5 tables incl. their shadow tables) and tables
+    # maintained by triggers
     # make unique since we might have duplicate entries: one for the TableName(DBRow) class
     # and one or more as associated column
     all_tables = list(set(all_tables))
-    assert sorted(all_tables +
-                  ["Censorship", "Languages", "Sites", "Status",
-                   migrate.VERSION_TABLE]) == all_expected_tables
+    fts_tables = [f"{fts_table}{suffix}" for fts_table in ("BooksTitleFts", "BooksTitleTrigram")
+                  for suffix in ("", "_config", "_data", "_docsize", "_idx")]
+    assert sorted(all_tables + fts_tables +
+                  ["Censorship", "Languages", "Sites", "Status", "ExternalInfoStats",
+                   "BookAggregates", migrate.VERSION_TABLE]) == all_expected_tables
 
 
 def test_export_to_sql(setup_tmpdir):
@@ -1,11 +1,18 @@
 import os
+import pytest
 from utils import setup_mdb_dir, TESTS_DIR, load_db_from_sql_file
 
 from manga_db.manga_db import MangaDB
+from manga_db.manga import Book
 from manga_db.db.search import (
         search_assoc_col_string_parse, validate_order_by_str, search_book_by_title,
-        search_normal_mult_assoc, keyset_pagination_statment
+        search_normal_mult_assoc, keyset_pagination_statment, title_fts_query,
+        build_search_ast, assoc_usage_counts, SearchCompiler, AssocValue, ColumnCond, Not, And,
+        Or, SearchParser, tokenize_search, search_ast, date_bounds, parse_range_cond
         )
+from manga_db.db.trigram import TrigramIndex
+from manga_db.db.posting_lists import PostingListIndex
+from manga_db.db.query_plans import explain_workload, explain, QueryPlan
 
 
 def test_search_assoc_col_string_parse():
@@ -43,12 +50,23 @@ def test_search_book_by_title(monkeypatch, setup_mdb_dir):
     monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
                         lambda x, y, z: (memdb, None))
     mdb = MangaDB(tmpdir, mdb_file)
+    # words are matched as prefixes of the words in title_eng/title_foreign or as
+    # substrings if they're long enough
     args_first_len = [
+            (("doll", "Books.id DESC", -1, None), 14, 2),
+            (("doll", "Books.id ASC", -1, None), 3, 2),
+            (("doll", "Books.pages DESC", -1, None), 14, 2),
+            (("doll", "Books.id DESC", 1, None), 14, 1),
+            (("dolls ch. 2", "Books.id DESC", -1, None), 3, 1),
+            (("ドールズ", "Books.id DESC", -1, None), 14, 2),
+            (("top", "Books.id DESC", -1, None), 12, 2),
+            (("Onee-chan", "Books.id DESC", -1, None), 6, 1),
+            # not at the start of a word -> found by the trigram index
             (("atsu", "Books.id DESC", -1, None), 6, 2),
             (("atsu", "Books.id ASC", -1, None), 2, 2),
-            (("atsu", "Books.pages DESC", -1, None), 6, 2),
-            (("atsu", "Books.id DESC", 1, None), 6, 1),
-            (("top", "Books.id DESC", -1, None), 12, 2),
+            (("atsu festival", "Books.id DESC", -1, None), 2, 1),
+            # too short for trigrams -> only matched as prefix
+            (("at", "Books.id DESC", -1, None), None, None),
             (("afhnksagjoiks", "Books.id DESC", -1, None), None, None)
             ]
 
@@ -61,6 +79,125 @@ def test_search_book_by_title(monkeypatch, setup_mdb_dir):
             assert len(rows) == nr
 
 
+def test_title_fts_query():
+    assert title_fts_query("doll") == '"doll"*'
+    assert title_fts_query("  dolls  ch. 2") == '"dolls"* "ch."* "2"*'
+    assert title_fts_query('say "hi" - OR') == '"say"* """hi"""* "OR"*'
+    assert title_fts_query(" - | ") is None
+
+
+def test_title_substring_search(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    # trigram table is present so we don't need the in-memory index
+    assert mdb.title_trigram_index is None
+    fallback = TrigramIndex(mdb.db_con)
+
+    # CJK words are matched anywhere in the title
+    title_expected = [
+            ("ドールズ", [3, 14]),
+            ("お姉ちゃん", [6]),
+            ("三姉妹", [17]),
+            ("ルズ 第8話", [14]),
+            # too short for trigrams -> LIKE
+            ("姫", [5]),
+            ("ドール 2", [3]),
+            ("お姉ちゃん onee", [6]),
+            ("お姉ちゃん doll", []),
+            ("お姉ちゃん atsu", [6]),
+            ("三姉妹妹", []),
+            ]
+    for title, expected in title_expected:
+        for trigram_index in (None, fallback):
+            rows = search_book_by_title(mdb.db_con, title, "Books.id ASC",
+                                        title_trigram_index=trigram_index)
+            assert [r["id"] for r in rows] == expected
+
+    # fallback is updated by saving/removing books, other writes don't rebuild it
+    monkeypatch.setattr(mdb, "title_trigram_index", fallback)
+    assert fallback.search("淑女の") == [1]
+    builds = []
+    monkeypatch.setattr(fallback, "_build",
+                        lambda build=fallback._build: builds.append(1) or build())
+    book = mdb.get_book(_id=1)
+    book.title_foreign = "淑女"
+    book.save()
+    book = mdb.get_book(_id=2)
+    book.my_rating = 4.0
+    book.save()
+    assert fallback.search("淑女の") == []
+    new_book = Book(mdb, title_eng="New", title_foreign="新しい淑女の本", language_id=1,
+                    pages=10, status_id=1, list=["to-read"])
+    new_book.save()
+    assert fallback.search("淑女の") == [new_book.id]
+    new_book.remove()
+    assert fallback.search("淑女の") == []
+    assert not builds
+    # rolled back changes are dropped
+    with pytest.raises(ZeroDivisionError):
+        with mdb.session():
+            book = mdb.get_book(_id=1)
+            book.title_foreign = "淑女の本"
+            book.save()
+            assert fallback.search("淑女の") == [1]
+            1 / 0
+    assert fallback.search("淑女の") == []
+    assert len(builds) == 1
+    # flushed by a session
+    with mdb.session() as session:
+        book = mdb.get_book(_id=1)
+        book.title_foreign = "淑女の本"
+        session.add(book)
+    assert fallback.search("淑女の") == [1]
+    assert len(builds) == 1
+
+
+def test_title_fts_synced(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    db_con = mdb.db_con
+
+    def found_ids(title):
+        return [r["id"] for r in search_book_by_title(db_con, title, "Books.id ASC")]
+
+    with db_con:
+        c = db_con.execute("""
+            INSERT INTO Books(title_eng, title_foreign, language_id, pages, status_id,
+                              last_change, favorite)
+            VALUES ('Fulltext Indexed', NULL, 1, 1, 1, '2021-01-01', 0)""")
+    bid = c.lastrowid
+    assert found_ids("fullt index") == [bid]
+
+    with db_con:
+        db_con.execute("UPDATE Books SET title_eng = 'Renamed', title_foreign = '改名' "
+                       "WHERE id = ?", (bid,))
+    assert found_ids("fullt") == []
+    assert found_ids("renamed") == [bid]
+    assert found_ids("改名") == [bid]
+    assert found_ids("改名された") == []
+
+    # other updates don't change the index
+    with db_con:
+        db_con.execute("UPDATE Books SET pages = 2 WHERE id = ?", (bid,))
+    assert found_ids("renamed") == [bid]
+
+    with db_con:
+        db_con.execute("DELETE FROM Books WHERE id = ?", (bid,))
+    assert found_ids("renamed") == []
+    # integrity-check raises if the index doesn't match the content table
+    db_con.execute("INSERT INTO BooksTitleFts(BooksTitleFts, rank) VALUES ('integrity-check', 1)")
+    db_con.execute("INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rank) "
+                   "VALUES ('integrity-check', 1)")
+
+
 def test_keyset_pagination(monkeypatch):
     db_file = os.path.join(TESTS_DIR, "db_test_files", "manga_db.sqlite.sql")
     memdb = load_db_from_sql_file(db_file, ":memory:", True)
@@ -238,8 +375,8 @@ def test_keyset_pagination_statement():
                   "ORDER BY Books.pages ASC"], [], (20, 25), None, "Books.pages ASC", True),
                 ("""SELECT *
                 FROM Books
-                WHERE (Books.pages > ? OR (Books.pages == ? AND Books.id > ?) )
-                ORDER BY Books.pages ASC, Books.id ASC""", [20, 20, 25])  # empty tuple is () not (,)
+                WHERE ((Books.pages, Books.id) > (?, ?) )
+                ORDER BY Books.pages ASC, Books.id ASC""", [20, 25])  # empty tuple is () not (,)
             ),
             # assoc col after
             (
@@ -256,9 +393,9 @@ def test_keyset_pagination_statement():
                    WHERE Books.id = bt.book_id
                    AND bt.tag_id = t.id
                    AND t.name IN (?, ?, ?)
-                   AND (Books.title_eng < ? OR (Books.title_eng == ? AND Books.id < ?) OR (Books.title_eng IS NULL))
+                   AND ((Books.title_eng, Books.id) < (?, ?) OR (Books.title_eng IS NULL))
                    GROUP BY Books.id
-                   ORDER BY Books.title_eng DESC, Books.id DESC""", [1, 2, 3, "test_title", "test_title", 15])  # empty tuple is () not (,)
+                   ORDER BY Books.title_eng DESC, Books.id DESC""", [1, 2, 3, "test_title", 15])  # empty tuple is () not (,)
             ),
             # assoc col before
             (
@@ -300,8 +437,8 @@ def test_keyset_pagination_statement():
                  "Books.title_foreign ASC", True),
                 ("""SELECT *
                 FROM Books
-                WHERE (Books.title_foreign > ? OR (Books.title_foreign IS NULL AND Books.id > ?) OR (Books.title_foreign IS NOT NULL))
-                ORDER BY Books.title_foreign ASC, Books.id ASC""", [None, 250])
+                WHERE ((Books.title_foreign IS NULL AND Books.id > ?) OR (Books.title_foreign IS NOT NULL))
+                ORDER BY Books.title_foreign ASC, Books.id ASC""", [250])
             ),
             # forwards(after), ASC, NOT NULL value as primary
             (
@@ -311,8 +448,8 @@ def test_keyset_pagination_statement():
                  "Books.title_foreign ASC", True),
                 ("""SELECT *
                 FROM Books
-                WHERE (Books.title_foreign > ? OR (Books.title_foreign == ? AND Books.id > ?) )
-                ORDER BY Books.title_foreign ASC, Books.id ASC""", ["test", "test", 250])
+                WHERE ((Books.title_foreign, Books.id) > (?, ?) )
+                ORDER BY Books.title_foreign ASC, Books.id ASC""", ["test", 250])
             ),
             # forwards(after), DESC, NULL value as primary
             (
@@ -324,8 +461,8 @@ def test_keyset_pagination_statement():
                 ("""SELECT *
                 FROM Books
                 WHERE Books.title_foreign LIKE ?
-                AND (Books.title_foreign < ? OR (Books.title_foreign IS NULL AND Books.id < ?) )
-                ORDER BY Books.title_foreign DESC, Books.id DESC""", ["%test%", None, 250])
+                AND ((Books.title_foreign IS NULL AND Books.id < ?) )
+                ORDER BY Books.title_foreign DESC, Books.id DESC""", ["%test%", 250])
             ),
             # forwards(after), DESC, NOT NULL value as primary
             (
@@ -337,8 +474,8 @@ def test_keyset_pagination_statement():
                 ("""SELECT *
                 FROM Books
                 WHERE Books.title_foreign LIKE ?
-                AND (Books.title_foreign < ? OR (Books.title_foreign == ? AND Books.id < ?) OR (Books.title_foreign IS NULL))
-                ORDER BY Books.title_foreign DESC, Books.id DESC""", ["%test%", "ftitle", "ftitle", 250])
+                AND ((Books.title_foreign, Books.id) < (?, ?) OR (Books.title_foreign IS NULL))
+                ORDER BY Books.title_foreign DESC, Books.id DESC""", ["%test%", "ftitle", 250])
             ),
             # backwards(before), ASC, NULL value as primary
             (
@@ -350,11 +487,11 @@ def test_keyset_pagination_statement():
                     FROM (
                        SELECT *
                        FROM Books
-                       WHERE (Books.title_foreign < ? OR (Books.title_foreign IS NULL AND Books.id < ?) )
+                       WHERE ((Books.title_foreign IS NULL AND Books.id < ?) )
                        ORDER BY Books.title_foreign DESC, Books.id DESC
                    ) AS t
                    ORDER BY t.title_foreign ASC, t.id ASC
-                """, [None, 250])
+                """, [250])
             ),
             # backwards(before), ASC, NOT NULL value as primary
             (
@@ -368,11 +505,11 @@ def test_keyset_pagination_statement():
                        SELECT *
                        FROM Books
                        WHERE Books.title_foreign LIKE ?
-                       AND (Books.title_foreign < ? OR (Books.title_foreign == ? AND Books.id < ?) OR (Books.title_foreign IS NULL))
+                       AND ((Books.title_foreign, Books.id) < (?, ?) OR (Books.title_foreign IS NULL))
                        ORDER BY Books.title_foreign DESC, Books.id DESC
                    ) AS t
                    ORDER BY t.title_foreign ASC, t.id ASC
-                """, ["%alfa%", "test", "test", 250])
+                """, ["%alfa%", "test", 250])
             ),
             # backwards(before), DESC, NULL value as primary
             (
@@ -384,11 +521,11 @@ def test_keyset_pagination_statement():
                     FROM (
                        SELECT *
                        FROM Books
-                       WHERE (Books.title_foreign > ? OR (Books.title_foreign IS NULL AND Books.id > ?) OR (Books.title_foreign IS NOT NULL))
+                       WHERE ((Books.title_foreign IS NULL AND Books.id > ?) OR (Books.title_foreign IS NOT NULL))
                        ORDER BY Books.title_foreign ASC, Books.id ASC
                    ) AS t
                    ORDER BY t.title_foreign DESC, t.id DESC
-                """, [None, 250])
+                """, [250])
             ),
             # backwards(before), DESC, NOT NULL value as primary
             (
@@ -400,11 +537,11 @@ def test_keyset_pagination_statement():
                     FROM (
                        SELECT *
                        FROM Books
-                       WHERE (Books.title_foreign > ? OR (Books.title_foreign == ? AND Books.id > ?) )
+                       WHERE ((Books.title_foreign, Books.id) > (?, ?) )
                        ORDER BY Books.title_foreign ASC, Books.id ASC
                    ) AS t
                    ORDER BY t.title_foreign DESC, t.id DESC
-                """, ["test", "test", 250])
+                """, ["test", 250])
             ),
             ]
 
@@ -573,3 +710,387 @@ def test_search_normal_mult_assoc(monkeypatch, setup_mdb_dir):
         # iterate over expected since no rows returned would just pass otherwise
         for i, exp_id in enumerate(expected):
             assert rows[i]["id"] == exp_id
+        # resolving the associated columns in memory has to produce the same result
+        rows_posting_lists = search_normal_mult_assoc(mdb.db_con, *args,
+                                                      posting_lists=PostingListIndex(mdb.db_con))
+        assert [r["id"] for r in rows_posting_lists] == [r["id"] for r in rows]
+
+
+def test_posting_lists(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    index = mdb.posting_lists
+
+    expected = {r[0] for r in mdb.db_con.execute("""
+        SELECT bt.book_id FROM BookTag bt JOIN Tag ON Tag.id = bt.tag_id
+        WHERE Tag.name = 'Large Breasts'""")}
+    assert expected
+    assert index.book_ids("tag", "Large Breasts") == expected
+    # name columns are COLLATE NOCASE
+    assert index.book_ids("tag", "large breasts") == expected
+    assert index.book_ids("tag", "Not present") == frozenset()
+
+    # writes through Book/MangaDB update the postings without rebuilding them
+    builds = []
+    monkeypatch.setattr(index, "_build",
+                        lambda col, build=index._build: builds.append(col) or build(col))
+    book_id = max(expected)
+    b = mdb.get_book(book_id)
+    b.tag = [t for t in b.tag if t != "Large Breasts"] + ["New Tag"]
+    b.save()
+    assert index.book_ids("tag", "Large Breasts") == expected - {book_id}
+    assert index.book_ids("tag", "new tag") == {book_id}
+    Book.add_assoc_col_on_book_id(mdb, 1, "tag", ["New Tag"], mdb.get_book(1).tag)
+    assert index.book_ids("tag", "New Tag") == {1, book_id}
+    tag_id, = mdb.db_con.execute("SELECT id FROM Tag WHERE name = 'New Tag'").fetchone()
+    assert mdb.update_tag_name("tag", tag_id, "Renamed Tag")
+    assert index.book_ids("tag", "New Tag") == frozenset()
+    assert index.book_ids("tag", "Renamed Tag") == {1, book_id}
+    mdb.get_book(1).remove()
+    assert index.book_ids("tag", "Renamed Tag") == {book_id}
+    mdb.delete_tag("tag", tag_id)
+    assert index.book_ids("tag", "Renamed Tag") == frozenset()
+    assert not builds
+    # dropped on rollback
+    with pytest.raises(ZeroDivisionError):
+        with mdb.session():
+            Book.add_assoc_col_on_book_id(mdb, 2, "tag", ["Rolled Back"], mdb.get_book(2).tag)
+            assert index.book_ids("tag", "Rolled Back") == {2}
+            1 / 0
+    assert index.book_ids("tag", "Rolled Back") == frozenset()
+    assert builds == ["tag"]
+
+    # least recently used columns are dropped when there are too many ids
+    index.max_size = sum(len(ids) for ids in index.postings("tag").values())
+    index.postings("artist")
+    index.postings("tag")
+    assert list(index._postings) == ["tag"]
+    index.postings("artist")
+    assert list(index._postings) == ["artist"]
+
+
+def test_search_compiler_max_inline_ids(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    parser = SearchParser(mdb.VALID_SEARCH_COLS, ["tag", "artist", "list"])
+    compiler = SearchCompiler(mdb.db_con, posting_lists=mdb.posting_lists)
+    sql_compiler = SearchCompiler(mdb.db_con)
+    # matching more books than MAX_INLINE_IDS -> same semi-joins as without posting lists
+    compiler.MAX_INLINE_IDS = 1
+    for search_str in ("tag:Nakadashi", "-tag:Nakadashi", "tag:(Nakadashi|Ahegao)",
+                       "tag:Nakadashi;!Ahegao"):
+        ast = parser.parse(search_str)
+        assert compiler.compile(ast) == sql_compiler.compile(ast)
+        rows = search_ast(mdb.db_con, compiler, ast, order_by="Books.id ASC")
+        assert [r["id"] for r in rows] == [
+            r["id"] for r in search_ast(mdb.db_con, sql_compiler, ast, order_by="Books.id ASC")]
+    # small results are still inlined
+    cond, vals = compiler.compile(parser.parse("tag:Nakadashi tag:Gokkun"))
+    assert cond.startswith("Books.id IN (") and not vals
+
+    # the semi-joins are ordered by the sizes of the posting lists
+    def no_usage_counts(col, names):
+        raise AssertionError("usage counts queried")
+    compiler = SearchCompiler(mdb.db_con, posting_lists=mdb.posting_lists,
+                              usage_counts=no_usage_counts)
+    compiler.MAX_INLINE_IDS = 1
+    nr_large_breasts = len(mdb.posting_lists.book_ids("tag", "Large Breasts"))
+    assert 1 < nr_large_breasts < len(mdb.posting_lists.book_ids("tag", "Nakadashi"))
+    cond, vals = compiler.compile(parser.parse('tag:Nakadashi tag:"Large Breasts"'))
+    assert vals == ["Large Breasts", "Nakadashi"]
+    assert compiler.estimate_count(AssocValue("tag", "Large Breasts"), 100) == nr_large_breasts
+
+
+def test_search_compiler(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    ast = build_search_ast({"favorite": "1"},
+                           {"tag": ["Nakadashi", "Gokkun"], "artist": ["Nakagami Takashi"]},
+                           {"tag": ["Ahegao"]})
+    assert ast == And((ColumnCond("favorite", "1"), AssocValue("tag", "Nakadashi"),
+                       AssocValue("tag", "Gokkun"), AssocValue("artist", "Nakagami Takashi"),
+                       Not(AssocValue("tag", "Ahegao"))))
+
+    assert assoc_usage_counts(mdb.db_con, "tag", ["nakadashi", "Gokkun", "Not present"]) == {
+            "nakadashi": 15, "gokkun": 1}
+
+    # rarest value drives the query, the rest is ordered by selectivity
+    # with cheap conditions first
+    cond, vals = SearchCompiler(mdb.db_con).compile(
+            And((AssocValue("tag", "Nakadashi"), ColumnCond("favorite", "1"),
+                 AssocValue("tag", "Large Breasts"), AssocValue("tag", "Gokkun"))))
+    assert vals == ["Gokkun", "1", "Large Breasts", "Nakadashi"]
+    assert cond.startswith("(Books.id IN (")
+    assert cond.count("EXISTS") == 2
+
+    assert SearchCompiler(mdb.db_con).compile(And(())) == ("1", [])
+
+    # usage counts are per column even if the name is the same
+    counts = {"tag": {"foo": 50}, "artist": {"foo": 1}}
+    compiler = SearchCompiler(mdb.db_con, usage_counts=lambda col, names: {
+        name.lower(): counts[col][name.lower()] for name in names})
+    cond, vals = compiler.compile(And((AssocValue("tag", "Foo"), AssocValue("artist", "Foo"))))
+    assert cond.index("BookArtist") < cond.index("BookTag")
+    assert compiler._estimate([AssocValue("artist", "Foo")]) == {AssocValue("artist", "Foo"): 1}
+
+
+def test_tokenize_search():
+    assert tokenize_search('tag:(A|"B C") -artist:X OR title  "unterminated') == [
+            ("word", "tag:"), ("lparen", "("), ("word", "A"), ("or", "|"), ("quoted", "B C"),
+            ("rparen", ")"), ("word", "-artist:X"), ("or", "OR"), ("word", "title"),
+            ("quoted", "unterminated")]
+
+
+def test_boolean_search(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    parser = SearchParser(mdb.VALID_SEARCH_COLS, ["tag", "artist", "list"])
+
+    def ids_with(tag):
+        return {r[0] for r in mdb.db_con.execute("""
+            SELECT bt.book_id FROM BookTag bt JOIN Tag ON Tag.id = bt.tag_id
+            WHERE Tag.name = ?""", (tag,))}
+
+    all_ids = {r[0] for r in mdb.db_con.execute("SELECT id FROM Books")}
+    favorites = {r[0] for r in mdb.db_con.execute("SELECT id FROM Books WHERE favorite = 1")}
+    nakadashi, gokkun, ahegao = ids_with("Nakadashi"), ids_with("Gokkun"), ids_with("Ahegao")
+    search_expected = [
+            ("tag:(Gokkun|Ahegao)", gokkun | ahegao),
+            ("tag:(Gokkun|Ahegao) -tag:Nakadashi", (gokkun | ahegao) - nakadashi),
+            ("-tag:Nakadashi", all_ids - nakadashi),
+            ("-(tag:Nakadashi | tag:Ahegao)", all_ids - nakadashi - ahegao),
+            ("tag:Gokkun OR favorite:1", gokkun | favorites),
+            ("(tag:Ahegao favorite:1) OR tag:Gokkun", (ahegao & favorites) | gokkun),
+            ("tag:(Nakadashi Ahegao)", set()),
+            ("tag:(Nakadashi AND Ahegao)", nakadashi & ahegao),
+            ("tag:Nakadashi;!Ahegao", nakadashi - ahegao),
+            ]
+    for search_str, expected in search_expected:
+        ast = parser.parse(search_str)
+        for posting_lists in (None, mdb.posting_lists):
+            compiler = SearchCompiler(mdb.db_con, posting_lists=posting_lists)
+            rows = search_ast(mdb.db_con, compiler, ast, order_by="Books.id ASC")
+            assert [r["id"] for r in rows] == sorted(expected)
+
+    # compiled conditions are cached until the db changes
+    compiler = SearchCompiler(mdb.db_con)
+    ast = parser.parse("tag:(Gokkun|Ahegao) -tag:Nakadashi")
+    cond, vals = compiler.compile(ast)
+    assert list(compiler._plan_cache) == [ast]
+    vals.append("modified by caller")
+    assert compiler.compile(ast) == (cond, vals[:-1])
+    with mdb.db_con:
+        mdb.db_con.execute("UPDATE Books SET favorite = 1 WHERE id = 1")
+    compiler.compile(Or((AssocValue("tag", "Gokkun"), ColumnCond("favorite", "1"))))
+    assert len(compiler._plan_cache) == 1
+
+
+def test_date_bounds():
+    assert date_bounds("2024") == ("2024-01-01", "2025-01-01")
+    assert date_bounds("2024-12") == ("2024-12-01", "2025-01-01")
+    assert date_bounds("2024-02-29") == ("2024-02-29", "2024-03-01")
+    assert date_bounds("2024-13") is None
+    assert date_bounds("2024-1-1-1") is None
+    assert date_bounds("") is None
+
+
+def test_range_search(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    db_con = mdb.db_con
+
+    assert parse_range_cond("pages", ">=200") == ColumnCond("pages", "200", ">=")
+    assert parse_range_cond("pages", "10..20") == ColumnCond("pages", "10..20", "..")
+    assert parse_range_cond("pages", "abc") is None
+    assert parse_range_cond("pages", "..") is None
+    assert parse_range_cond("last_change", "2024-13..") is None
+
+    with db_con:
+        db_con.execute("UPDATE Books SET my_rating = 4.5 WHERE id IN (2, 6)")
+        db_con.execute("UPDATE Books SET my_rating = 3 WHERE id = 7")
+
+    def ids(where, vals=()):
+        return [r[0] for r in db_con.execute(
+            f"SELECT id FROM Books WHERE {where} ORDER BY id DESC", vals)]
+
+    search_expected = [
+            ("pages:>30", ids("pages > 30")),
+            ("pages:<=30", ids("pages <= 30")),
+            ("pages:25", ids("pages = 25")),
+            ("pages:20..40", ids("pages BETWEEN 20 AND 40")),
+            ("pages:..40", ids("pages <= 40")),
+            ("my_rating:>=4", ids("my_rating >= 4")),
+            ("last_change:2021-01..2021-06",
+             ids("last_change >= '2021-01-01' AND last_change < '2021-07-01'")),
+            ("last_change:<2021", ids("last_change < '2021-01-01'")),
+            ("upload_date:<2018-10-12", ids(
+                "EXISTS (SELECT 1 FROM ExternalInfo ei WHERE ei.book_id = Books.id "
+                "AND ei.upload_date < '2018-10-12')")),
+            ("upload_date:2018-10-11", ids(
+                "EXISTS (SELECT 1 FROM ExternalInfo ei WHERE ei.book_id = Books.id "
+                "AND ei.upload_date = '2018-10-11')")),
+            ("pages:>30 OR my_rating:>=4", ids("pages > 30 OR my_rating >= 4")),
+            ]
+    for search_str, expected in search_expected:
+        assert expected
+        assert [b.id for b in mdb.search(search_str)] == expected
+
+    # invalid values are ignored
+    assert [b.id for b in mdb.search("pages:abc", limit=-1)] == ids("1")
+
+    # index range scans instead of full scans
+    for search_str, index in (("pages:>30", "idx_books_pages"),
+                              ("my_rating:>=4", "idx_books_my_rating"),
+                              ("last_change:2021", "idx_books_last_change"),
+                              ("upload_date:2018", "idx_external_info_upload_date")):
+        ast = SearchParser(mdb.VALID_SEARCH_COLS, []).parse(search_str)
+        cond, vals = mdb.search_compiler.compile(ast)
+        plan = " ".join(r[3] for r in db_con.execute(
+            f"EXPLAIN QUERY PLAN SELECT Books.* FROM Books WHERE {cond}", vals))
+        assert f"USING INDEX {index}" in plan
+
+
+def test_sort_by_ext_stats(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+    db_con = mdb.db_con
+
+    assert validate_order_by_str("ExternalInfoStats.ext_rating DESC")
+    assert validate_order_by_str("ext_upload_date")
+
+    def expected_stats():
+        return {r[0]: tuple(r[1:]) for r in db_con.execute("""
+            SELECT Books.id, IFNULL(AVG(NULLIF(ei.rating, 0)), 0), IFNULL(SUM(ei.ratings), 0),
+                   IFNULL(SUM(ei.favorites), 0), IFNULL(MIN(ei.upload_date), '')
+            FROM Books LEFT JOIN ExternalInfo ei ON ei.book_id = Books.id
+            GROUP BY Books.id""")}
+
+    def actual_stats():
+        return {r[0]: tuple(r[1:]) for r in db_con.execute("""
+            SELECT id, ext_rating, ext_ratings, ext_favorites, ext_upload_date
+            FROM ExternalInfoStats""")}
+
+    assert actual_stats() == expected_stats()
+    # same as the python version
+    for book in mdb.get_x_books(-1):
+        assert (mdb.get_ext_stats([book.id])[book.id]["ext_rating"] ==
+                pytest.approx(book.avg_ext_rating or 0))
+
+    # kept up-to-date by triggers
+    with db_con:
+        db_con.execute("UPDATE ExternalInfo SET rating = 1.5, favorites = 999 WHERE book_id = 3")
+        db_con.execute("UPDATE ExternalInfo SET book_id = 4 WHERE book_id = 5")
+        db_con.execute("DELETE FROM ExternalInfo WHERE book_id = 6")
+    assert actual_stats() == expected_stats()
+    assert actual_stats()[6] == (0, 0, 0, '')
+    with db_con:
+        db_con.execute("DELETE FROM Books WHERE id = 7")
+    assert 7 not in actual_stats()
+
+    for col in ("ext_rating", "ext_ratings", "ext_favorites", "ext_upload_date"):
+        for asc_desc in ("ASC", "DESC"):
+            order_by = f"ExternalInfoStats.{col} {asc_desc}"
+            expected = [r[0] for r in db_con.execute(
+                f"SELECT id FROM ExternalInfoStats ORDER BY {col} {asc_desc}, id {asc_desc}")]
+            assert [b.id for b in mdb.get_x_books(-1, order_by=order_by)] == expected
+
+            # page through all books forwards and then backwards using keyset pagination
+            pages = []
+            after = None
+            while True:
+                books = mdb.get_x_books(3, after=after, order_by=order_by)
+                if not books:
+                    break
+                pages.append([b.id for b in books])
+                last = books[-1].id
+                after = (mdb.get_ext_stats([last])[last][col], last)
+            assert [i for page in pages for i in page] == expected
+
+            before_pages = []
+            first = pages[-1][0]
+            before = (mdb.get_ext_stats([first])[first][col], first)
+            while True:
+                books = mdb.get_x_books(3, before=before, order_by=order_by)
+                if not books:
+                    break
+                before_pages.append([b.id for b in books])
+                first = books[0].id
+                before = (mdb.get_ext_stats([first])[first][col], first)
+            assert before_pages[::-1] == pages[:-1]
+
+            # search with a condition and cursor values as strings like from the webGUI
+            ast = SearchParser(mdb.VALID_SEARCH_COLS, []).parse("pages:>10")
+            matching = set(r[0] for r in db_con.execute("SELECT id FROM Books WHERE pages > 10"))
+            cursor = expected[4]
+            rows = search_ast(db_con, mdb.search_compiler, ast, order_by=order_by,
+                              after=(str(actual_stats()[cursor][
+                                  ("ext_rating", "ext_ratings", "ext_favorites",
+                                   "ext_upload_date").index(col)]), str(cursor)))
+            assert [r["id"] for r in rows] == [i for i in expected[5:] if i in matching]
+
+    # keyset cursor results in an index range scan
+    q, vals = keyset_pagination_statment(
+        ["SELECT Books.*", "FROM Books",
+         "JOIN ExternalInfoStats ON ExternalInfoStats.id = Books.id",
+         "ORDER BY ExternalInfoStats.ext_rating DESC", "LIMIT 3"], [], (4.5, 10), None,
+        "ExternalInfoStats.ext_rating DESC", True)
+    plan = " ".join(r[3] for r in db_con.execute(f"EXPLAIN QUERY PLAN {q}", vals))
+    assert "SEARCH ExternalInfoStats USING COVERING INDEX idx_ext_info_stats_rating" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_query_plans(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file, settings={"posting_lists": False})
+    bridge_tables = {f"Book{col.capitalize()}" for col in (
+        "list", "tag", "category", "collection", "groups", "artist", "parody", "character")}
+
+    def bridge_scans(plans):
+        # bridge tables are aliased as bx
+        return [(p.name, step) for p in plans for step in p.scans
+                if step.split(" ")[1] in bridge_tables | {"bx"}]
+
+    plans = explain_workload(mdb)
+    names = {p.name for p in plans}
+    assert {"get_book", "list books", "search tag", "usage counts tag", "delete_tag tag",
+            "update_tag_name artist", "search facets groups"} <= names
+    # tag-first queries use the (x_id, book_id) indices
+    assert not bridge_scans(plans)
+    assert not [p for p in plans if p.name.startswith("search ") and p.scans]
+    delete_plans = [p for p in plans if p.name == "delete_tag tag"]
+    assert any("idx_book_tag_tag_id_book_id" in step for p in delete_plans for step in p.plan)
+
+    # QueryPlan reports scans
+    memdb.execute("DROP INDEX idx_book_tag_tag_id_book_id")
+    sql = "SELECT book_id FROM BookTag WHERE tag_id = 9999"
+    plan = QueryPlan("tag", sql, explain(memdb, sql))
+    assert plan.scans and "BookTag" in plan.scans[0]
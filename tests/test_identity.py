@@ -1,4 +1,6 @@
 import os.path
+import gc
+import sqlite3
 import pytest
 
 from utils import setup_mdb_dir, load_db_from_sql_file, TESTS_DIR
@@ -87,3 +89,57 @@ def test_load_instance(monkeypatch, setup_mdb_dir):
     b_2 = load_instance(mdb, Book, b_2)
     assert b_2._in_db
     assert mdb.id_map.get(b_2.key) is b_2
+
+
+def test_id_map_strong_tier(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    # needs a file so another connection can modify the db
+    db_path = os.path.join(tmpdir, "manga_db.sqlite")
+    load_db_from_sql_file(mdb_file, db_path).close()
+    db_con = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db_con.row_factory = sqlite3.Row
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (db_con, None))
+    mdb = MangaDB(tmpdir, db_path, settings={"id_map_cache_size": 2})
+
+    book_ids = [book.id for book in mdb.get_x_books(3, order_by="Books.id ASC")]
+    gc.collect()
+    # only the 2 most recently used books are kept alive
+    assert len(mdb.id_map) == 2
+    assert mdb.id_map.get((Book, (book_ids[0],))) is None
+    b2 = mdb.get_book(_id=book_ids[1])
+    assert mdb.id_map.get((Book, (book_ids[1],))) is b2
+    del b2
+    gc.collect()
+    assert (Book, (book_ids[1],)) in mdb.id_map
+
+    # using our own connection keeps the instances
+    mdb.db_con.execute("UPDATE Books SET pages = 3 WHERE id = ?", (book_ids[1],))
+    mdb.db_con.commit()
+    assert (Book, (book_ids[1],)) in mdb.id_map
+    # instances with unsaved changes aren't kept alive
+    b3 = mdb.get_book(_id=book_ids[2])
+    b3.note = "unsaved"
+    assert mdb.id_map.get(b3.key) is b3
+    del b3
+    gc.collect()
+    assert (Book, (book_ids[2],)) not in mdb.id_map
+
+    # other connections modifying the db expire the live instances
+    b2 = mdb.get_book(_id=book_ids[1])
+    b2.tag
+    other = sqlite3.connect(db_path)
+    with other:
+        other.execute("UPDATE Books SET pages = 5 WHERE id = ?", (book_ids[1],))
+        other.execute("DELETE FROM BookTag WHERE book_id = ?", (book_ids[1],))
+    other.close()
+    # not checked on lookups but at the start of a write transaction/webGUI request
+    assert mdb.get_book(_id=book_ids[1]) is b2
+    assert b2.pages != 5
+    with mdb.transaction():
+        assert b2.pages == 5
+    assert b2.tag == []
+    # strong tier dropped
+    assert list(mdb.id_map.keys()) == [b2.key]
+    db_con.close()
@@ -2,6 +2,9 @@ import os
 import sqlite3
 import logging
 import datetime
+import json
+import functools
+import gc
 import pytest
 
 from utils import (
@@ -12,7 +15,13 @@ from manga_db.manga_db import (
      MangaDB, cookie_jar, url_opener,
      set_default_user_agent, update_cookies_from_file
 )
+from manga_db.manga import Book, AGGREGATED_COLUMNS
+from manga_db.ext_info import ExternalInfo
+from manga_db.extractor.base import MangaExtractorData
 from manga_db.constants import LANG_IDS
+from manga_db.db.util import time_budget, table_name_to_bridge_id_col
+from manga_db.db import migrate
+from manga_db.db.search import And, Or, Not, AssocValue, ColumnCond
 
 
 TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -121,6 +130,66 @@ def test_mdb_readonly(monkeypatch, setup_mdb_dir):
     assert "attempt to write a readonly database" in str(e.value)
 
 
+def test_connection_pragmas(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    sql_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    mdb_file = os.path.join(tmpdir, "manga_db.sqlite")
+    load_db_from_sql_file(sql_file, mdb_file).close()
+
+    def pragma(mdb, name):
+        return mdb.db_con.execute(f"PRAGMA {name}").fetchone()[0]
+
+    mdb = MangaDB(tmpdir, mdb_file)
+    assert pragma(mdb, "journal_mode") == "wal"
+    assert pragma(mdb, "synchronous") == 1  # NORMAL
+    assert pragma(mdb, "temp_store") == 2  # MEMORY
+    assert pragma(mdb, "cache_size") == -16000
+    assert pragma(mdb, "busy_timeout") == 5000
+    assert pragma(mdb, "foreign_keys") == 1
+
+    other = MangaDB(tmpdir, mdb_file, settings={"synchronous": "FULL", "cache_size": 500,
+                                                "busy_timeout": 100, "mmap_size": None})
+    assert pragma(other, "journal_mode") == "wal"
+    assert pragma(other, "synchronous") == 2
+    assert pragma(other, "cache_size") == 500
+    assert pragma(other, "busy_timeout") == 100
+
+    with pytest.raises(ValueError):
+        MangaDB(tmpdir, mdb_file, settings={"synchronous": "normal; DROP TABLE Books"})
+
+    # readers don't wait on the writer
+    reader = MangaDB(tmpdir, mdb_file, read_only=True)
+    with mdb.transaction() as db_con:
+        db_con.execute("UPDATE Books SET my_rating = 1.5 WHERE id = 1")
+        assert reader.get_book(_id=1).my_rating != 1.5
+        # a second writer times out after busy_timeout
+        with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+            with other.transaction():
+                pass
+    assert MangaDB(tmpdir, mdb_file, read_only=True).get_book(_id=1).my_rating == 1.5
+
+    for m in (mdb, other, reader):
+        m.close()
+    # the WAL is checkpointed before the back-up is copied when migrating
+    db_con = sqlite3.connect(mdb_file)
+    assert db_con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    db_con.execute("PRAGMA wal_autocheckpoint=0")
+    # keep a connection open so closing doesn't checkpoint the WAL
+    idle_con = sqlite3.connect(mdb_file)
+    with db_con:
+        db_con.execute("UPDATE Books SET pages = 1234 WHERE id = 1")
+    db_con.close()
+    assert os.path.getsize(mdb_file + "-wal") > 0
+    # pretend there's a newer version so the back-up gets made
+    monkeypatch.setattr("manga_db.db.migrate.LATEST_VERSION", migrate.LATEST_VERSION + 1)
+    with pytest.raises(migrate.MigrationMissing):
+        MangaDB(tmpdir, mdb_file)
+    idle_con.close()
+    backup = sqlite3.connect(mdb_file + ".bak")
+    assert backup.execute("SELECT pages FROM Books WHERE id = 1").fetchone()[0] == 1234
+    backup.close()
+
+
 def test_mangadb(setup_mdb_dir, monkeypatch, caplog):
     tmpdir = setup_mdb_dir
     mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
@@ -262,51 +331,71 @@ def test_mangadb(setup_mdb_dir, monkeypatch, caplog):
         kwarg_dic.update(kwargs)
         return []
     monkeypatch.setattr("manga_db.manga_db.MangaDB.get_x_books", save_args)
-    monkeypatch.setattr("manga_db.db.search.search_normal_mult_assoc", save_args)
-    monkeypatch.setattr("manga_db.db.search.search_normal_mult_assoc", save_args)
-    # TODO
+    monkeypatch.setattr("manga_db.db.search.search_ast", save_args)
     searchstr_expected = [
-            ("search for title", [{"title": "search for title"}, {}, {}]),
+            ("search for title", ColumnCond("title", "search for title")),
             ("search for title tag:Test1;Test2",
-             [{"title": "search for title"}, {"tag": ["Test1", "Test2"]}, {}]),
+             And((ColumnCond("title", "search for title"),
+                  AssocValue("tag", "Test1"), AssocValue("tag", "Test2")))),
             ("tag:Test1;Test2 search for title",
-             [{"title": "search for title"}, {"tag": ["Test1", "Test2"]}, {}]),
+             And((ColumnCond("title", "search for title"),
+                  AssocValue("tag", "Test1"), AssocValue("tag", "Test2")))),
             ('category:Manga search for title tag:"Multi Word Tag;Test1;!Test3;Test2;!Test4"',
-                [{"title": "search for title"},
-                 {"tag": ["Multi Word Tag", "Test1", "Test2"], "category": ["Manga"]},
-                 {"tag": ["Test3", "Test4"]}]),
-            ('parody:"!Test and Test2;Test;Incl and incl" pages:25 '
+             And((ColumnCond("title", "search for title"), AssocValue("category", "Manga"),
+                  AssocValue("tag", "Multi Word Tag"), AssocValue("tag", "Test1"),
+                  Not(AssocValue("tag", "Test3")), AssocValue("tag", "Test2"),
+                  Not(AssocValue("tag", "Test4"))))),
+            ('parody:"!Test and Test2;Test;Incl and incl" pagez:25 '
              'tag:"Multi Word Tag;Test1;!Test3;Test2;!Test4" '
              'favorite:0 language:English',
-                [{"favorite": "0", "language_id": LANG_IDS['English']},
-                 {"parody": ["Test", "Incl and incl"],
-                  "tag": ["Multi Word Tag", "Test1", "Test2"]},
-                 {"parody": ["Test and Test2"], "tag": ["Test3", "Test4"]}]),
+             And((Not(AssocValue("parody", "Test and Test2")), AssocValue("parody", "Test"),
+                  AssocValue("parody", "Incl and incl"),
+                  AssocValue("tag", "Multi Word Tag"), AssocValue("tag", "Test1"),
+                  Not(AssocValue("tag", "Test3")), AssocValue("tag", "Test2"),
+                  Not(AssocValue("tag", "Test4")), ColumnCond("favorite", "0"),
+                  ColumnCond("language_id", LANG_IDS['English'])))),
             ('parody:"!Test and Test2;Test;Incl and incl" title search '
-             'tag:!Test3;Test2;!Test4 list:!to-read" '
+             'tag:!Test3;Test2;!Test4 list:!to-read '
              'favorite:0 language:English',
-                [{"title": "title search", "favorite": "0", "language_id": LANG_IDS['English']},
-                 {"parody": ["Test", "Incl and incl"],
-                  "tag": ["Test2"]},
-                 {"parody": ["Test and Test2"], "tag": ["Test3", "Test4"],
-                  "list": ["to-read"]}]),
+             And((ColumnCond("title", "title search"),
+                  Not(AssocValue("parody", "Test and Test2")), AssocValue("parody", "Test"),
+                  AssocValue("parody", "Incl and incl"),
+                  Not(AssocValue("tag", "Test3")), AssocValue("tag", "Test2"),
+                  Not(AssocValue("tag", "Test4")), Not(AssocValue("list", "to-read")),
+                  ColumnCond("favorite", "0"),
+                  ColumnCond("language_id", LANG_IDS['English'])))),
+            # boolean syntax
+            ('tag:(Test1|"Multi Word Tag") -artist:X',
+             And((Or((AssocValue("tag", "Test1"), AssocValue("tag", "Multi Word Tag"))),
+                  Not(AssocValue("artist", "X"))))),
+            ('(tag:Test1 OR artist:"Art Ist") -(list:to-read | favorite:1) title',
+             And((ColumnCond("title", "title"),
+                  Or((AssocValue("tag", "Test1"), AssocValue("artist", "Art Ist"))),
+                  Not(Or((AssocValue("list", "to-read"), ColumnCond("favorite", "1"))))))),
+            ('tag:(Multi Word | Test1 AND -Test2)',
+             Or((AssocValue("tag", "Multi Word"),
+                 And((AssocValue("tag", "Test1"), Not(AssocValue("tag", "Test2"))))))),
+            ('censorship:Invalid', And(())),
             ]
     caplog.clear()
     for srchstr, expected in searchstr_expected:
-        if "pages:" in srchstr:
+        if "pagez:" in srchstr:
             mdb._search_sytnax_parser(srchstr, order_by="dad.ad SAA")
-            del arg_li[0]
             # not in allowed search types
-            caplog.record_tuples == [("manga_db.manga_db", logging.INFO,
-                                      "'pages' is not a supported search type!"),
-                                     ("manga_db.manga_db", logging.WARNING,
-                                      "Sorting dad.ad SAA is not supported")]
-            assert arg_li == expected
-            continue
-        mdb._search_sytnax_parser(srchstr)
-        # first arg is connection for search_normal_mult_assoc
-        del arg_li[0]
-        assert arg_li == expected
+            assert caplog.record_tuples == [
+                    ("manga_db.db.search", logging.INFO,
+                     "'pagez' is not a supported search type!"),
+                    ("manga_db.manga_db", logging.WARNING,
+                     "Sorting dad.ad SAA is not supported")]
+            assert kwarg_dic["order_by"] == "Books.id DESC"
+        else:
+            mdb._search_sytnax_parser(srchstr)
+        if expected == And(()):
+            # self, limit for get_x_books
+            assert arg_li[1:] == [60]
+        else:
+            # db_con, compiler, ast for search_ast
+            assert arg_li[2] == expected
 
     dictlike = {"language": "English", "censorship": "Invalid", "status_id": 1}
     mdb.convert_names_to_ids(dictlike)
@@ -356,7 +445,7 @@ def test_update_in_collection_order(setup_tmpdir):
     other_con = load_db(tmp_db_file)
     actual = other_con.execute(
         "SELECT book_id, in_collection_idx FROM BookCollection "
-        "WHERE collection_id = 1").fetchall()
+        "WHERE collection_id = 1 ORDER BY in_collection_idx").fetchall()
     other_con.close()
     assert actual == book_id_new_coll_idx
 
@@ -398,6 +487,8 @@ def test_update_tag_name(setup_tmpdir):
     in_id_map[4].collection = []
 
     not_in_coll = mdb.get_book(_id=10)  # only one not in coll 1
+    # associated columns are loaded lazily -> load it before the db is closed
+    assert not_in_coll.collection == [coll2]
     
     old_coll_name = "Dolls"
     new_coll_name = "Renamed Collection"
@@ -476,6 +567,8 @@ def test_delete_tag(setup_tmpdir):
     in_id_map[4].collection = []
 
     not_in_coll = mdb.get_book(_id=10)  # only one not in coll 1
+    # associated columns are loaded lazily -> load it before the db is closed
+    assert not_in_coll.collection == [coll2]
     
     coll_name = "Dolls"
     mdb.delete_tag('collection', 1)
@@ -513,3 +606,504 @@ def test_delete_tag(setup_tmpdir):
     # already removed so it should be empty
     assert in_id_map[4].collection == []
     assert 'collection' not in in_id_map[4]._committed_state
+
+
+def test_search_cache(setup_tmpdir):
+    tmpdir = setup_tmpdir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    tmp_db_file = os.path.join(tmpdir, "manga_db.sqlite")
+    db = load_db_from_sql_file(mdb_file, tmp_db_file, True)
+    db.close()
+
+    mdb = MangaDB(tmpdir, tmp_db_file)
+    statements = []
+    mdb.db_con.set_trace_callback(statements.append)
+
+    def selects():
+        return [stmt for stmt in statements if "SELECT" in stmt]
+
+    books = mdb.search("tag:Nakadashi -tag:Ahegao", limit=3)
+    assert len(books) == 3
+    assert selects()
+
+    # cached -> same books without querying the db
+    statements.clear()
+    assert mdb.search("tag:Nakadashi -tag:Ahegao", limit=3) == books
+    assert not selects()
+    # cursors are part of the key
+    after = [books[-1].id]
+    next_page = mdb.search("tag:Nakadashi -tag:Ahegao", limit=3, after=after)
+    assert selects()
+    statements.clear()
+    assert mdb.search("tag:Nakadashi -tag:Ahegao", limit=3, after=after) == next_page
+    assert not selects()
+
+    # only books that aren't loaded get fetched
+    expected_ids = [b.id for b in books]
+    del books[1:]
+    gc.collect()
+    statements.clear()
+    assert [b.id for b in mdb.search("tag:Nakadashi -tag:Ahegao", limit=3)] == expected_ids
+    assert len([stmt for stmt in selects() if "SELECT * FROM Books" in stmt]) == 1
+
+    # changes from other connections invalidate the cache
+    other_con = load_db(tmp_db_file)
+    with other_con:
+        other_con.execute("""
+            DELETE FROM BookTag WHERE book_id = ?
+            AND tag_id = (SELECT id FROM Tag WHERE name = 'Nakadashi')""", (expected_ids[0],))
+    other_con.close()
+    assert [b.id for b in mdb.search("tag:Nakadashi -tag:Ahegao", limit=3)][0] != expected_ids[0]
+
+    # as well as our own
+    book = mdb.get_book(expected_ids[1])
+    book.tag = book.tag + ["Ahegao"]
+    book.save()
+    assert expected_ids[1] not in [b.id for b in mdb.search("tag:Nakadashi -tag:Ahegao",
+                                                            limit=3)]
+    mdb.db_con.close()
+
+
+def test_search_facets(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def expected_counts(table, book_ids, top_n):
+        bridge_col = "group_id" if table == "Groups" else f"{table.lower()}_id"
+        rows = mdb.db_con.execute(f"""
+            SELECT x.name, COUNT(*) AS nr FROM Book{table} bx
+            JOIN {table} x ON x.id = bx.{bridge_col}
+            WHERE bx.book_id IN ({', '.join(str(i) for i in book_ids)})
+            GROUP BY x.id ORDER BY nr DESC, x.name LIMIT ?""", (top_n,)).fetchall()
+        return [tuple(r) for r in rows]
+
+    for search_str in ("tag:Nakadashi", "tag:(Gokkun|Ahegao) -list:to-read", "", "doll"):
+        book_ids = [b.id for b in mdb.search(search_str, limit=-1)]
+        facets = mdb.search_facets(search_str, top_n=3)
+        assert sorted(facets) == sorted(["category", "collection", "groups", "artist",
+                                         "parody", "character", "list", "tag"])
+        for col, counts in facets.items():
+            table = col.capitalize()
+            assert counts == expected_counts(table, book_ids, 3)
+
+    assert mdb.search_facets("tag:Nakadashi", cols=["artist"], top_n=1) == {
+            "artist": expected_counts("Artist", [b.id for b in mdb.search("tag:Nakadashi")], 1)}
+
+    # over budget; check more often since the queries on the test DB are cheap
+    monkeypatch.setattr("manga_db.manga_db.db_time_budget",
+                        functools.partial(time_budget, check_every=100))
+    assert mdb.search_facets("tag:Ahegao", time_budget=-1) is None
+
+
+def test_search_count(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    for search_str in ("tag:Nakadashi", "tag:(Gokkun|Ahegao) -list:to-read", "",
+                       "doll", "pages:>25 tag:Nakadashi"):
+        assert mdb.search_count(search_str) == (len(mdb.search(search_str, limit=-1)), True)
+
+    # over budget -> estimate
+    # check the budget after every instruction since the test db is tiny
+    monkeypatch.setattr("manga_db.manga_db.db_time_budget",
+                        functools.partial(time_budget, check_every=1))
+    nr_nakadashi = len(mdb.search("tag:Nakadashi", limit=-1))
+    assert mdb.search_count("tag:Nakadashi", time_budget=-1) == (nr_nakadashi, True)
+    mdb.search_cache.clear()
+    # exact for associated values only with posting lists
+    assert mdb.search_count("tag:Nakadashi", time_budget=-1) == (nr_nakadashi, False)
+    mdb.search_cache.clear()
+    # conditions on other columns are assumed to match everything
+    assert mdb.search_count("tag:Nakadashi pages:>25", time_budget=-1) == (nr_nakadashi, False)
+    mdb.search_cache.clear()
+
+    # without posting lists the usage counts are used
+    total = len(mdb.search("", limit=-1))
+    mdb.search_compiler.posting_lists = None
+    nr_ahegao = len(mdb.search("tag:Ahegao", limit=-1))
+    assert mdb.search_count("tag:Nakadashi -tag:Ahegao", time_budget=-1) == (
+            round(nr_nakadashi * (1 - nr_ahegao / total)), False)
+
+
+def test_session(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def db_tags(book_id):
+        return sorted(r[0] for r in mdb.db_con.execute("""
+            SELECT Tag.name FROM BookTag JOIN Tag ON Tag.id = BookTag.tag_id
+            WHERE BookTag.book_id = ?""", (book_id,)))
+
+    books = mdb.get_x_books(5, order_by="Books.id ASC")
+    tags_before = {b.id: sorted(b.tag) for b in books}
+    with mdb.session() as session:
+        for book in books:
+            book.pages += 1
+            book.tag.append("Session tag")
+            session.add(book)
+        books[0].tag.remove(tags_before[books[0].id][0])
+        books[1].note = "Note"
+        book = Book(mdb, title_eng="Session book", language_id=1, pages=11, status_id=1,
+                    favorite=0, nsfw=0, tag=["Session tag"])
+        ext_info = ExternalInfo(mdb, book, id_onpage="1234", imported_from=1,
+                                upload_date=datetime.date.today(), censor_id=1,
+                                downloaded=0, outdated=0)
+        book.ext_infos = [ext_info]
+        session.add(ext_info, book)
+        # other writes join the transaction
+        Book.set_favorite_id(mdb, books[2].id, 1)
+        assert mdb.db_con.in_transaction
+        # nothing written yet
+        assert "Session tag" not in db_tags(books[0].id)
+    assert not mdb.db_con.in_transaction
+    assert not len(session)
+
+    for b in books:
+        row = mdb.db_con.execute("SELECT * FROM Books WHERE id = ?", (b.id,)).fetchone()
+        assert row["pages"] == b.pages
+        assert row["last_change"] == datetime.date.today()
+        assert db_tags(b.id) == sorted(b.tag)
+        assert "Session tag" in b.tag
+        assert not b._committed_state
+    assert tags_before[books[0].id][0] not in db_tags(books[0].id)
+    assert mdb.db_con.execute("SELECT note FROM Books WHERE id = ?",
+                              (books[1].id,)).fetchone()[0] == "Note"
+    assert mdb.db_con.execute("SELECT favorite FROM Books WHERE id = ?",
+                              (books[2].id,)).fetchone()[0] == 1
+    assert book._in_db and ext_info._in_db
+    assert ext_info.book_id == book.id
+    assert db_tags(book.id) == ["Session tag"]
+
+    # rolled back on exception
+    with pytest.raises(ValueError):
+        with mdb.session() as session:
+            books[3].pages = 1000
+            session.add(books[3])
+            Book.rate_book_id(mdb, books[4].id, 1.5)
+            raise ValueError
+    assert not mdb.db_con.in_transaction
+    assert mdb.db_con.execute("SELECT pages FROM Books WHERE id = ?",
+                              (books[3].id,)).fetchone()[0] != 1000
+    assert mdb.db_con.execute("SELECT my_rating FROM Books WHERE id = ?",
+                              (books[4].id,)).fetchone()[0] != 1.5
+
+    # inserts of the flush are undone when it fails later on
+    def fail(cls, manga_db, instances):
+        raise sqlite3.IntegrityError
+
+    book = Book(mdb, title_eng="Rolled back book", language_id=1, pages=11, status_id=1,
+                favorite=0, nsfw=0, tag=["Session tag"])
+    ext_info = ExternalInfo(mdb, book, id_onpage="4321", imported_from=1,
+                            upload_date=datetime.date.today(), censor_id=1,
+                            downloaded=0, outdated=0)
+    book.ext_infos = [ext_info]
+    nr_books, = mdb.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()
+    with monkeypatch.context() as m:
+        m.setattr(Book, "_flush_updates", classmethod(fail))
+        with pytest.raises(sqlite3.IntegrityError):
+            with mdb.session() as session:
+                books[3].pages = 1000
+                session.add(book, books[3])
+    assert mdb.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()[0] == nr_books
+    assert not book._in_db and book.id is None
+    assert not ext_info._in_db and ext_info.id is None and ext_info.book_id is None
+    assert not any(v is book or v is ext_info for v in mdb.id_map.values())
+    # can be saved again
+    with mdb.session() as session:
+        session.add(book)
+    assert book._in_db and ext_info.book_id == book.id
+    assert mdb.id_map.get(book.key) is book
+
+    # new books are inserted together, with the values of each associated column
+    # and the ext infos of all of them at once
+    calls = []
+    add_pairs = Book._add_associated_column_pairs
+    monkeypatch.setattr(Book, "_add_associated_column_pairs", staticmethod(
+        lambda manga_db, col, pairs: calls.append((col, len(pairs))) or
+        add_pairs(manga_db, col, pairs)))
+    new_books = [Book(mdb, title_eng=f"Grouped {i}", language_id=1, pages=11, status_id=1,
+                      nsfw=0, tag=["Session tag", f"Tag {i}"]) for i in range(3)]
+    for b in new_books:
+        b.ext_infos = [ExternalInfo(mdb, b, id_onpage="4321", imported_from=1,
+                                    upload_date=datetime.date.today(), censor_id=1)]
+    with mdb.session() as session:
+        session.add(*new_books)
+    assert calls == [("tag", 6)]
+    for i, b in enumerate(new_books):
+        assert b._in_db and b.favorite == 0 and not b._committed_state
+        assert mdb.id_map.get(b.key) is b
+        assert db_tags(b.id) == ["Session tag", f"Tag {i}"]
+    # same link as the ext info saved before and each other -> all but the last are outdated
+    new_ei_ids = [b.ext_infos[0].id for b in new_books]
+    assert dict(mdb.db_con.execute(
+        "SELECT id, outdated FROM ExternalInfo WHERE id_onpage = '4321'").fetchall()) == {
+            ext_info.id: 1, new_ei_ids[0]: 1, new_ei_ids[1]: 1, new_ei_ids[2]: 0}
+
+
+def test_bulk_import(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def data(title_eng, id_onpage, imported_from=1, **kwargs):
+        values = dict(
+            title_eng=title_eng, title_foreign=None, language="English", pages=20,
+            status_id=1, nsfw=1, note=None, category=["Manga"], collection=[], groups=[],
+            artist=["Bulk Artist"], parody=[], character=[], tag=["Nakadashi", "Bulk tag"],
+            url=f"https://www.tsumino.com/entry/{id_onpage}", id_onpage=id_onpage,
+            imported_from=imported_from, censor_id=1,
+            upload_date=datetime.date(2020, 1, 1), uploader=None, rating=4.0,
+            ratings=10, favorites=5)
+        values.update(kwargs)
+        return MangaExtractorData(**values)
+
+    existing = mdb.get_book(_id=12)
+    existing_ei = existing.ext_infos[0]
+    other_ei = mdb.get_book(_id=13).ext_infos[0]
+    nr_books, = mdb.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()
+
+    records = [
+        (data("Bulk 1", "900001"), {"lists": ["to-read"], "downloaded": True}),
+        # same book different link
+        (data("Bulk 1", "900002", tag=["Other"]), {"lists": [], "downloaded": False}),
+        # same link again
+        (data("Bulk 1", "900001"), {"lists": [], "downloaded": False}),
+        # already in db
+        (data(existing.title_eng, existing_ei.id_onpage, existing_ei.imported_from,
+              title_foreign=existing.title_foreign), {"lists": [], "downloaded": False}),
+        # new link for existing book
+        (data(existing.title_eng, "900003", title_foreign=existing.title_foreign),
+         {"lists": [], "downloaded": False}),
+        # link is on another book already -> outdated
+        (data("Bulk 2", other_ei.id_onpage, other_ei.imported_from, language="Klingon"),
+         {"lists": ["favorite"], "downloaded": False}),
+    ]
+    result = mdb.bulk_import(records)
+    assert not mdb.db_con.in_transaction
+    assert mdb.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()[0] == nr_books + 2
+    assert list(result.book_ids) == [records[0][0].url, records[5][0].url]
+    assert result.added_to_existing == [records[1][0].url, records[4][0].url]
+    assert result.skipped == [records[2][0].url, records[3][0].url]
+
+    b1 = mdb.get_book(_id=result.book_ids[records[0][0].url])
+    assert b1.title_eng == "Bulk 1"
+    assert b1.language == "English"
+    assert b1.last_change == datetime.date.today()
+    assert not b1.favorite
+    assert sorted(b1.tag) == ["Bulk tag", "Nakadashi"]
+    assert b1.artist == ["Bulk Artist"]
+    assert b1.list == ["to-read"]
+    assert [(ei.id_onpage, ei.downloaded, ei.outdated) for ei in b1.ext_infos] == [
+        ("900001", 1, 0), ("900002", 0, 0)]
+    assert mdb.get_ext_stats([b1.id])[b1.id]["ext_ratings"] == 20
+
+    b2 = mdb.get_book(_id=result.book_ids[records[5][0].url])
+    assert b2.language == "Klingon"
+    assert b2.list == ["favorite"]
+    new_ei, = b2.ext_infos
+    assert result.outdated == {new_ei.id: [other_ei.id]}
+    # loaded instances are updated
+    assert other_ei.outdated == 1
+    assert not other_ei._committed_state
+    assert [ei.id_onpage for ei in existing.ext_infos] == [
+        existing_ei.id_onpage, "900003"]
+    assert not existing._committed_state
+
+    # rolled back -> languages added by the import are gone
+    def fail(*args):
+        raise ValueError("failed")
+    monkeypatch.setattr(mdb, "_bulk_add_ext_infos", fail)
+    with pytest.raises(ValueError):
+        mdb.bulk_import([(data("Bulk 3", "900004", language="Elvish"),
+                          {"lists": [], "downloaded": False})])
+    assert "Elvish" not in mdb.language_map
+    assert mdb.get_language("Elvish") is None
+    assert mdb.db_con.execute("SELECT COUNT(*) FROM Books").fetchone()[0] == nr_books + 2
+
+
+def test_assoc_name_ids(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def tag_id(name):
+        row = mdb.db_con.execute("SELECT id FROM Tag WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    statements = []
+    memdb.set_trace_callback(statements.append)
+    book = mdb.get_book(_id=1)
+    book.tag.extend(["Nakadashi", "Cached New Tag"])
+    book.save()
+    # only the new tag hits the Tag table
+    inserts = [s for s in statements if "INTO Tag(" in s]
+    assert len(inserts) == 1 and "Cached New Tag" in inserts[0]
+    assert mdb.assoc_name_ids.get_ids("Tag", ["nakadashi", "cached new tag"]) == {
+        "nakadashi": tag_id("Nakadashi"), "cached new tag": tag_id("Cached New Tag")}
+
+    statements.clear()
+    book2 = mdb.get_book(_id=2)
+    book2.tag.append("Cached New Tag")
+    book2.save()
+    assert not [s for s in statements if "INTO Tag(" in s]
+
+    # kept in sync when renaming/deleting
+    old_id = tag_id("Cached New Tag")
+    assert mdb.update_tag_name("tag", old_id, "Renamed Tag")
+    assert mdb.assoc_name_ids.get_ids("Tag", ["Renamed Tag"]) == {"renamed tag": old_id}
+    mdb.delete_tag("tag", old_id)
+    assert tag_id("Renamed Tag") is None
+    statements.clear()
+    book.tag.append("Renamed Tag")
+    book.save()
+    assert [s for s in statements if "INTO Tag(" in s]
+    assert tag_id("Renamed Tag") is not None
+    assert "Renamed Tag" in mdb._load_book_summaries_by_ids([1])[0].tag
+
+    # ids of names added in a transaction that was rolled back are dropped
+    with pytest.raises(ValueError):
+        with mdb.session() as session:
+            book.tag.append("Rolled back")
+            session.add(book)
+            session.flush()
+            assert mdb.assoc_name_ids.get_ids("Tag", ["Rolled back"])
+            raise ValueError
+    assert tag_id("Rolled back") is None
+    assert "rolled back" not in mdb.assoc_name_ids.get_ids("Tag", ["Nakadashi"])
+
+
+def test_book_aggregates(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def aggregated():
+        rows = mdb.db_con.execute(f"""
+            SELECT id, {', '.join(AGGREGATED_COLUMNS)} FROM BookAggregates""").fetchall()
+        return {row[0]: {col: json.loads(row[col])
+                         for col in AGGREGATED_COLUMNS} for row in rows}
+
+    def expected():
+        book_ids = [r[0] for r in mdb.db_con.execute("SELECT id FROM Books").fetchall()]
+        result = {book_id: {} for book_id in book_ids}
+        for col in AGGREGATED_COLUMNS:
+            table_name = col.capitalize()
+            bridge_col = table_name_to_bridge_id_col(table_name)
+            for book_id in book_ids:
+                # ordered by the values' ids
+                result[book_id][col] = [r[0] for r in mdb.db_con.execute(f"""
+                    SELECT x.name FROM Book{table_name} bx
+                    JOIN {table_name} x ON x.id = bx.{bridge_col}
+                    WHERE bx.book_id = ? ORDER BY x.id""", (book_id,)).fetchall()]
+        return result
+
+    # filled by the migration
+    assert aggregated() == expected()
+    book = mdb.get_book(_id=1)
+    book.tag.extend(["Nakadashi", "Aggregated New Tag"])
+    book.artist = []
+    book.save()
+    assert aggregated() == expected()
+    assert "Aggregated New Tag" in aggregated()[1]["tag"]
+    # names can contain any separator
+    book.tag.append("Semi;colon")
+    book.save()
+    assert aggregated() == expected()
+    assert "Semi;colon" in Book.fetch_associated_column_batched(mdb.db_con, "tag", [1])[1]
+
+    tag_id, = mdb.db_con.execute(
+        "SELECT id FROM Tag WHERE name = 'Nakadashi'").fetchone()
+    assert mdb.update_tag_name("tag", tag_id, "Renamed Nakadashi")
+    assert aggregated() == expected()
+    mdb.delete_tag("tag", tag_id)
+    assert aggregated() == expected()
+    assert not any("Renamed Nakadashi" in v["tag"] for v in aggregated().values())
+
+    mdb.get_book(_id=2).remove()
+    assert 2 not in aggregated()
+    assert aggregated() == expected()
+
+    # one primary key lookup for all the associated values of a book
+    statements = []
+    memdb.set_trace_callback(statements.append)
+    assoc = mdb.get_book(_id=3).get_associated_columns()
+    assert len([s for s in statements if "BookAggregates" in s]) == 1
+    assert {col: assoc[col] for col in AGGREGATED_COLUMNS} == expected()[3]
+
+
+def test_assoc_book_count(monkeypatch, setup_mdb_dir):
+    tmpdir = setup_mdb_dir
+    mdb_file = os.path.join(TESTS_DIR, "all_test_files", "manga_db.sqlite.sql")
+    memdb = load_db_from_sql_file(mdb_file, ":memory:", True)
+    monkeypatch.setattr("manga_db.manga_db.MangaDB._load_or_create_sql_db",
+                        lambda x, y, z: (memdb, None))
+    mdb = MangaDB(tmpdir, mdb_file)
+
+    def counts(col):
+        table_name = col.capitalize()
+        return dict(mdb.db_con.execute(f"SELECT name, book_count FROM {table_name}").fetchall())
+
+    def expected(col):
+        table_name = col.capitalize()
+        bridge_col = table_name_to_bridge_id_col(table_name)
+        return dict(mdb.db_con.execute(f"""
+            SELECT x.name, COUNT(bx.book_id) FROM {table_name} x
+            LEFT JOIN Book{table_name} bx ON bx.{bridge_col} = x.id
+            GROUP BY x.id""").fetchall())
+
+    # filled by the migration
+    for col in AGGREGATED_COLUMNS:
+        assert counts(col) == expected(col)
+
+    book = mdb.get_book(_id=1)
+    other_tag, other_count = next((name, count) for name, count in counts("tag").items()
+                                  if count and name not in book.tag)
+    book.tag.extend([other_tag, "Counted New Tag"])
+    removed_artist = book.artist[0]
+    book.artist = book.artist[1:]
+    book.save()
+    assert counts("tag") == expected("tag")
+    assert counts("artist") == expected("artist")
+    assert mdb.usage_counts("tag", [other_tag, "Counted New Tag", "Not a tag"]) == {
+        other_tag.lower(): other_count + 1, "counted new tag": 1}
+    assert mdb.usage_counts("artist", [removed_artist]) == {
+        removed_artist.lower(): expected("artist")[removed_artist]}
+
+    mdb.get_book(_id=1).remove()
+    for col in AGGREGATED_COLUMNS:
+        assert counts(col) == expected(col)
+    unused = mdb.get_unused_tags("tag")
+    assert "Counted New Tag" in [name for _, name in unused]
+    assert [name for _, name in unused] == sorted(
+        (name for name, count in expected("tag").items() if count == 0), key=str.lower)
+
+    # facets of all books are read from the counts
+    statements = []
+    memdb.set_trace_callback(statements.append)
+    facets = mdb.search_facets("", cols=["tag", "artist"], top_n=5)
+    assert not [s for s in statements if "COUNT(" in s]
+    for col in ("tag", "artist"):
+        exp = sorted(((name, count) for name, count in expected(col).items() if count),
+                     key=lambda x: (-x[1], x[0].lower()))[:5]
+        assert facets[col] == exp
@@ -6,6 +6,7 @@ import bs4
 import sqlite3
 import pytest
 import re
+import threading
 from io import BytesIO
 
 from PIL import Image
@@ -13,8 +14,8 @@ from flask import url_for, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from manga_db.webGUI import create_app
+from manga_db.webGUI.mdb import get_mdb, release_mdb
 from manga_db.ext_info import ExternalInfo
-from manga_db.webGUI.mdb import t_local
 from manga_db.webGUI.json_custom import to_serializable
 from manga_db.constants import LANG_IDS
 from utils import all_book_info, gen_hash_from_file, load_db_from_sql_file
@@ -57,10 +58,8 @@ def app_setup():
 
     yield tmpdir, app, client
 
-    # clean up thread local so we avoid a re-used thread using an old mdb connection
-    # from the thread local    
-    t_local.mdb_init = False
-    t_local.mdb = None
+    # close the connections of the MangaDB pool
+    app.extensions["mangadb_pool"].close()
 
 
 def test_login_required(app_setup):
@@ -304,6 +303,120 @@ def test_list_action_ajax(app_setup):
                                                "valid list action!")}).json
 
 
+def test_search_facets(app_setup):
+    tmpdir, app, client = app_setup
+    setup_authenticated_sess(app, client)
+    with app.app_context():
+        resp = client.get(url_for("main.search_facets", q="tag:Nakadashi favorite:0",
+                                  top_n=2))
+        assert resp.is_json
+        facets = resp.json["facets"]
+        assert len(facets["tag"]) == 2
+        # every result has the tag
+        db_con = sqlite3.connect(os.path.join(tmpdir, "manga_db.sqlite"))
+        nr_results, = db_con.execute("""
+            SELECT COUNT(*) FROM Books b
+            JOIN BookTag bt ON bt.book_id = b.id
+            JOIN Tag t ON t.id = bt.tag_id
+            WHERE t.name = 'Nakadashi' AND b.favorite = 0""").fetchone()
+        db_con.close()
+        assert facets["tag"][0] == {"name": "Nakadashi", "count": nr_results}
+        assert facets["tag"][1]["count"] <= nr_results
+
+        # result count on search page
+        resp = client.get(url_for("main.search_books", q="tag:Nakadashi favorite:0"))
+        assert f"{nr_results} results" in resp.get_data(as_text=True)
+
+
+def test_sort_by_ext_stats(app_setup):
+    tmpdir, app, client = app_setup
+    setup_authenticated_sess(app, client)
+    db_con = sqlite3.connect(os.path.join(tmpdir, "manga_db.sqlite"))
+    stats = db_con.execute("""
+        SELECT id, ext_rating FROM ExternalInfoStats
+        ORDER BY ext_rating DESC, id DESC""").fetchall()
+    db_con.close()
+    expected = [book_id for book_id, _ in stats]
+
+    def book_ids(resp):
+        return [int(i) for i in re.findall(r'href=/book/(\d+)>', resp.get_data(as_text=True))]
+
+    with app.app_context():
+        resp = client.get(url_for("main.show_entries", sort_col="ext_rating", order="DESC"))
+        assert book_ids(resp) == expected
+        # keyset cursor using the aggregated rating
+        book_id, rating = stats[5]
+        resp = client.get(url_for("main.show_entries", sort_col="ext_rating", order="DESC",
+                                  after=[rating, book_id]))
+        assert book_ids(resp) == expected[6:]
+        resp = client.get(url_for("main.show_entries", sort_col="ext_rating", order="DESC",
+                                  before=[rating, book_id]))
+        assert book_ids(resp) == expected[:5]
+        resp = client.get(url_for("main.search_books", q="pages:>10", sort_col="ext_rating",
+                                  order="DESC", after=[rating, book_id]))
+        assert set(book_ids(resp)) <= set(expected[6:])
+
+
+def test_mdb_pool(app_setup):
+    tmpdir, app, client = app_setup
+    setup_authenticated_sess(app, client)
+    pool = app.extensions["mangadb_pool"]
+
+    with app.app_context():
+        # a request that's writing holds the writer for the whole request
+        # -> reads are served by the read-only MangaDBs in the meantime from other threads
+        url = url_for("main.show_entries")
+        clients = [app.test_client() for _ in range(3)]
+        for c in clients:
+            setup_authenticated_sess(app, c)
+        writer = pool.acquire_writer()
+        try:
+            results = []
+            threads = [threading.Thread(target=lambda c=c: results.append(c.get(url).status_code))
+                       for c in clients]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=10)
+            assert results == [200, 200, 200]
+            # writer requests wait
+            assert not pool._writer_lock.acquire(blocking=False)
+        finally:
+            pool.release_writer()
+
+        assert 1 <= len(pool._all_readers) <= 3
+        assert all(reader.db_con is not writer.db_con for reader in pool._all_readers)
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            pool._all_readers[0].db_con.execute("DELETE FROM Tag")
+        # the failed statement still started a transaction, which would keep the reader
+        # on its snapshot of the db
+        pool._all_readers[0].db_con.rollback()
+
+        # GET routes that write are marked and use the writer
+        assert writer.get_book(_id=1).my_rating != 3.5
+        resp = client.get(url_for("main.show_info", book_id=1))
+        assert resp.status_code == 200
+        resp = client.get(url_for("main.rate_book", book_id=1, rating=3.5))
+        assert resp.status_code == 302
+        # readers see the change (their id_map is checked for stale instances at the
+        # start of a request)
+        with app.test_request_context(method="GET"):
+            mdb = get_mdb()
+            assert mdb is not writer
+            assert mdb.get_book(_id=1).my_rating == 3.5
+            release_mdb()
+
+        # failed requests don't leave their (possibly modified) instances behind
+        for method in ("GET", "POST"):
+            with app.test_request_context(method=method):
+                mdb = get_mdb()
+                book = mdb.get_book(_id=1)
+                book.my_rating = 1.0
+                release_mdb(ValueError())
+            assert book.key not in mdb.id_map
+            assert not mdb.db_con.in_transaction
+
+
 def test_show_info(app_setup):
     tmpdir, app, client = app_setup
     setup_authenticated_sess(app, client)
@@ -760,7 +873,7 @@ def test_import_book(app_setup, monkeypatch):
         ei_rows = db_con.execute("SELECT book_id, 0, id_onpage, imported_from, upload_date, "
                                  "uploader, censor_id, rating, ratings, favorites, downloaded, "
                                  "last_update, outdated "
-                                 "FROM ExternalInfo WHERE book_id = 11").fetchall()
+                                 "FROM ExternalInfo WHERE book_id = 11 ORDER BY id").fetchall()
         assert len(ei_rows) == 2
         assert ei_rows[0][:-2] == ei_rows[1][:-2]
         assert ei_rows[1][11] == datetime.date.today()
@@ -901,7 +1014,8 @@ def test_add_ext_info(app_setup, monkeypatch):
         ei_rows = db_con.execute("""SELECT 0, id_onpage, imported_from, upload_date,
                                            uploader, censor_id, rating, ratings, favorites,
                                            downloaded, last_update, outdated
-                                    FROM ExternalInfo WHERE book_id = 6""").fetchall()
+                                    FROM ExternalInfo WHERE book_id = 6
+                                    ORDER BY id""").fetchall()
         assert len(ei_rows) == 2
         assert ei_rows[0][:-3] == ei_rows[1][:-3]
         assert ei_rows[1][9] == 0
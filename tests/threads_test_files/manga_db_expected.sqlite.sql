@@ -4,7 +4,20 @@ CREATE TABLE Artist(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE,
             favorite INTEGER NOT NULL DEFAULT 0
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE BookAggregates(
+        id INTEGER PRIMARY KEY ASC,
+        list TEXT NOT NULL DEFAULT '[]',
+        tag TEXT NOT NULL DEFAULT '[]',
+        category TEXT NOT NULL DEFAULT '[]',
+        collection TEXT NOT NULL DEFAULT '[]',
+        groups TEXT NOT NULL DEFAULT '[]',
+        artist TEXT NOT NULL DEFAULT '[]',
+        parody TEXT NOT NULL DEFAULT '[]',
+        character TEXT NOT NULL DEFAULT '[]',
+        FOREIGN KEY (id) REFERENCES Books(id)
+           ON DELETE CASCADE
+    );
 CREATE TABLE BookArtist(
             book_id INTEGER NOT NULL,
             artist_id INTEGER NOT NULL,
@@ -96,10 +109,23 @@ CREATE TABLE Books(
                         FOREIGN KEY (status_id) REFERENCES Status(id)
                            ON DELETE RESTRICT
                     );
+CREATE VIRTUAL TABLE BooksTitleFts USING fts5(
+        title_eng,
+        title_foreign,
+        content='Books',
+        content_rowid='id'
+    );
+CREATE VIRTUAL TABLE BooksTitleTrigram USING fts5(
+            title_eng,
+            title_foreign,
+            content='Books',
+            content_rowid='id',
+            tokenize='trigram'
+        );
 CREATE TABLE Category(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE Censorship (
                     id INTEGER PRIMARY KEY ASC,
                     name TEXT UNIQUE NOT NULL
@@ -107,11 +133,11 @@ CREATE TABLE Censorship (
 CREATE TABLE Character(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE Collection(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE ExternalInfo(
         id INTEGER PRIMARY KEY ASC,
         book_id INTEGER NOT NULL,
@@ -133,10 +159,19 @@ CREATE TABLE ExternalInfo(
         FOREIGN KEY (censor_id) REFERENCES Censorship(id)
            ON DELETE RESTRICT
     );
+CREATE TABLE ExternalInfoStats(
+        id INTEGER PRIMARY KEY ASC,
+        ext_rating REAL NOT NULL DEFAULT 0,
+        ext_ratings INTEGER NOT NULL DEFAULT 0,
+        ext_favorites INTEGER NOT NULL DEFAULT 0,
+        ext_upload_date TEXT NOT NULL DEFAULT '',
+        FOREIGN KEY (id) REFERENCES Books(id)
+           ON DELETE CASCADE
+    );
 CREATE TABLE Groups(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE Languages (
                      id INTEGER PRIMARY KEY ASC,
                      name TEXT UNIQUE NOT NULL
@@ -144,7 +179,7 @@ CREATE TABLE Languages (
 CREATE TABLE List(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE MDB_Version (
     version_id INTEGER PRIMARY KEY ASC,
     dirty INTEGER NOT NULL
@@ -152,7 +187,7 @@ CREATE TABLE MDB_Version (
 CREATE TABLE Parody(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 CREATE TABLE Sites (
                     id INTEGER PRIMARY KEY ASC,
                     name TEXT UNIQUE NOT NULL
@@ -164,31 +199,55 @@ CREATE TABLE Status(
 CREATE TABLE Tag(
             id INTEGER PRIMARY KEY ASC,
             name TEXT UNIQUE NOT NULL COLLATE NOCASE
-        );
+        , book_count INTEGER NOT NULL DEFAULT 0);
 INSERT INTO "Artist" VALUES
-(1,'Ayano Naoto',0),
-(2,'SAKULA',0),
-(3,'Fan no Hitori',0),
-(4,'Jirou',0),
-(5,'Kirisaki Byakko',0),
-(6,'Korotsuke',0),
-(7,'DATE',0),
-(8,'ryuno',0),
-(9,'Tanabe Kyou',0),
-(10,'Yamamoto Zenzen',0),
-(11,'Taniguchi-san',0),
-(12,'Kaneda Asou',0),
-(13,'Fei',0),
-(14,'Sirokuma',0),
-(15,'bariun',0),
-(16,'Tawara Hiryuu',0),
-(17,'Kimura Neito',0),
-(18,'ElectricSheep',0),
-(19,'Yuuki Tsumugi',0),
-(20,'Kakuzatou',0),
-(21,'Otochichi',0),
-(22,'Keta',0),
-(23,'Yasunaga Kouichirou',0);
+(1,'Ayano Naoto',0,1),
+(2,'SAKULA',0,1),
+(3,'Fan no Hitori',0,2),
+(4,'Jirou',0,1),
+(5,'Kirisaki Byakko',0,1),
+(6,'Korotsuke',0,1),
+(7,'DATE',0,1),
+(8,'ryuno',0,1),
+(9,'Tanabe Kyou',0,1),
+(10,'Yamamoto Zenzen',0,1),
+(11,'Taniguchi-san',0,1),
+(12,'Kaneda Asou',0,1),
+(13,'Fei',0,1),
+(14,'Sirokuma',0,1),
+(15,'bariun',0,1),
+(16,'Tawara Hiryuu',0,1),
+(17,'Kimura Neito',0,1),
+(18,'ElectricSheep',0,1),
+(19,'Yuuki Tsumugi',0,1),
+(20,'Kakuzatou',0,1),
+(21,'Otochichi',0,1),
+(22,'Keta',0,1),
+(23,'Yasunaga Kouichirou',0,1);
+INSERT INTO "BookAggregates" VALUES
+(1,'[]','["Anal","Chastity Belt","Femdom","Footjob","Gokkun","Handjob","Large Breasts","Masturbation","Nakadashi","Orgasm Denial","Pantyhose","Straight Shota","Sweating","Urethra Insertion"]','["Doujinshi"]','[]','["Kaiki Nisshoku"]','["Ayano Naoto"]','["Girls und Panzer / ガールズ&パンツァー"]','["Darjeeling"]'),
+(2,'[]','["Nakadashi","Blowjob","Decensored","Drugs","X-ray"]','["Doujinshi"]','[]','["IRON GRIMOIRE"]','["SAKULA"]','["Monster Hunter World / モンスターハンター：ワールド"]','["Handler"]'),
+(3,'[]','["Anal","Large Breasts","Nakadashi","Blowjob","Ahegao","Big Ass","Collar","Deepthroat","Leg Lock","Megane","MILF","Mind Break","Ponytail","Rape","Slave","Snuff","Symbol Shaped Pupils","Virginity (Male)"]','["Manga"]','["Dolls"]','["Fan no Hitori"]','["Fan no Hitori"]','[]','[]'),
+(4,'[]','["Femdom","Footjob","Large Breasts","Nakadashi","Pantyhose","Big Ass","Cunnilingus","Face Sitting","Foot Fetish","Hairy","Licking","Short Hair","Smell"]','["Manga"]','[]','[]','["Jirou"]','[]','[]'),
+(5,'[]','["Femdom","Large Breasts","Nakadashi","Collar","Dragon Girl","Fangs","Futa on Female","Futanari","Gender Bender","Hat","Leotard","Monster Girl","Royalty"]','["Doujinshi"]','[]','["SeaFox"]','["Kirisaki Byakko"]','["Super Mario Bros. / スーパーマリオブラザーズ"]','["Mario","Princess Peach","Super Crown Bowser | Bowsette"]'),
+(6,'[]','["Large Breasts","Nakadashi","Sweating","Ahegao","Ponytail","Exhibitionism","Happy Sex","Impregnation","School Uniform"]','["Doujinshi"]','[]','["Mousou Engine"]','["Korotsuke"]','["Dragon Quest / ドラゴンクエスト","Dragon Quest XI (11) / ドラゴンクエストXI"]','["Martina"]'),
+(7,'[]','["Masturbation","Gender Bender","Fingering","Possession","Solo Action"]','["Doujinshi"]','[]','["Senpenbankashiki"]','["DATE"]','[]','[]'),
+(8,'[]','["Anal","Large Breasts","Nakadashi","Blowjob","Big Ass","Megane","Happy Sex","School Uniform","Comedy","Dark Skin","Gyaru","Paizuri","Shared Senses"]','["Manga"]','[]','[]','["ryuno"]','[]','[]'),
+(9,'["to-read"]','["Anal","Nakadashi","Blowjob","X-ray","Ahegao","Huge Penis","Incest","Loli","Maledom","Niece","Slut","Stockings"]','["Manga"]','[]','[]','["Tanabe Kyou"]','[]','[]'),
+(10,'["to-read"]','["Nakadashi","Drugs","Ahegao","MILF","Rape","Dark Skin","Huge Penis","Big Areola","Elf","Huge Breasts","Tattoo","Threesome"]','["Doujinshi"]','["Takabisha Elf Kyousei Konin!!"]','[]','["Yamamoto Zenzen"]','[]','[]'),
+(11,'["to-read"]','["Large Breasts","Nakadashi","Ahegao","Futa on Female","Futanari","Gender Bender","Dark Skin","Elf","Body Swap","Bondage","Defloration","Filming"]','["Manga"]','[]','[]','["Taniguchi-san"]','[]','[]'),
+(12,'["to-read"]','["Anal","Femdom","Large Breasts","Nakadashi","Straight Shota","Big Ass","Short Hair","Hat","Royalty","Dark Skin","Huge Penis","Big Areola","Defloration","Double Penetration","Elder Sister","Tall Girl"]','["Doujinshi"]','[]','["Dokumushi Shokeitai"]','["Kaneda Asou"]','[]','[]'),
+(13,'["to-read"]','["Large Breasts","Nakadashi","Blowjob","Threesome","Bikini","Group Sex","Swimsuit"]','["Doujinshi"]','[]','["Maidoll"]','["Fei"]','["Dead or Alive / デッド・オア・アライブ"]','["Momiji","Nyotengu"]'),
+(14,'["to-read"]','["Anal","Large Breasts","Nakadashi","Pantyhose","X-ray","Ahegao","Collar","Mind Break","Rape","Stockings","Maid","Mind Control","Office Lady"]','["Manga"]','["Dolls"]','[]','["Fan no Hitori"]','[]','[]'),
+(15,'["to-read"]','["Femdom","Handjob","Large Breasts","Nakadashi","Blowjob","Ahegao","Symbol Shaped Pupils","Hairy","Huge Penis","Nurse"]','["Manga"]','[]','[]','["Sirokuma"]','[]','[]'),
+(16,'["to-read"]','["Blowjob","Ahegao","Megane","Happy Sex","Threesome","Group Sex","Layer Cake","Selfcest"]','["Doujinshi"]','[]','[]','["bariun"]','["Persona 5 / ペルソナ5"]','["Akira Kurusu","Futaba Sakura"]'),
+(17,'["to-read"]','["Femdom","Large Breasts","Nakadashi","Blowjob","Ahegao","Big Ass","MILF","Symbol Shaped Pupils","Virginity (Male)","Cunnilingus","Hairy","Dark Skin","Paizuri","Huge Penis","Big Areola","Huge Breasts","Bikini","Swimsuit","BBW","Kimono / Yukata","Onsen","Widow"]','["Manga"]','[]','[]','["Tawara Hiryuu"]','[]','[]'),
+(18,'["to-read","test","good"]','["Large Breasts","Nakadashi","Straight Shota","Happy Sex","Dark Skin","Stockings","Defloration","Braids","Vanilla"]','["Doujinshi"]','[]','["Egonokatamari"]','["Kimura Neito"]','["Azur Lane / 碧蓝航线"]','["South Dakota"]'),
+(19,'["test","prob-good"]','["Anal","Large Breasts","Nakadashi","Pantyhose","Blowjob","Decensored","X-ray","Deepthroat","Leg Lock","Megane","Cunnilingus","Exhibitionism","Huge Penis","Group Sex","Office Lady","Breast Sucking","Bukkake","French Kissing","Full Color","Gangbang","Harem","Spitroast"]','["Manga"]','[]','["MediBang!"]','["ElectricSheep","Yuuki Tsumugi"]','[]','[]'),
+(20,'["to-read","to-download"]','["Femdom","Handjob","Large Breasts","Nakadashi","Straight Shota","Blowjob","Big Ass","Happy Sex","Impregnation","Comedy","Incest","Stockings","Huge Breasts","Tall Girl","BBW","Hotpants","Inseki","Onahole","Plump","Smug","Sex Toys","Imouto"]','["Doujinshi"]','[]','["Kakuzato-ichi"]','["Kakuzatou"]','[]','[]'),
+(21,'["to-read","to-download"]','["Ahegao","MILF","BBW","Sole Male","Full Censorship","Big Breasts","Big Nipples","Cheating","Hairy Armpits","Lactation","Sex Toys","Sole Female"]','["Manga"]','[]','[]','["Otochichi"]','[]','[]'),
+(22,'[]','["Nakadashi","Short Hair","Smell","Fangs","Futa on Female","Futanari","Hat","Huge Penis","Animal Girl","Band-Aid / Pasties","Catgirl","Fox Girl"]','["Doujinshi"]','[]','["Psychetangle"]','["Keta"]','["Touhou Project / 東方Project"]','["Kaenbyou Rin","Ran Yakumo"]'),
+(23,'["to-read"]','["Schoolboy Uniform","Schoolgirl Uniform"]','["Doujinshi"]','[]','["Okinawa Taieki Gunjinkai"]','["Yasunaga Kouichirou"]','["Mai-Hime"]','["Mai Tokiha"]');
 INSERT INTO "BookArtist" VALUES
 (1,1),
 (2,2),
@@ -609,31 +668,31 @@ INSERT INTO "Books" VALUES
 (22,'Natsu no Muregitsune | A Steamy Fox in Summer','夏の蒸れ狐',2,18,1,NULL,NULL,NULL,'2021-02-03',0,0.0,NULL,0),
 (23,'Mai Shield 21','舞・シールド21',2,18,1,NULL,NULL,'Full titles on nhentai.net: English ''(CR37) [Okinawa Taieki Gunjinkai (Yasunaga Kouichirou)] Mai Shield 21 (Mai-HiME) [English] [Kusanyagi]'' Foreign ''(Cレヴォ37) [沖縄体液軍人会 (安永航一郎)] 舞・シールド21 (舞-HiME) [英訳]''','2021-02-03',0,0.0,NULL,0);
 INSERT INTO "Category" VALUES
-(1,'Doujinshi'),
-(2,'Manga');
+(1,'Doujinshi',13),
+(2,'Manga',10);
 INSERT INTO "Censorship" VALUES
 (1,'Unknown'),
 (2,'Censored'),
 (3,'Decensored'),
 (4,'Uncensored');
 INSERT INTO "Character" VALUES
-(1,'Darjeeling'),
-(2,'Handler'),
-(3,'Mario'),
-(4,'Princess Peach'),
-(5,'Super Crown Bowser | Bowsette'),
-(6,'Martina'),
-(7,'Momiji'),
-(8,'Nyotengu'),
-(9,'Akira Kurusu'),
-(10,'Futaba Sakura'),
-(11,'South Dakota'),
-(12,'Kaenbyou Rin'),
-(13,'Ran Yakumo'),
-(14,'Mai Tokiha');
+(1,'Darjeeling',1),
+(2,'Handler',1),
+(3,'Mario',1),
+(4,'Princess Peach',1),
+(5,'Super Crown Bowser | Bowsette',1),
+(6,'Martina',1),
+(7,'Momiji',1),
+(8,'Nyotengu',1),
+(9,'Akira Kurusu',1),
+(10,'Futaba Sakura',1),
+(11,'South Dakota',1),
+(12,'Kaenbyou Rin',1),
+(13,'Ran Yakumo',1),
+(14,'Mai Tokiha',1);
 INSERT INTO "Collection" VALUES
-(1,'Dolls'),
-(2,'Takabisha Elf Kyousei Konin!!');
+(1,'Dolls',2),
+(2,'Takabisha Elf Kyousei Konin!!',1);
 INSERT INTO "ExternalInfo" VALUES
 (1,1,'43559',1,'2018-10-20','gezio',2,3.85,34,353,0,'2018-10-24',0),
 (2,2,'43551',1,'2018-10-20','MrOverlord12',3,4.67,55,709,0,'2018-10-24',0),
@@ -660,20 +719,44 @@ INSERT INTO "ExternalInfo" VALUES
 (23,22,'43514',1,'2018-10-17','Scarlet Spy',2,4.38,45,425,1,'2019-01-07',0),
 (25,23,'94465',2,'2014-06-29',NULL,2,NULL,NULL,17,1,'2019-01-07',0),
 (26,6,'249896',2,'2018-10-15',NULL,2,NULL,NULL,5589,0,'2019-01-07',0);
+INSERT INTO "ExternalInfoStats" VALUES
+(1,3.85,34,353,'2018-10-20'),
+(2,4.67,55,709,'2018-10-20'),
+(3,3.84,63,713,'2018-10-20'),
+(4,4.7,141,1180,'2018-10-18'),
+(5,4.23,101,1020,'2018-10-17'),
+(6,4.52,56,6535,'2018-10-15'),
+(7,3.8,69,694,'2018-10-18'),
+(8,4.23,92,1014,'2018-10-17'),
+(9,4.69,237,2021,'2018-10-11'),
+(10,4.15,84,823,'2018-10-11'),
+(11,4.13,39,420,'2018-10-13'),
+(12,3.86,86,928,'2018-10-11'),
+(13,3.76,34,532,'2018-10-11'),
+(14,3.79,85,997,'2018-10-11'),
+(15,4.33,106,1119,'2018-10-10'),
+(16,4.49,162,1860,'2018-10-11'),
+(17,4.64,141,1857,'2018-10-10'),
+(18,4.56,107,1398,'2018-10-14'),
+(19,4.3,196,2036,'2018-10-14'),
+(20,4.51,233,2188,'2018-10-13'),
+(21,0.0,0,980,'2017-01-20'),
+(22,4.38,45,425,'2018-10-17'),
+(23,0.0,0,17,'2014-06-29');
 INSERT INTO "Groups" VALUES
-(1,'Kaiki Nisshoku'),
-(2,'IRON GRIMOIRE'),
-(3,'Fan no Hitori'),
-(4,'SeaFox'),
-(5,'Mousou Engine'),
-(6,'Senpenbankashiki'),
-(7,'Dokumushi Shokeitai'),
-(8,'Maidoll'),
-(9,'Egonokatamari'),
-(10,'MediBang!'),
-(11,'Kakuzato-ichi'),
-(12,'Psychetangle'),
-(13,'Okinawa Taieki Gunjinkai');
+(1,'Kaiki Nisshoku',1),
+(2,'IRON GRIMOIRE',1),
+(3,'Fan no Hitori',1),
+(4,'SeaFox',1),
+(5,'Mousou Engine',1),
+(6,'Senpenbankashiki',1),
+(7,'Dokumushi Shokeitai',1),
+(8,'Maidoll',1),
+(9,'Egonokatamari',1),
+(10,'MediBang!',1),
+(11,'Kakuzato-ichi',1),
+(12,'Psychetangle',1),
+(13,'Okinawa Taieki Gunjinkai',1);
 INSERT INTO "Languages" VALUES
 (1,'Unknown'),
 (2,'English'),
@@ -712,24 +795,24 @@ INSERT INTO "Languages" VALUES
 (35,'Ukrainian'),
 (36,'Vietnamese');
 INSERT INTO "List" VALUES
-(1,'to-read'),
-(2,'test'),
-(3,'good'),
-(4,'prob-good'),
-(5,'to-download');
+(1,'to-read',13),
+(2,'test',2),
+(3,'good',1),
+(4,'prob-good',1),
+(5,'to-download',2);
 INSERT INTO "MDB_Version" VALUES
-(6,0);
+(14,0);
 INSERT INTO "Parody" VALUES
-(1,'Girls und Panzer / ガールズ&パンツァー'),
-(2,'Monster Hunter World / モンスターハンター：ワールド'),
-(3,'Super Mario Bros. / スーパーマリオブラザーズ'),
-(4,'Dragon Quest / ドラゴンクエスト'),
-(5,'Dragon Quest XI (11) / ドラゴンクエストXI'),
-(6,'Dead or Alive / デッド・オア・アライブ'),
-(7,'Persona 5 / ペルソナ5'),
-(8,'Azur Lane / 碧蓝航线'),
-(9,'Touhou Project / 東方Project'),
-(10,'Mai-Hime');
+(1,'Girls und Panzer / ガールズ&パンツァー',1),
+(2,'Monster Hunter World / モンスターハンター：ワールド',1),
+(3,'Super Mario Bros. / スーパーマリオブラザーズ',1),
+(4,'Dragon Quest / ドラゴンクエスト',1),
+(5,'Dragon Quest XI (11) / ドラゴンクエストXI',1),
+(6,'Dead or Alive / デッド・オア・アライブ',1),
+(7,'Persona 5 / ペルソナ5',1),
+(8,'Azur Lane / 碧蓝航线',1),
+(9,'Touhou Project / 東方Project',1),
+(10,'Mai-Hime',1);
 INSERT INTO "Sites" VALUES
 (1,'tsumino.com'),
 (2,'nhentai.net'),
@@ -746,141 +829,882 @@ INSERT INTO "Status" VALUES
 (5,'Hiatus'),
 (6,'Cancelled');
 INSERT INTO "Tag" VALUES
-(1,'Anal'),
-(2,'Chastity Belt'),
-(3,'Femdom'),
-(4,'Footjob'),
-(5,'Gokkun'),
-(6,'Handjob'),
-(7,'Large Breasts'),
-(8,'Masturbation'),
-(9,'Nakadashi'),
-(10,'Orgasm Denial'),
-(11,'Pantyhose'),
-(12,'Straight Shota'),
-(13,'Sweating'),
-(14,'Urethra Insertion'),
-(15,'Blowjob'),
-(16,'Decensored'),
-(17,'Drugs'),
-(18,'X-ray'),
-(19,'Ahegao'),
-(20,'Big Ass'),
-(21,'Collar'),
-(22,'Deepthroat'),
-(23,'Leg Lock'),
-(24,'Megane'),
-(25,'MILF'),
-(26,'Mind Break'),
-(27,'Ponytail'),
-(28,'Rape'),
-(29,'Slave'),
-(30,'Snuff'),
-(31,'Symbol Shaped Pupils'),
-(32,'Virginity (Male)'),
-(33,'Cunnilingus'),
-(34,'Face Sitting'),
-(35,'Foot Fetish'),
-(36,'Hairy'),
-(37,'Licking'),
-(38,'Short Hair'),
-(39,'Smell'),
-(40,'Dragon Girl'),
-(41,'Fangs'),
-(42,'Futa on Female'),
-(43,'Futanari'),
-(44,'Gender Bender'),
-(45,'Hat'),
-(46,'Leotard'),
-(47,'Monster Girl'),
-(48,'Royalty'),
-(49,'Exhibitionism'),
-(50,'Happy Sex'),
-(51,'Impregnation'),
-(52,'School Uniform'),
-(53,'Fingering'),
-(54,'Possession'),
-(55,'Solo Action'),
-(56,'Comedy'),
-(57,'Dark Skin'),
-(58,'Gyaru'),
-(59,'Paizuri'),
-(60,'Shared Senses'),
-(61,'Huge Penis'),
-(62,'Incest'),
-(63,'Loli'),
-(64,'Maledom'),
-(65,'Niece'),
-(66,'Slut'),
-(67,'Stockings'),
-(68,'Big Areola'),
-(69,'Elf'),
-(70,'Huge Breasts'),
-(71,'Tattoo'),
-(72,'Threesome'),
-(73,'Body Swap'),
-(74,'Bondage'),
-(75,'Defloration'),
-(76,'Filming'),
-(77,'Double Penetration'),
-(78,'Elder Sister'),
-(79,'Tall Girl'),
-(80,'Bikini'),
-(81,'Group Sex'),
-(82,'Swimsuit'),
-(83,'Maid'),
-(84,'Mind Control'),
-(85,'Office Lady'),
-(86,'Nurse'),
-(87,'Layer Cake'),
-(88,'Selfcest'),
-(89,'BBW'),
-(90,'Kimono / Yukata'),
-(91,'Onsen'),
-(92,'Widow'),
-(93,'Braids'),
-(94,'Breast Sucking'),
-(95,'Bukkake'),
-(96,'French Kissing'),
-(97,'Full Color'),
-(98,'Gangbang'),
-(99,'Harem'),
-(100,'Spitroast'),
-(101,'Hotpants'),
-(102,'Inseki'),
-(103,'Onahole'),
-(104,'Plump'),
-(105,'Smug'),
-(106,'Sole Male'),
-(107,'Full Censorship'),
-(108,'Big Breasts'),
-(109,'Big Nipples'),
-(110,'Cheating'),
-(111,'Hairy Armpits'),
-(112,'Lactation'),
-(113,'Sex Toys'),
-(114,'Sole Female'),
-(115,'Animal Girl'),
-(116,'Band-Aid / Pasties'),
-(117,'Catgirl'),
-(118,'Fox Girl'),
-(119,'Schoolboy Uniform'),
-(120,'Schoolgirl Uniform'),
-(121,'Imouto'),
-(122,'Vanilla');
+(1,'Anal',7),
+(2,'Chastity Belt',1),
+(3,'Femdom',7),
+(4,'Footjob',2),
+(5,'Gokkun',1),
+(6,'Handjob',3),
+(7,'Large Breasts',15),
+(8,'Masturbation',2),
+(9,'Nakadashi',19),
+(10,'Orgasm Denial',1),
+(11,'Pantyhose',4),
+(12,'Straight Shota',4),
+(13,'Sweating',2),
+(14,'Urethra Insertion',1),
+(15,'Blowjob',10),
+(16,'Decensored',2),
+(17,'Drugs',2),
+(18,'X-ray',4),
+(19,'Ahegao',10),
+(20,'Big Ass',6),
+(21,'Collar',3),
+(22,'Deepthroat',2),
+(23,'Leg Lock',2),
+(24,'Megane',4),
+(25,'MILF',4),
+(26,'Mind Break',2),
+(27,'Ponytail',2),
+(28,'Rape',3),
+(29,'Slave',1),
+(30,'Snuff',1),
+(31,'Symbol Shaped Pupils',3),
+(32,'Virginity (Male)',2),
+(33,'Cunnilingus',3),
+(34,'Face Sitting',1),
+(35,'Foot Fetish',1),
+(36,'Hairy',3),
+(37,'Licking',1),
+(38,'Short Hair',3),
+(39,'Smell',2),
+(40,'Dragon Girl',1),
+(41,'Fangs',2),
+(42,'Futa on Female',3),
+(43,'Futanari',3),
+(44,'Gender Bender',3),
+(45,'Hat',3),
+(46,'Leotard',1),
+(47,'Monster Girl',1),
+(48,'Royalty',2),
+(49,'Exhibitionism',2),
+(50,'Happy Sex',5),
+(51,'Impregnation',2),
+(52,'School Uniform',2),
+(53,'Fingering',1),
+(54,'Possession',1),
+(55,'Solo Action',1),
+(56,'Comedy',2),
+(57,'Dark Skin',6),
+(58,'Gyaru',1),
+(59,'Paizuri',2),
+(60,'Shared Senses',1),
+(61,'Huge Penis',7),
+(62,'Incest',2),
+(63,'Loli',1),
+(64,'Maledom',1),
+(65,'Niece',1),
+(66,'Slut',1),
+(67,'Stockings',4),
+(68,'Big Areola',3),
+(69,'Elf',2),
+(70,'Huge Breasts',3),
+(71,'Tattoo',1),
+(72,'Threesome',3),
+(73,'Body Swap',1),
+(74,'Bondage',1),
+(75,'Defloration',3),
+(76,'Filming',1),
+(77,'Double Penetration',1),
+(78,'Elder Sister',1),
+(79,'Tall Girl',2),
+(80,'Bikini',2),
+(81,'Group Sex',3),
+(82,'Swimsuit',2),
+(83,'Maid',1),
+(84,'Mind Control',1),
+(85,'Office Lady',2),
+(86,'Nurse',1),
+(87,'Layer Cake',1),
+(88,'Selfcest',1),
+(89,'BBW',3),
+(90,'Kimono / Yukata',1),
+(91,'Onsen',1),
+(92,'Widow',1),
+(93,'Braids',1),
+(94,'Breast Sucking',1),
+(95,'Bukkake',1),
+(96,'French Kissing',1),
+(97,'Full Color',1),
+(98,'Gangbang',1),
+(99,'Harem',1),
+(100,'Spitroast',1),
+(101,'Hotpants',1),
+(102,'Inseki',1),
+(103,'Onahole',1),
+(104,'Plump',1),
+(105,'Smug',1),
+(106,'Sole Male',1),
+(107,'Full Censorship',1),
+(108,'Big Breasts',1),
+(109,'Big Nipples',1),
+(110,'Cheating',1),
+(111,'Hairy Armpits',1),
+(112,'Lactation',1),
+(113,'Sex Toys',2),
+(114,'Sole Female',1),
+(115,'Animal Girl',1),
+(116,'Band-Aid / Pasties',1),
+(117,'Catgirl',1),
+(118,'Fox Girl',1),
+(119,'Schoolboy Uniform',1),
+(120,'Schoolgirl Uniform',1),
+(121,'Imouto',1),
+(122,'Vanilla',1);
+INSERT INTO "BooksTitleFts"("BooksTitleFts") VALUES ('rebuild');
+INSERT INTO "BooksTitleTrigram"("BooksTitleTrigram") VALUES ('rebuild');
+CREATE INDEX idx_artist_book_count ON Artist (book_count);
 CREATE UNIQUE INDEX idx_artist_name ON Artist (name COLLATE NOCASE);
+CREATE INDEX idx_book_artist_artist_id_book_id ON BookArtist (artist_id, book_id);
+CREATE INDEX idx_book_category_category_id_book_id ON BookCategory (category_id, book_id);
+CREATE INDEX idx_book_character_character_id_book_id ON BookCharacter (character_id, book_id);
+CREATE INDEX idx_book_collection_collection_id_book_id ON BookCollection (collection_id, book_id);
+CREATE INDEX idx_book_groups_group_id_book_id ON BookGroups (group_id, book_id);
+CREATE INDEX idx_book_list_list_id_book_id ON BookList (list_id, book_id);
+CREATE INDEX idx_book_parody_parody_id_book_id ON BookParody (parody_id, book_id);
+CREATE INDEX idx_book_tag_tag_id_book_id ON BookTag (tag_id, book_id);
+CREATE INDEX idx_books_last_change ON Books (last_change);
+CREATE INDEX idx_books_my_rating ON Books (my_rating);
+CREATE INDEX idx_books_pages ON Books (pages);
+CREATE INDEX idx_category_book_count ON Category (book_count);
 CREATE UNIQUE INDEX idx_category_name ON Category (name COLLATE NOCASE);
+CREATE INDEX idx_character_book_count ON Character (book_count);
 CREATE UNIQUE INDEX idx_character_name ON Character (name COLLATE NOCASE);
+CREATE INDEX idx_collection_book_count ON Collection (book_count);
 CREATE UNIQUE INDEX idx_collection_name ON Collection (name COLLATE NOCASE);
+CREATE INDEX idx_ext_info_stats_favorites ON ExternalInfoStats (ext_favorites);
+CREATE INDEX idx_ext_info_stats_rating ON ExternalInfoStats (ext_rating);
+CREATE INDEX idx_ext_info_stats_ratings ON ExternalInfoStats (ext_ratings);
+CREATE INDEX idx_ext_info_stats_upload_date ON ExternalInfoStats (ext_upload_date);
+CREATE INDEX idx_external_info_book_id_outdated ON ExternalInfo (book_id, outdated);
+CREATE INDEX idx_external_info_upload_date ON ExternalInfo (upload_date);
+CREATE INDEX idx_groups_book_count ON Groups (book_count);
 CREATE UNIQUE INDEX idx_groups_name ON Groups (name COLLATE NOCASE);
 CREATE INDEX idx_id_onpage_imported_from ON ExternalInfo (id_onpage, imported_from);
+CREATE INDEX idx_list_book_count ON List (book_count);
 CREATE UNIQUE INDEX idx_list_name ON List (name COLLATE NOCASE);
+CREATE INDEX idx_parody_book_count ON Parody (book_count);
 CREATE UNIQUE INDEX idx_parody_name ON Parody (name COLLATE NOCASE);
+CREATE INDEX idx_tag_book_count ON Tag (book_count);
 CREATE UNIQUE INDEX idx_tag_name ON Tag (name COLLATE NOCASE);
 CREATE UNIQUE INDEX "idx_title_eng_foreign" ON "Books" (
 	"title_eng",
 	"title_foreign"
 );
+CREATE TRIGGER artist_book_count_delete
+            AFTER DELETE ON BookArtist
+            BEGIN
+                UPDATE Artist SET book_count = book_count - 1
+                WHERE id = OLD.artist_id;
+            END;
+CREATE TRIGGER artist_book_count_insert
+            AFTER INSERT ON BookArtist
+            BEGIN
+                UPDATE Artist SET book_count = book_count + 1
+                WHERE id = NEW.artist_id;
+            END;
+CREATE TRIGGER artist_book_count_update
+            AFTER UPDATE OF artist_id ON BookArtist
+            BEGIN
+                UPDATE Artist SET book_count = book_count - 1
+                WHERE id = OLD.artist_id;
+                UPDATE Artist SET book_count = book_count + 1
+                WHERE id = NEW.artist_id;
+            END;
+CREATE TRIGGER book_aggregates_artist_delete
+            AFTER DELETE ON BookArtist
+            BEGIN
+            UPDATE BookAggregates
+            SET artist = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookArtist bx
+                    JOIN Artist x ON x.id = bx.artist_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_artist_insert
+            AFTER INSERT ON BookArtist
+            BEGIN
+            UPDATE BookAggregates
+            SET artist = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookArtist bx
+                    JOIN Artist x ON x.id = bx.artist_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_artist_rename
+            AFTER UPDATE OF name ON Artist
+            BEGIN
+            UPDATE BookAggregates
+            SET artist = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookArtist bx
+                    JOIN Artist x ON x.id = bx.artist_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookArtist
+                             WHERE artist_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_artist_update
+            AFTER UPDATE OF book_id, artist_id ON BookArtist
+            BEGIN
+            UPDATE BookAggregates
+            SET artist = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookArtist bx
+                    JOIN Artist x ON x.id = bx.artist_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_book_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BookAggregates(id) VALUES (NEW.id);
+        END;
+CREATE TRIGGER book_aggregates_category_delete
+            AFTER DELETE ON BookCategory
+            BEGIN
+            UPDATE BookAggregates
+            SET category = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCategory bx
+                    JOIN Category x ON x.id = bx.category_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_category_insert
+            AFTER INSERT ON BookCategory
+            BEGIN
+            UPDATE BookAggregates
+            SET category = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCategory bx
+                    JOIN Category x ON x.id = bx.category_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_category_rename
+            AFTER UPDATE OF name ON Category
+            BEGIN
+            UPDATE BookAggregates
+            SET category = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCategory bx
+                    JOIN Category x ON x.id = bx.category_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookCategory
+                             WHERE category_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_category_update
+            AFTER UPDATE OF book_id, category_id ON BookCategory
+            BEGIN
+            UPDATE BookAggregates
+            SET category = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCategory bx
+                    JOIN Category x ON x.id = bx.category_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_character_delete
+            AFTER DELETE ON BookCharacter
+            BEGIN
+            UPDATE BookAggregates
+            SET character = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCharacter bx
+                    JOIN Character x ON x.id = bx.character_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_character_insert
+            AFTER INSERT ON BookCharacter
+            BEGIN
+            UPDATE BookAggregates
+            SET character = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCharacter bx
+                    JOIN Character x ON x.id = bx.character_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_character_rename
+            AFTER UPDATE OF name ON Character
+            BEGIN
+            UPDATE BookAggregates
+            SET character = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCharacter bx
+                    JOIN Character x ON x.id = bx.character_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookCharacter
+                             WHERE character_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_character_update
+            AFTER UPDATE OF book_id, character_id ON BookCharacter
+            BEGIN
+            UPDATE BookAggregates
+            SET character = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCharacter bx
+                    JOIN Character x ON x.id = bx.character_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_collection_delete
+            AFTER DELETE ON BookCollection
+            BEGIN
+            UPDATE BookAggregates
+            SET collection = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCollection bx
+                    JOIN Collection x ON x.id = bx.collection_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_collection_insert
+            AFTER INSERT ON BookCollection
+            BEGIN
+            UPDATE BookAggregates
+            SET collection = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCollection bx
+                    JOIN Collection x ON x.id = bx.collection_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_collection_rename
+            AFTER UPDATE OF name ON Collection
+            BEGIN
+            UPDATE BookAggregates
+            SET collection = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCollection bx
+                    JOIN Collection x ON x.id = bx.collection_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookCollection
+                             WHERE collection_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_collection_update
+            AFTER UPDATE OF book_id, collection_id ON BookCollection
+            BEGIN
+            UPDATE BookAggregates
+            SET collection = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookCollection bx
+                    JOIN Collection x ON x.id = bx.collection_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_groups_delete
+            AFTER DELETE ON BookGroups
+            BEGIN
+            UPDATE BookAggregates
+            SET groups = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookGroups bx
+                    JOIN Groups x ON x.id = bx.group_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_groups_insert
+            AFTER INSERT ON BookGroups
+            BEGIN
+            UPDATE BookAggregates
+            SET groups = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookGroups bx
+                    JOIN Groups x ON x.id = bx.group_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_groups_rename
+            AFTER UPDATE OF name ON Groups
+            BEGIN
+            UPDATE BookAggregates
+            SET groups = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookGroups bx
+                    JOIN Groups x ON x.id = bx.group_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookGroups
+                             WHERE group_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_groups_update
+            AFTER UPDATE OF book_id, group_id ON BookGroups
+            BEGIN
+            UPDATE BookAggregates
+            SET groups = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookGroups bx
+                    JOIN Groups x ON x.id = bx.group_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_list_delete
+            AFTER DELETE ON BookList
+            BEGIN
+            UPDATE BookAggregates
+            SET list = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookList bx
+                    JOIN List x ON x.id = bx.list_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_list_insert
+            AFTER INSERT ON BookList
+            BEGIN
+            UPDATE BookAggregates
+            SET list = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookList bx
+                    JOIN List x ON x.id = bx.list_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_list_rename
+            AFTER UPDATE OF name ON List
+            BEGIN
+            UPDATE BookAggregates
+            SET list = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookList bx
+                    JOIN List x ON x.id = bx.list_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookList
+                             WHERE list_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_list_update
+            AFTER UPDATE OF book_id, list_id ON BookList
+            BEGIN
+            UPDATE BookAggregates
+            SET list = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookList bx
+                    JOIN List x ON x.id = bx.list_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_parody_delete
+            AFTER DELETE ON BookParody
+            BEGIN
+            UPDATE BookAggregates
+            SET parody = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookParody bx
+                    JOIN Parody x ON x.id = bx.parody_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_parody_insert
+            AFTER INSERT ON BookParody
+            BEGIN
+            UPDATE BookAggregates
+            SET parody = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookParody bx
+                    JOIN Parody x ON x.id = bx.parody_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_parody_rename
+            AFTER UPDATE OF name ON Parody
+            BEGIN
+            UPDATE BookAggregates
+            SET parody = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookParody bx
+                    JOIN Parody x ON x.id = bx.parody_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookParody
+                             WHERE parody_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_parody_update
+            AFTER UPDATE OF book_id, parody_id ON BookParody
+            BEGIN
+            UPDATE BookAggregates
+            SET parody = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookParody bx
+                    JOIN Parody x ON x.id = bx.parody_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_tag_delete
+            AFTER DELETE ON BookTag
+            BEGIN
+            UPDATE BookAggregates
+            SET tag = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookTag bx
+                    JOIN Tag x ON x.id = bx.tag_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id);
+            END;
+CREATE TRIGGER book_aggregates_tag_insert
+            AFTER INSERT ON BookTag
+            BEGIN
+            UPDATE BookAggregates
+            SET tag = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookTag bx
+                    JOIN Tag x ON x.id = bx.tag_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (NEW.book_id);
+            END;
+CREATE TRIGGER book_aggregates_tag_rename
+            AFTER UPDATE OF name ON Tag
+            BEGIN
+            UPDATE BookAggregates
+            SET tag = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookTag bx
+                    JOIN Tag x ON x.id = bx.tag_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (SELECT book_id FROM BookTag
+                             WHERE tag_id = NEW.id);
+            END;
+CREATE TRIGGER book_aggregates_tag_update
+            AFTER UPDATE OF book_id, tag_id ON BookTag
+            BEGIN
+            UPDATE BookAggregates
+            SET tag = (
+                SELECT json_group_array(name) FROM (
+                    SELECT x.name
+                    FROM BookTag bx
+                    JOIN Tag x ON x.id = bx.tag_id
+                    WHERE bx.book_id = BookAggregates.id
+                    ORDER BY x.id
+                )
+            )
+                WHERE id IN (OLD.book_id, NEW.book_id);
+            END;
+CREATE TRIGGER books_title_fts_delete
+        AFTER DELETE ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+        END;
+CREATE TRIGGER books_title_fts_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END;
+CREATE TRIGGER books_title_fts_update
+        AFTER UPDATE OF title_eng, title_foreign ON Books
+        BEGIN
+            INSERT INTO BooksTitleFts(BooksTitleFts, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+            INSERT INTO BooksTitleFts(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END;
+CREATE TRIGGER books_title_trigram_delete
+        AFTER DELETE ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+        END;
+CREATE TRIGGER books_title_trigram_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END;
+CREATE TRIGGER books_title_trigram_update
+        AFTER UPDATE OF title_eng, title_foreign ON Books
+        BEGIN
+            INSERT INTO BooksTitleTrigram(BooksTitleTrigram, rowid, title_eng, title_foreign)
+            VALUES ('delete', OLD.id, OLD.title_eng, OLD.title_foreign);
+            INSERT INTO BooksTitleTrigram(rowid, title_eng, title_foreign)
+            VALUES (NEW.id, NEW.title_eng, NEW.title_foreign);
+        END;
+CREATE TRIGGER category_book_count_delete
+            AFTER DELETE ON BookCategory
+            BEGIN
+                UPDATE Category SET book_count = book_count - 1
+                WHERE id = OLD.category_id;
+            END;
+CREATE TRIGGER category_book_count_insert
+            AFTER INSERT ON BookCategory
+            BEGIN
+                UPDATE Category SET book_count = book_count + 1
+                WHERE id = NEW.category_id;
+            END;
+CREATE TRIGGER category_book_count_update
+            AFTER UPDATE OF category_id ON BookCategory
+            BEGIN
+                UPDATE Category SET book_count = book_count - 1
+                WHERE id = OLD.category_id;
+                UPDATE Category SET book_count = book_count + 1
+                WHERE id = NEW.category_id;
+            END;
+CREATE TRIGGER character_book_count_delete
+            AFTER DELETE ON BookCharacter
+            BEGIN
+                UPDATE Character SET book_count = book_count - 1
+                WHERE id = OLD.character_id;
+            END;
+CREATE TRIGGER character_book_count_insert
+            AFTER INSERT ON BookCharacter
+            BEGIN
+                UPDATE Character SET book_count = book_count + 1
+                WHERE id = NEW.character_id;
+            END;
+CREATE TRIGGER character_book_count_update
+            AFTER UPDATE OF character_id ON BookCharacter
+            BEGIN
+                UPDATE Character SET book_count = book_count - 1
+                WHERE id = OLD.character_id;
+                UPDATE Character SET book_count = book_count + 1
+                WHERE id = NEW.character_id;
+            END;
+CREATE TRIGGER collection_book_count_delete
+            AFTER DELETE ON BookCollection
+            BEGIN
+                UPDATE Collection SET book_count = book_count - 1
+                WHERE id = OLD.collection_id;
+            END;
+CREATE TRIGGER collection_book_count_insert
+            AFTER INSERT ON BookCollection
+            BEGIN
+                UPDATE Collection SET book_count = book_count + 1
+                WHERE id = NEW.collection_id;
+            END;
+CREATE TRIGGER collection_book_count_update
+            AFTER UPDATE OF collection_id ON BookCollection
+            BEGIN
+                UPDATE Collection SET book_count = book_count - 1
+                WHERE id = OLD.collection_id;
+                UPDATE Collection SET book_count = book_count + 1
+                WHERE id = NEW.collection_id;
+            END;
+CREATE TRIGGER ext_info_stats_book_insert
+        AFTER INSERT ON Books
+        BEGIN
+            INSERT INTO ExternalInfoStats(id) VALUES (NEW.id);
+        END;
+CREATE TRIGGER ext_info_stats_delete
+        AFTER DELETE ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (OLD.book_id);
+        END;
+CREATE TRIGGER ext_info_stats_insert
+        AFTER INSERT ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (NEW.book_id);
+        END;
+CREATE TRIGGER ext_info_stats_update
+        AFTER UPDATE OF book_id, rating, ratings, favorites, upload_date ON ExternalInfo
+        BEGIN
+            UPDATE ExternalInfoStats
+            SET (ext_rating, ext_ratings, ext_favorites, ext_upload_date) = (
+                SELECT IFNULL(AVG(NULLIF(rating, 0)), 0), IFNULL(SUM(ratings), 0),
+                       IFNULL(SUM(favorites), 0), IFNULL(MIN(upload_date), '')
+                FROM ExternalInfo
+                WHERE ExternalInfo.book_id = ExternalInfoStats.id
+            )
+            WHERE id IN (OLD.book_id, NEW.book_id);
+        END;
+CREATE TRIGGER groups_book_count_delete
+            AFTER DELETE ON BookGroups
+            BEGIN
+                UPDATE Groups SET book_count = book_count - 1
+                WHERE id = OLD.group_id;
+            END;
+CREATE TRIGGER groups_book_count_insert
+            AFTER INSERT ON BookGroups
+            BEGIN
+                UPDATE Groups SET book_count = book_count + 1
+                WHERE id = NEW.group_id;
+            END;
+CREATE TRIGGER groups_book_count_update
+            AFTER UPDATE OF group_id ON BookGroups
+            BEGIN
+                UPDATE Groups SET book_count = book_count - 1
+                WHERE id = OLD.group_id;
+                UPDATE Groups SET book_count = book_count + 1
+                WHERE id = NEW.group_id;
+            END;
+CREATE TRIGGER list_book_count_delete
+            AFTER DELETE ON BookList
+            BEGIN
+                UPDATE List SET book_count = book_count - 1
+                WHERE id = OLD.list_id;
+            END;
+CREATE TRIGGER list_book_count_insert
+            AFTER INSERT ON BookList
+            BEGIN
+                UPDATE List SET book_count = book_count + 1
+                WHERE id = NEW.list_id;
+            END;
+CREATE TRIGGER list_book_count_update
+            AFTER UPDATE OF list_id ON BookList
+            BEGIN
+                UPDATE List SET book_count = book_count - 1
+                WHERE id = OLD.list_id;
+                UPDATE List SET book_count = book_count + 1
+                WHERE id = NEW.list_id;
+            END;
+CREATE TRIGGER parody_book_count_delete
+            AFTER DELETE ON BookParody
+            BEGIN
+                UPDATE Parody SET book_count = book_count - 1
+                WHERE id = OLD.parody_id;
+            END;
+CREATE TRIGGER parody_book_count_insert
+            AFTER INSERT ON BookParody
+            BEGIN
+                UPDATE Parody SET book_count = book_count + 1
+                WHERE id = NEW.parody_id;
+            END;
+CREATE TRIGGER parody_book_count_update
+            AFTER UPDATE OF parody_id ON BookParody
+            BEGIN
+                UPDATE Parody SET book_count = book_count - 1
+                WHERE id = OLD.parody_id;
+                UPDATE Parody SET book_count = book_count + 1
+                WHERE id = NEW.parody_id;
+            END;
 CREATE TRIGGER set_books_last_change
     AFTER UPDATE ON Books
     BEGIN
@@ -888,5 +1712,25 @@ CREATE TRIGGER set_books_last_change
         SET last_change = DATE('now', 'localtime')
         WHERE id = NEW.id;
     END;
+CREATE TRIGGER tag_book_count_delete
+            AFTER DELETE ON BookTag
+            BEGIN
+                UPDATE Tag SET book_count = book_count - 1
+                WHERE id = OLD.tag_id;
+            END;
+CREATE TRIGGER tag_book_count_insert
+            AFTER INSERT ON BookTag
+            BEGIN
+                UPDATE Tag SET book_count = book_count + 1
+                WHERE id = NEW.tag_id;
+            END;
+CREATE TRIGGER tag_book_count_update
+            AFTER UPDATE OF tag_id ON BookTag
+            BEGIN
+                UPDATE Tag SET book_count = book_count - 1
+                WHERE id = OLD.tag_id;
+                UPDATE Tag SET book_count = book_count + 1
+                WHERE id = NEW.tag_id;
+            END;
 COMMIT;
 PRAGMA foreign_keys=on;
\ No newline at end of file